@@ -0,0 +1,193 @@
+"""
+Measures cold starts of the API and the WebScraper, in fresh processes:
+- Import time, with 'python -X importtime': the total, and the modules that take the longest.
+- Time to the first request: from starting the process until the first request has been answered. For the API, the
+  server is started with STARTUP_PROFILE=1 and a single request is sent to /buffered, so it should be pointed at the
+  fake OpenAI and scraper servers (see loadgen.py). For the WebScraper, the handler is imported and invoked once, on a
+  page from the HTML fixtures served locally, i.e. on the static path.
+
+Run it on two commits and compare with --baseline:
+    python benchmarks/bench_coldstart.py --output benchmarks/results/coldstart-$(git rev-parse --short HEAD).json
+"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import threading
+import statistics
+import subprocess
+import urllib.error
+import urllib.request
+
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+API_ROOT = os.path.join(ROOT, 'src')
+SCRAPER_ROOT = os.path.join(ROOT, 'webscraper_lambda')
+SCRAPER_SRC = os.path.join(SCRAPER_ROOT, 'src')
+FIXTURES = os.path.join(SCRAPER_ROOT, 'benchmarks', 'fixtures')
+
+IMPORT_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+# Times the import of the handler and its first invocation, in a fresh process, and prints them as JSON.
+SCRAPER_SCRIPT = """
+import sys, json, time
+flag1 = time.perf_counter()
+import webscraper_handler
+flag2 = time.perf_counter()
+response = webscraper_handler.handler({'body': {'url': sys.argv[1]}}, None)
+flag3 = time.perf_counter()
+body = json.loads(response['body'])
+print(json.dumps({'import': flag2 - flag1, 'invoke': flag3 - flag2, 'first_request': flag3 - flag1,
+                  'extraction_path': body['extraction_path'], 'selenium_loaded': 'selenium' in sys.modules}))
+"""
+
+
+def import_profile(cwd: str, path: str, module: str, top: int) -> dict:
+    """ Imports 'module' from 'path' in a fresh process with -X importtime, and sums up the report."""
+    env = dict(os.environ, PYTHONPATH=path)
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], cwd=cwd, env=env,
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+
+    total, modules = 0, []
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match is None:
+            continue
+        own, cumulative, indent, name = int(match.group(1)), int(match.group(2)), len(match.group(3)), match.group(4)
+        if indent == 1:                     # Imported by the module itself, rather than by one of its imports.
+            total += cumulative
+        modules.append((name, own, cumulative))
+    slowest = sorted(modules, key=lambda module_times: module_times[2], reverse=True)[:top]
+    return {"seconds": round(total / 1e6, 4), "modules": len(modules),
+            "slowest": {name: {"self": round(own / 1e6, 4), "cumulative": round(cumulative / 1e6, 4)}
+                        for name, own, cumulative in slowest}}
+
+
+def api_first_request(args) -> float:
+    """ Starts the API, and times how long it takes until its first request has been answered."""
+    env = dict(os.environ, PORT=str(args.port), STARTUP_PROFILE='1')
+    body = json.dumps({"url": args.url, "lang": "en"}).encode('utf-8')
+    flag1 = time.perf_counter()
+    server = subprocess.Popen([sys.executable, 'main.py'], cwd=API_ROOT, env=env, stdout=subprocess.DEVNULL,
+                              stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            if server.poll() is not None:
+                raise RuntimeError("The API exited before answering. Is OPENAI_API_KEY set?")
+            if time.perf_counter() - flag1 > args.timeout:
+                raise TimeoutError("The API didn't answer in time.")
+            request = urllib.request.Request(f"http://127.0.0.1:{args.port}/buffered", data=body,
+                                             headers={"Content-Type": "application/json"})
+            try:
+                with urllib.request.urlopen(request, timeout=args.timeout) as response:
+                    response.read()
+                return time.perf_counter() - flag1
+            except urllib.error.HTTPError as e:
+                raise RuntimeError(f"The first request failed with status {e.code}.")
+            except (ConnectionError, urllib.error.URLError):
+                time.sleep(0.01)            # Not listening yet.
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def scraper_first_request(url: str) -> dict:
+    env = dict(os.environ, PYTHONPATH=SCRAPER_SRC, STARTUP_PROFILE='1')
+    result = subprocess.run([sys.executable, '-c', SCRAPER_SCRIPT, url], cwd=SCRAPER_ROOT, env=env,
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"The WebScraper failed:\n{result.stderr[-2000:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def serve_fixtures() -> str:
+    """ Serves the HTML fixtures on a local port, for the WebScraper to scrape. Returns the URL of one of them."""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), partial(QuietHandler, directory=FIXTURES))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}/{sorted(os.listdir(FIXTURES))[0]}"
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args) -> None:
+        pass
+
+
+def median(values: list) -> float:
+    return round(statistics.median(values), 4)
+
+
+def current_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--target', nargs='+', choices=['api', 'scraper'], default=['api', 'scraper'])
+    parser.add_argument('--repeat', type=int, default=5, help="Cold starts per measurement, the median is reported.")
+    parser.add_argument('--top', type=int, default=15, help="Slowest imports to list.")
+    parser.add_argument('--port', type=int, default=8090, help="Port to start the API on.")
+    parser.add_argument('--url', default="https://www.unboxboardom.com", help="URL of the first API request.")
+    parser.add_argument('--skip-request', action='store_true', help="Only measure imports.")
+    parser.add_argument('--timeout', type=float, default=300)
+    parser.add_argument('--output', default=None, help="JSON file to write the results to.")
+    parser.add_argument('--baseline', default=None, help="Results of an earlier run, to compare against.")
+    args = parser.parse_args()
+
+    results = {}
+    if 'api' in args.target:
+        profiles = [import_profile(API_ROOT, API_ROOT, 'main', args.top) for _ in range(args.repeat)]
+        results['api'] = {"import_seconds": median([profile["seconds"] for profile in profiles]),
+                          "slowest_imports": profiles[-1]["slowest"]}
+        if not args.skip_request:
+            results['api']["first_request_seconds"] = median([api_first_request(args) for _ in range(args.repeat)])
+
+    if 'scraper' in args.target:
+        profiles = [import_profile(SCRAPER_ROOT, SCRAPER_SRC, 'webscraper_handler', args.top)
+                    for _ in range(args.repeat)]
+        results['scraper'] = {"import_seconds": median([profile["seconds"] for profile in profiles]),
+                              "slowest_imports": profiles[-1]["slowest"]}
+        if not args.skip_request:
+            url = serve_fixtures()
+            runs = [scraper_first_request(url) for _ in range(args.repeat)]
+            results['scraper'].update(first_request_seconds=median([run['first_request'] for run in runs]),
+                                      extraction_path=runs[-1]['extraction_path'],
+                                      selenium_loaded=runs[-1]['selenium_loaded'])
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as file:
+            baseline = json.load(file)["results"]
+
+    for target, result in results.items():
+        print(f"\n{target}:")
+        for key in ('import_seconds', 'first_request_seconds'):
+            if key not in result:
+                continue
+            line = f"  {key:<24}{result[key]:>9.3f}"
+            before = baseline.get(target, {}).get(key)
+            if before:
+                line += f"   (was {before:.3f}, {(result[key] - before) / before * 100:+.1f}%)"
+            print(line)
+        for name, times in list(result["slowest_imports"].items())[:args.top]:
+            print(f"    {name:<40}{times['cumulative']:>9.4f}{times['self']:>9.4f}")
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump({"commit": current_commit(), "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                       "results": results}, file, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""
+Measures what logging costs the requests being served, by simulating concurrent requests on one event loop. Every
+request awaits a few times, like the pipeline stages do, and logs a handful of lines along the way, one of them a large
+payload (a scraped page). It's run once with the old setup, a StreamHandler writing on the event loop, and once with
+the queue based pipeline in utils.logger, and reports the request latency and how late the event loop wakes up.
+
+Writes go to a file, or to a stream that blocks for --write-latency milliseconds per write, which is what stdout
+does when whatever reads it (docker, CloudWatch) falls behind:
+    python benchmarks/bench_logging.py --concurrency 64 --requests 2000 --write-latency 0.2
+"""
+import os
+import sys
+import time
+import asyncio
+import logging
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from utils import logger as log_pipeline  # noqa: E402
+
+
+def summarize(values: list) -> dict:
+    ordered = sorted(values)
+    pick = lambda share: ordered[min(int(share * len(ordered)), len(ordered) - 1)]  # noqa: E731
+    return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99), "max": ordered[-1]}
+
+
+class SlowStream:
+    """ A file that takes 'latency' seconds per write, like a pipe whose reader is falling behind."""
+
+    def __init__(self, file, latency: float):
+        self.file = file
+        self.latency = latency
+
+    def write(self, text: str) -> int:
+        if self.latency:
+            time.sleep(self.latency)
+        return self.file.write(text)
+
+    def flush(self) -> None:
+        self.file.flush()
+
+
+def sync_logger(stream) -> logging.Logger:
+    """ The setup utils.logger used to have: a StreamHandler writing on the calling thread."""
+    logger = logging.getLogger('bench.sync')
+    logger.handlers.clear()
+    logger.propagate = False
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logging.Formatter(log_pipeline.LOG_FORMAT))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    return logger
+
+
+def queue_logger(stream, max_chars: int) -> tuple[logging.Logger, logging.Handler]:
+    handler = log_pipeline.configure(stream, max_chars=max_chars)
+    logger = logging.getLogger('bench.queue')
+    logger.setLevel(logging.INFO)
+    return logger, handler
+
+
+async def handle_request(logger: logging.Logger, index: int, payload: str, stage_seconds: float) -> float:
+    flag1 = time.perf_counter()
+    logger.info(f"Request {index} received.")
+    for stage in ('scrape', 'summary', 'campaign', 'message'):
+        await asyncio.sleep(stage_seconds)
+        if stage == 'scrape':
+            logger.info(f"Response from WebScraper Lambda function: {payload}")
+        logger.info(f"Stage {stage} of request {index} done.")
+    logger.info(f"Entire process was executed in {time.perf_counter() - flag1:.2f} seconds.")
+    return time.perf_counter() - flag1
+
+
+async def measure_lag(lags: list, interval: float = 0.005) -> None:
+    """ How much later than asked for the event loop gets around to this task."""
+    while True:
+        flag1 = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - flag1 - interval)
+
+
+async def run(logger: logging.Logger, args) -> dict:
+    payload = "Lorem ipsum dolor sit amet. " * (args.payload_chars // 28)
+    latencies, lags, counter = [], [], iter(range(args.requests))
+
+    async def worker():
+        for index in counter:
+            latencies.append(await handle_request(logger, index, payload, args.stage_seconds))
+
+    monitor = asyncio.create_task(measure_lag(lags))
+    flag1 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    seconds = time.perf_counter() - flag1
+    monitor.cancel()
+    return {"rps": round(len(latencies) / seconds, 1), "latency": summarize(latencies), "loop_lag": summarize(lags)}
+
+
+def print_result(name: str, result: dict) -> None:
+    latency, lag = result["latency"], result["loop_lag"]
+    print(f"{name:>8}{result['rps']:>9.1f}{latency['p50']:>9.4f}{latency['p95']:>9.4f}{latency['p99']:>9.4f}"
+          f"{lag['p99']:>10.4f}{lag['max']:>10.4f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--stage-seconds', type=float, default=0.005, help="Time awaited per pipeline stage.")
+    parser.add_argument('--payload-chars', type=int, default=20000, help="Size of the logged scrape response.")
+    parser.add_argument('--write-latency', type=float, default=0.0, help="Milliseconds per write to the log.")
+    parser.add_argument('--max-chars', type=int, default=log_pipeline.LOG_MAX_CHARS)
+    args = parser.parse_args()
+
+    print(f"{'setup':>8}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'lag p99':>10}{'lag max':>10}")
+    with tempfile.TemporaryFile('w') as file:
+        stream = SlowStream(file, args.write_latency / 1000)
+        print_result('sync', asyncio.run(run(sync_logger(stream), args)))
+
+        logger, handler = queue_logger(stream, args.max_chars)
+        print_result('queue', asyncio.run(run(logger, args)))
+        flag1 = time.perf_counter()
+        log_pipeline.shutdown()
+        print(f"\nThe queue took another {time.perf_counter() - flag1:.2f} seconds to write out. "
+              f"Records truncated: {handler.truncated}, dropped: {handler.dropped}.")
+
+if __name__ == '__main__':
+    main()
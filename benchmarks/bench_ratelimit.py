@@ -0,0 +1,103 @@
+"""
+Throughput and latency of OpenAI calls at saturation, against the fake OpenAI server with rate limits enforced.
+Workers send completions back to back for a while, some interactive and some batch, either:
+- 'client': straight through the OpenAI client, relying on its own retries (max_retries=2), as before the rate limiter.
+- 'scheduler': through utils.ratelimit, configured with the same limits as the server, and no client retries.
+
+Reports completions per minute, failed calls, the 429s the server sent, and latency per priority:
+    python benchmarks/fake_openai.py --rpm 120 --tpm 60000 --ttft 0.2 --tokens-per-second 200 &
+    python benchmarks/bench_ratelimit.py --rpm 120 --tpm 60000 --concurrency 32 --duration 60
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+import httpx
+from openai import AsyncOpenAI, RateLimitError, APIConnectionError, InternalServerError
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from utils import ratelimit  # noqa: E402
+
+from loadgen import summarize  # noqa: E402
+
+
+async def server_stats(base_url: str) -> dict:
+    async with httpx.AsyncClient() as client:
+        return (await client.get(base_url.rsplit('/v1', 1)[0] + '/stats')).json()
+
+
+async def run_mode(mode: str, args) -> dict:
+    client = AsyncOpenAI(base_url=args.base_url, api_key='fake', max_retries=2 if mode == 'client' else 0)
+    scheduler = ratelimit.RateLimiter({args.model: {"rpm": args.rpm, "tpm": args.tpm}})
+    prompt = "word " * (args.prompt_chars // 5)
+    estimated = args.prompt_chars // 4 + args.max_tokens            # How the fake server counts tokens.
+    latencies, failures = {'streaming': [], 'batch': []}, 0
+    before = await server_stats(args.base_url)
+
+    def complete():
+        return client.chat.completions.create(model=args.model, max_tokens=args.max_tokens,
+                                              messages=[{"role": "user", "content": prompt}])
+
+    async def worker(index: int):
+        nonlocal failures
+        priority = 'streaming' if index < args.concurrency * args.interactive_share else 'batch'
+        ratelimit.priority.set(priority)
+        while time.perf_counter() < deadline:
+            flag1 = time.perf_counter()
+            try:
+                if mode == 'client':
+                    await complete()
+                else:
+                    await scheduler.call(args.model, estimated, complete,
+                                         retry_on=(RateLimitError, APIConnectionError, InternalServerError))
+            except Exception:
+                failures += 1
+                continue
+            latencies[priority].append(time.perf_counter() - flag1)
+
+    deadline = time.perf_counter() + args.duration
+    flag1 = time.perf_counter()
+    await asyncio.gather(*(worker(index) for index in range(args.concurrency)))
+    seconds = time.perf_counter() - flag1
+    after = await server_stats(args.base_url)
+    await client.close()
+
+    completed = sum(len(values) for values in latencies.values())
+    return {"mode": mode, "completed": completed, "per_minute": round(completed / seconds * 60, 1),
+            "failed": failures, "server_429s": after["rate_limited"] - before["rate_limited"],
+            "latency": {priority: summarize(values) for priority, values in latencies.items()}}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-url', default="http://localhost:8901/v1")
+    parser.add_argument('--mode', nargs='+', choices=['client', 'scheduler'], default=['client', 'scheduler'])
+    parser.add_argument('--model', default="gpt-4o")
+    parser.add_argument('--rpm', type=int, required=True, help="Requests per minute, as enforced by the server.")
+    parser.add_argument('--tpm', type=int, required=True, help="Tokens per minute, as enforced by the server.")
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--interactive-share', type=float, default=0.25, help="Share of workers that are interactive.")
+    parser.add_argument('--duration', type=float, default=60, help="Seconds per mode.")
+    parser.add_argument('--prompt-chars', type=int, default=2000)
+    parser.add_argument('--max-tokens', type=int, default=300)
+    parser.add_argument('--cooldown', type=float, default=61, help="Seconds between modes, for the limits to reset.")
+    args = parser.parse_args()
+
+    print(f"{'mode':>10}{'done':>7}{'per min':>9}{'failed':>8}{'429s':>7}{'int p50':>9}{'int p95':>9}"
+          f"{'batch p50':>10}{'batch p95':>10}")
+    for number, mode in enumerate(args.mode):
+        if number:
+            await asyncio.sleep(args.cooldown)
+        result = await run_mode(mode, args)
+        interactive, batch = result["latency"]["streaming"], result["latency"]["batch"]
+        print(f"{mode:>10}{result['completed']:>7}{result['per_minute']:>9.1f}{result['failed']:>8}"
+              f"{result['server_429s']:>7}{interactive.get('p50', float('nan')):>9.2f}"
+              f"{interactive.get('p95', float('nan')):>9.2f}{batch.get('p50', float('nan')):>10.2f}"
+              f"{batch.get('p95', float('nan')):>10.2f}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
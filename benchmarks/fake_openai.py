@@ -0,0 +1,201 @@
+"""
+Local stand-in for the OpenAI chat completions API, for load testing without paying for tokens. Serves
+POST /v1/chat/completions, buffered and streamed, with usage, and answers in the shape our prompts ask for: a markdown
+brief for streamed campaigns, and JSON objects for buffered campaigns, platform guidelines and mails.
+
+Latency is modelled as a time to first token, followed by a steady rate of tokens per second. A share of the requests
+can be failed with a 500 (or a 429), to see how retries and errors affect the tail. Rate limits per model can be
+enforced like OpenAI does (--rpm, --tpm): requests over the limit of the last minute get a 429 with retry-after-ms.
+A share of the requests (--slow-rate) can be made --slow-factor times slower, for a long tail like OpenAI's.
+
+Point the API at it with OPENAI_BASE_URL, e.g.:
+    python benchmarks/fake_openai.py --port 8901 --ttft 0.4 --tokens-per-second 80
+    OPENAI_BASE_URL=http://localhost:8901/v1 OPENAI_API_KEY=fake python src/main.py
+"""
+import json
+import time
+import random
+import collections
+import asyncio
+import argparse
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+WORDS = ("influencer", "campaign", "audience", "discount", "content", "creator", "brand", "product", "offer", "code",
+         "share", "story", "video", "followers", "summer", "launch", "quality", "community", "exclusive", "review")
+
+app = FastAPI(title="fake-openai")
+config = argparse.Namespace(ttft=0.3, tokens_per_second=60.0, completion_tokens=300, chunk_tokens=3,
+                            error_rate=0.0, rate_limit_rate=0.0, rpm=0, tpm=0, slow_rate=0.0, slow_factor=10.0,
+                            seed=None)
+rng = random.Random()
+stats = {"requests": 0, "streams": 0, "errors": 0, "rate_limited": 0, "slow": 0, "completion_tokens": 0}
+usage_window = collections.defaultdict(collections.deque)     # Model -> (time, tokens) of its last minute's requests.
+
+
+def words(count: int) -> str:
+    return ' '.join(rng.choice(WORDS) for _ in range(count))
+
+
+def campaign_markdown(tokens: int) -> str:
+    """ A brief in the layout of campaign_instructions.txt, about 'tokens' tokens long (one word per token)."""
+    third = max(tokens // 3, 1)
+    return (f"**Campaign Title**\n{words(6)}\n\n**About the Company**\n{words(third)}\n\n"
+            f"**Campaign Description**\n{words(third)}\n\n**What You Get**\n- {words(third // 2)}\n\n"
+            f"**Talking Points**\n- {words(third // 2)}")
+
+
+def json_content(system: str, tokens: int) -> str:
+    if 'mediaDescription' in system:
+        share = max(tokens // 5, 1)
+        return json.dumps({"mediaDescription": [{"media": media, "body": f"- {words(share)}"}
+                                                for media in ("Instagram", "Youtube", "Tiktok", "Blog", "Snapchat")]})
+    if "'subject'" in system:
+        return json.dumps({"subject": words(8), "body": words(tokens)})
+    return json.dumps({"title": words(6), "aboutCompany": words(tokens // 3), "description": words(tokens // 2)})
+
+
+def usage(prompt_tokens: int, completion_tokens: int) -> dict:
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens}
+
+
+def over_limit(model: str, tokens: int):
+    """ Counts the request against the model's limits, like OpenAI: every request, and its prompt plus max_tokens.
+    Returns a 429 when the last minute is already full."""
+    if not config.rpm and not config.tpm:
+        return None
+    now, window = time.monotonic(), usage_window[model]
+    while window and window[0][0] <= now - 60:
+        window.popleft()
+    used = sum(spent for _, spent in window)
+    if (config.rpm and len(window) + 1 > config.rpm) or (config.tpm and used + tokens > config.tpm):
+        # Wait until enough of the window has expired for this request to fit.
+        remaining, wait = used, 60.0
+        for expired, (at, spent) in enumerate(window, start=1):
+            remaining -= spent
+            if (not config.rpm or len(window) - expired < config.rpm) and \
+                    (not config.tpm or remaining + tokens <= config.tpm):
+                wait = at + 60 - now
+                break
+        stats["rate_limited"] += 1
+        return JSONResponse({"error": {"message": f"Rate limit reached for {model} (fake).", "type": "tokens",
+                                       "code": "rate_limit_exceeded"}}, status_code=429,
+                            headers={"retry-after-ms": str(max(int(wait * 1000), 1)),
+                                     "x-ratelimit-remaining-requests": str(max(config.rpm - len(window), 0)),
+                                     "x-ratelimit-remaining-tokens": str(max(config.tpm - used, 0))})
+    window.append((now, tokens))
+    return None
+
+
+def maybe_fail():
+    draw = rng.random()
+    if draw < config.rate_limit_rate:
+        stats["rate_limited"] += 1
+        return JSONResponse({"error": {"message": "Rate limit reached (fake).", "type": "requests",
+                                       "code": "rate_limit_exceeded"}}, status_code=429, headers={"retry-after": "1"})
+    if draw < config.rate_limit_rate + config.error_rate:
+        stats["errors"] += 1
+        return JSONResponse({"error": {"message": "The server had an error (fake).", "type": "server_error"}},
+                            status_code=500)
+    return None
+
+
+def slowdown() -> float:
+    """ How many times slower than usual this request is answered."""
+    if rng.random() < config.slow_rate:
+        stats["slow"] += 1
+        return config.slow_factor
+    return 1.0
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    stats["requests"] += 1
+    failure = maybe_fail()
+    if failure is not None:
+        return failure
+
+    messages = body.get("messages", [])
+    system = next((message["content"] for message in messages if message["role"] == "system"), "")
+    prompt_tokens = sum(len(message.get("content") or "") for message in messages) // 4
+    limit = body.get("max_tokens") or config.completion_tokens
+    tokens = min(config.completion_tokens, limit)
+    model = body.get("model", "gpt-4o")
+    limited = over_limit(model, prompt_tokens + limit)
+    if limited is not None:
+        return limited
+    completion_id = f"chatcmpl-fake{rng.getrandbits(48):x}"
+    factor = slowdown()
+
+    if not body.get("stream"):
+        await asyncio.sleep((config.ttft + tokens / config.tokens_per_second) * factor)
+        json_mode = (body.get("response_format") or {}).get("type") == "json_object"
+        content = json_content(system, tokens) if json_mode else words(tokens)
+        stats["completion_tokens"] += tokens
+        return JSONResponse({
+            "id": completion_id, "object": "chat.completion", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop",
+                         "logprobs": None}],
+            "usage": usage(prompt_tokens, tokens),
+        })
+
+    stats["streams"] += 1
+    include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+    pieces = campaign_markdown(tokens).split(' ')
+
+    async def stream():
+        def chunk(choices: list, usage_data: dict = None) -> str:
+            return "data: " + json.dumps({"id": completion_id, "object": "chat.completion.chunk",
+                                          "created": int(time.time()), "model": model, "choices": choices,
+                                          "usage": usage_data}) + "\n\n"
+
+        await asyncio.sleep(config.ttft * factor)
+        yield chunk([{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}])
+        sent = 0
+        for start in range(0, len(pieces), config.chunk_tokens):
+            part = pieces[start:start + config.chunk_tokens]
+            text = (' ' if start else '') + ' '.join(part)
+            await asyncio.sleep(len(part) / config.tokens_per_second * factor)
+            sent += len(part)
+            yield chunk([{"index": 0, "delta": {"content": text}, "finish_reason": None}])
+        yield chunk([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+        stats["completion_tokens"] += sent
+        if include_usage:
+            yield chunk([], usage(prompt_tokens, sent))
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+
+@app.get("/stats")
+async def get_stats() -> dict:
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8901)
+    parser.add_argument('--ttft', type=float, default=0.3, help="Seconds until the first token.")
+    parser.add_argument('--tokens-per-second', type=float, default=60.0)
+    parser.add_argument('--completion-tokens', type=int, default=300, help="Tokens per completion.")
+    parser.add_argument('--chunk-tokens', type=int, default=3, help="Tokens per streamed chunk.")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Share of requests failed with a 500.")
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help="Share of requests failed with a 429.")
+    parser.add_argument('--rpm', type=int, default=0, help="Requests per minute per model, 0 for no limit.")
+    parser.add_argument('--tpm', type=int, default=0, help="Tokens per minute per model, 0 for no limit.")
+    parser.add_argument('--slow-rate', type=float, default=0.0, help="Share of requests answered more slowly.")
+    parser.add_argument('--slow-factor', type=float, default=10.0, help="How many times slower those requests are.")
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    vars(config).update({key: value for key, value in vars(args).items() if key != 'port'})
+    rng.seed(args.seed)
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == '__main__':
+    main()
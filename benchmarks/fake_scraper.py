@@ -0,0 +1,101 @@
+"""
+Local stand-in for the WebScraper Lambda function, for load testing without Lambda or Chrome. Serves POST /invoke,
+which takes the same payload as the Lambda function and answers with the same response. The text is extracted from
+the stored HTML fixtures in webscraper_lambda/benchmarks/fixtures with the real ContentExtractor, picking a fixture by
+URL, after a configurable delay standing in for the page load.
+
+Point the API at it with the http scraper transport, e.g.:
+    python benchmarks/fake_scraper.py --port 8902 --latency 1.5 --jitter 0.5
+    SCRAPER_TRANSPORT=http SCRAPER_URL=http://localhost:8902/invoke python src/main.py
+"""
+import os
+import sys
+import json
+import time
+import zlib
+import random
+import asyncio
+import argparse
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRAPER_ROOT = os.path.join(ROOT, 'webscraper_lambda')
+sys.path.insert(0, os.path.join(SCRAPER_ROOT, 'src'))
+
+from ContentExtractor import extract_content  # noqa: E402
+from ContentFilter import ContentFilter  # noqa: E402
+
+FIXTURES = os.path.join(SCRAPER_ROOT, 'benchmarks', 'fixtures')
+
+app = FastAPI(title="fake-scraper")
+config = argparse.Namespace(latency=1.0, jitter=0.3, error_rate=0.0)
+rng = random.Random()
+stats = {"requests": 0, "errors": 0}
+
+
+def load_pages() -> list:
+    """ Title and text of every fixture, extracted once at startup, like a static scrape would."""
+    content_filter = ContentFilter.from_file(os.path.join(SCRAPER_ROOT, 'utils', 'keywords.txt'))
+    pages = []
+    for name in sorted(os.listdir(FIXTURES)):
+        with open(os.path.join(FIXTURES, name), 'r', encoding='utf-8') as file:
+            extractor = extract_content(file.read(), content_filter)
+        pages.append((extractor.title + extractor.page_text(), extractor.removed_chars))
+    return pages
+
+
+PAGES = load_pages()
+
+
+@app.post("/invoke")
+async def invoke(request: Request):
+    payload = await request.json()
+    stats["requests"] += 1
+    flag1 = time.perf_counter()
+    await asyncio.sleep(max(config.latency + rng.uniform(-config.jitter, config.jitter), 0))
+
+    if rng.random() < config.error_rate:
+        stats["errors"] += 1
+        return JSONResponse({"errorMessage": "Scrape failed (fake)."}, status_code=500)
+
+    site_text, removed_chars = PAGES[zlib.crc32(payload['url'].encode('utf-8')) % len(PAGES)]
+    return {
+        'statusCode': 200,
+        'body': json.dumps({
+            'site_text': site_text,
+            'proxy_enabled': False,
+            'extraction_path': 'static',
+            'filtered_chars': sum(removed_chars.values()),
+            'filtered_chars_by_reason': removed_chars,
+            'scrape_seconds': round(time.perf_counter() - flag1, 3),
+            'driver_warm': False,
+            'driver_rss_mb': 0.0,
+            'spans': [],
+        }, ensure_ascii=False)
+    }
+
+
+@app.get("/stats")
+async def get_stats() -> dict:
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8902)
+    parser.add_argument('--latency', type=float, default=1.0, help="Mean seconds per scrape.")
+    parser.add_argument('--jitter', type=float, default=0.3, help="Scrapes take latency +/- up to this many seconds.")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Share of scrapes that fail.")
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    vars(config).update(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate)
+    rng.seed(args.seed)
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+"""
+Load generator for the API. Sends requests to /buffered and/or /streaming at fixed concurrency levels (a closed loop:
+each of the N workers sends its next request as soon as the previous one finished), and reports latency percentiles,
+requests per second and, for streaming, the time to first byte and to the first byte of the campaign itself.
+
+Results are written to a JSON file, tagged with the current commit, so runs can be compared across commits with
+--baseline. Meant to run against the fake OpenAI and scraper servers, so it costs nothing:
+
+    python benchmarks/fake_openai.py &
+    python benchmarks/fake_scraper.py &
+    OPENAI_BASE_URL=http://localhost:8901/v1 OPENAI_API_KEY=fake \\
+        SCRAPER_TRANSPORT=http SCRAPER_URL=http://localhost:8902/invoke python src/main.py &
+    python benchmarks/loadgen.py --endpoint buffered streaming --concurrency 1 8 32 --requests 100 \\
+        --output benchmarks/results/$(git rev-parse --short HEAD).json
+"""
+import os
+import json
+import time
+import asyncio
+import argparse
+import subprocess
+
+import httpx
+
+DEFAULT_URLS = ["https://www.unboxboardom.com", "https://www.podimo.com", "https://www.telia.dk"]
+
+
+def percentile(values: list, share: float) -> float:
+    """ Nearest rank percentile, share between 0 and 1."""
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    return ordered[min(int(share * len(ordered)), len(ordered) - 1)]
+
+
+def summarize(values: list) -> dict:
+    if not values:
+        return {}
+    return {"p50": round(percentile(values, 0.50), 4), "p95": round(percentile(values, 0.95), 4),
+            "p99": round(percentile(values, 0.99), 4), "mean": round(sum(values) / len(values), 4),
+            "max": round(max(values), 4)}
+
+
+def make_body(index: int, args) -> dict:
+    url = args.urls[index % len(args.urls)]
+    if args.unique_urls:
+        url += f"/?bench={index}"                      # Defeats the scrape and summary caches.
+    body = {"url": url, "lang": args.lang, "force_refresh": args.force_refresh}
+    if args.mail_type:
+        body["mail_type"] = args.mail_type
+    return body
+
+
+async def send(client: httpx.AsyncClient, endpoint: str, body: dict) -> dict:
+    """ Sends one request, and times it until the last byte of the response."""
+    flag1 = time.perf_counter()
+    ttfb, first_content, received, head = None, None, 0, b''
+    try:
+        async with client.stream("POST", f"/{endpoint}", json=body) as response:
+            async for chunk in response.aiter_bytes():
+                now = time.perf_counter() - flag1
+                if ttfb is None:
+                    ttfb = now
+                received += len(chunk)
+                # The streaming endpoint acknowledges the request right away, the campaign comes after the first line.
+                if endpoint == 'streaming' and first_content is None:
+                    head += chunk
+                    newline = head.find(b'\n')
+                    if newline != -1 and head[newline + 1:].strip():
+                        first_content = now
+            status = response.status_code
+    except httpx.HTTPError as e:
+        return {"ok": False, "error": type(e).__name__, "seconds": time.perf_counter() - flag1}
+    return {"ok": 200 <= status < 300, "status": status, "seconds": time.perf_counter() - flag1, "ttfb": ttfb,
+            "first_content": first_content, "bytes": received}
+
+
+async def run_level(args, endpoint: str, concurrency: int) -> dict:
+    timeout = httpx.Timeout(args.timeout, connect=10)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    results, counter = [], iter(range(args.requests))
+
+    async with httpx.AsyncClient(base_url=args.target, timeout=timeout, limits=limits) as client:
+        async def worker():
+            for index in counter:
+                results.append(await send(client, endpoint, make_body(index, args)))
+
+        flag1 = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        seconds = time.perf_counter() - flag1
+
+    succeeded = [result for result in results if result["ok"]]
+    level = {
+        "endpoint": endpoint, "concurrency": concurrency, "requests": len(results),
+        "errors": len(results) - len(succeeded), "seconds": round(seconds, 3),
+        "rps": round(len(succeeded) / seconds, 3) if seconds else 0.0,
+        "latency": summarize([result["seconds"] for result in succeeded]),
+    }
+    if endpoint == 'streaming':
+        level["ttfb"] = summarize([result["ttfb"] for result in succeeded if result["ttfb"] is not None])
+        level["first_content"] = summarize([result["first_content"] for result in succeeded
+                                            if result["first_content"] is not None])
+    return level
+
+
+def current_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_level(level: dict, baseline: dict = None) -> None:
+    latency = level["latency"] or {"p50": float('nan'), "p95": float('nan'), "p99": float('nan')}
+    line = (f"{level['endpoint']:>10}{level['concurrency']:>6}{level['rps']:>9.2f}{latency['p50']:>9.3f}"
+            f"{latency['p95']:>9.3f}{latency['p99']:>9.3f}{level.get('ttfb', {}).get('p50', float('nan')):>9.3f}"
+            f"{level['errors']:>8}")
+    if baseline and baseline.get("latency"):
+        change = (latency['p95'] - baseline['latency']['p95']) / baseline['latency']['p95'] * 100
+        line += f"{change:>+9.1f}%"
+    print(line)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--target', default="http://localhost:8080")
+    parser.add_argument('--endpoint', nargs='+', choices=['buffered', 'streaming'], default=['buffered'])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--requests', type=int, default=50, help="Requests per endpoint and concurrency level.")
+    parser.add_argument('--urls', nargs='+', default=DEFAULT_URLS)
+    parser.add_argument('--unique-urls', action='store_true', help="Make every URL unique, to bypass the caches.")
+    parser.add_argument('--force-refresh', action='store_true')
+    parser.add_argument('--mail-type', choices=['invite', 'welcome', 'reject'], default=None)
+    parser.add_argument('--lang', default='en')
+    parser.add_argument('--timeout', type=float, default=300)
+    parser.add_argument('--output', default=None, help="JSON file to write the results to.")
+    parser.add_argument('--baseline', default=None, help="Results of an earlier run, to print the change in p95.")
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as file:
+            baseline = {(level["endpoint"], level["concurrency"]): level for level in json.load(file)["levels"]}
+
+    print(f"{'endpoint':>10}{'conc':>6}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'ttfb50':>9}{'errors':>8}"
+          + (f"{'p95 Δ':>10}" if baseline else ""))
+    levels = []
+    for endpoint in args.endpoint:
+        for concurrency in args.concurrency:
+            level = await run_level(args, endpoint, concurrency)
+            levels.append(level)
+            print_level(level, baseline.get((endpoint, concurrency)))
+
+    report = {"commit": current_commit(), "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S%z'), "target": args.target,
+              "config": {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')},
+              "levels": levels}
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
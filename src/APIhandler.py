@@ -1,32 +1,108 @@
+import os
+import math
 import asyncio
 import json
-import boto3
-import re
 
-from typing import Union, Tuple, AsyncGenerator
-from fastapi import APIRouter, HTTPException
-from utils.logger import get_logger
+from contextlib import aclosing
+
+from typing import Union, Tuple, AsyncGenerator, Optional
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+from utils.logger import get_logger, stats as log_stats
+from utils.cache import TieredCache
+from utils.urls import normalize_url
+from utils.singleflight import SingleFlight
+from utils.resultcache import StaleWhileRevalidate
+from utils.pipeline import Pipeline, Stage, StageTimeoutError
+from utils.cancellation import CancellationStats
+from utils import metrics, tracing, ratelimit
+from utils.ratelimit import RateLimitedError
+from utils.hedging import hedger
+from utils.sections import SectionParser
+from utils.tokens import estimate_tokens
+from utils import languages as language_names
 
 import OpenAIClient
+from ClientRegistry import ClientRegistry, get_registry
+from ScraperClient import ScraperTimeoutError
 
 logger = get_logger(__name__)
 router = APIRouter()
 
+# Scraped site text, keyed by normalized URL. Shared by every request in the process, so repeat campaigns for the same
+# site skip the WebScraper Lambda function entirely.
+scrape_cache = TieredCache.from_env('scrape', prefix='SCRAPE_CACHE', ttl=6 * 3600, max_entries=512,
+                                    max_bytes=64 * 1024 * 1024)
+
+# Complete '/buffered' results, keyed by normalized URL, language and mail type. Past RESULT_CACHE_SOFT_TTL seconds an
+# entry is still served, and refreshed in the background. Past RESULT_CACHE_TTL it is evicted.
+result_cache = StaleWhileRevalidate(
+    TieredCache.from_env('result', prefix='RESULT_CACHE', ttl=24 * 3600, max_entries=1024, max_bytes=16 * 1024 * 1024),
+    soft_ttl=float(os.environ.get('RESULT_CACHE_SOFT_TTL', 3600)))
+
+# Concurrent requests for the same scrape or summary await one shared call, instead of starting duplicate work.
+scrape_flights = SingleFlight('scrape')
+summary_flights = SingleFlight('summary')
+
+# Every stage of a request is cut off once the request has been running this long (seconds, 0 disables it).
+REQUEST_DEADLINE = float(os.environ.get('REQUEST_DEADLINE', 150))
+# How often the streaming endpoint checks whether its client is still there.
+DISCONNECT_POLL_SECONDS = float(os.environ.get('DISCONNECT_POLL_SECONDS', 0.5))
+
+# Requests for several languages generate at most this many languages at the same time.
+LANGUAGE_CONCURRENCY = int(os.environ.get('LANGUAGE_CONCURRENCY', 3))
+
+# Estimates of the time and tokens saved by cancelling requests early, on disconnects and deadlines.
+cancellations = CancellationStats(token_stages=('summary', 'campaign', 'platform', 'message'))
+
+
+@router.get("/stats")
+async def stats() -> dict:
+    """ Small endpoint for inspecting the hit/miss counters of the caches in this process."""
+    return {"result_cache": await result_cache.astats(), "scrape_cache": await scrape_cache.astats(),
+            "summary_cache": await OpenAIClient.summary_cache.astats(),
+            "scrape_single_flight": scrape_flights.stats(), "summary_single_flight": summary_flights.stats(),
+            "pools": get_registry().utilization(), "cancellation": cancellations.stats(),
+            "prompt_versions": OpenAIClient.prompts.versions(), "logging": log_stats(),
+            "rate_limits": ratelimit.scheduler.stats(), "hedging": hedger.stats()}
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint() -> PlainTextResponse:
+    """ Latency histograms, token and cost counters and in-flight gauges, in the Prometheus text format."""
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+
+def rate_limited_exception(error: RateLimitedError) -> HTTPException:
+    """ A 503 telling the client when to try again, when OpenAI kept rate limiting us."""
+    retry_after = math.ceil(error.retry_after) if error.retry_after else 5
+    return HTTPException(503, f"OpenAI is rate limiting requests, please retry: {error}",
+                         headers={"Retry-After": str(retry_after)})
+
 
 class RequestHandler:
     """
     This class is responsible for handling requests and the logic for how we generate campaign and message templates.
     """
 
-    def __init__(self, request: dict):
+    def __init__(self, request: dict, registry: Optional[ClientRegistry] = None):
         self.request = request  # Load the request.
         self.body = self.get_event_body()  # Get the body of the request.
 
-        self.ai = OpenAIClient.AIGenerator(self.body)  # Instantiate the OpenAI client.
-        self.client = boto3.client('lambda', region_name='eu-central-1')  # Instantiate the boto3 client.
+        self.registry = registry if registry is not None else get_registry()  # Process wide, pooled clients.
+        self.ai = OpenAIClient.AIGenerator(self.body, self.registry)  # Instantiate the OpenAI client.
+        self.scraper = self.registry.scraper  # Shared, non-blocking client for the WebScraper.
 
         self.generate_campaign_bool = self.should_generate_campaign()    # Determine if a campaign should be generated.
         self.customer_campaign = self.body.get('customer_campaign', 'default_customer_campaign')
+        self.force_refresh = bool(self.body.get('force_refresh', False))  # Bypass caches for this request.
+        self.stream_events = bool(self.body.get('stream_events', False))  # Stream NDJSON events instead of text.
+        self.section_parser = SectionParser()  # Splits the streamed campaign into sections.
+        self.campaign_parts = []  # The campaign streamed so far.
+        self.cancel_reason = None  # Why the request was cut short, if it was, e.g. 'disconnect' or 'deadline'.
+        self.languages = self.body.get('languages') or []  # Languages to generate for at once, if more than 'lang'.
+        self.language_slots = asyncio.Semaphore(LANGUAGE_CONCURRENCY)
+        self.cache_status = 'BYPASS'  # Whether the buffered result came from the result cache: HIT, STALE or MISS.
         self.generate_message_bool = self.should_generate_message()  # Determine if a message should be generated.
 
     def get_event_body(self) -> dict:
@@ -41,181 +117,376 @@ class RequestHandler:
         url = self.body.get('url')
         return customer_campaign == 'default_customer_campaign' and url is not None
 
+    def build_pipeline(self, campaign_chunks: Optional[asyncio.Queue] = None) -> Pipeline:
+        """ Declares the stages needed for this request, and what each of them depends on:
+
+            scrape -> summary -> campaign -> message
+                              -> platform
+
+        Every stage starts as soon as its inputs are ready, so e.g. the message is generated while the platform
+        guidelines are still in progress. All stages share the REQUEST_DEADLINE. When a queue is given, the campaign
+        is streamed into it chunk by chunk. If the customer already has a campaign, only the message stage is run,
+        based on that campaign.
+
+        For several 'languages', the site is scraped and summarized once, and one stage per language generates the
+        campaign, platform guidelines and message in that language, see generate_language():
+
+            scrape -> summary -> language:fr
+                              -> language:de
+
+        :param campaign_chunks: Optional queue for streaming the campaign.
+        :returns: A Pipeline, ready to run."""
+
+        stages = []
+        if self.languages:
+            deps = []
+            if self.should_generate_campaign():
+                stages.append(Stage('scrape', self.scrape_stage))
+                stages.append(Stage('summary', lambda scrape: self.summarize(scrape), deps=['scrape']))
+                deps = ['summary']
+            for code in self.languages:
+                stages.append(Stage(self.language_stage(code), lambda summary=None, code=code:
+                                    self.generate_language(code, summary), deps=deps))
+            return Pipeline(stages, deadline=REQUEST_DEADLINE)
+
+        if self.should_generate_campaign():
+            stages.append(Stage('scrape', self.scrape_stage))
+            stages.append(Stage('summary', lambda scrape: self.summarize(scrape), deps=['scrape']))
+            if campaign_chunks is None:
+                stages.append(Stage('campaign', lambda summary: self.ai.create_campaign_completion(summary),
+                                    deps=['summary']))
+            else:
+                stages.append(Stage('campaign', lambda summary: self.stream_campaign_into(summary, campaign_chunks),
+                                    deps=['summary']))
+            stages.append(Stage('platform', lambda summary: self.ai.create_platform_completion(summary),
+                                deps=['summary']))
+        else:
+            stages.append(Stage('campaign', self.customer_campaign_stage))
+
+        if self.should_generate_message():
+            stages.append(Stage('message', lambda campaign: self.generate_message(campaign), deps=['campaign']))
+        return Pipeline(stages, deadline=REQUEST_DEADLINE)
+
+    def result_cache_key(self) -> Optional[str]:
+        """ Key of the request in the result cache. None for requests based on a customer's campaign, never cached."""
+        if not self.should_generate_campaign():
+            return None
+        key = f"{normalize_url(self.body.get('url'))}|{self.body.get('lang', 'english')}|{self.body.get('mail_type')}"
+        return key + f"|{','.join(self.languages)}" if self.languages else key
+
     async def fastapi_handler_buffered(self) -> Union[dict, Tuple[str, int]]:
+        """ Returns the complete result of a buffered request, from the result cache if it's there. A stale result is
+        returned right away, and generated again in the background for the next request. Sets 'cache_status'.
+
+        :returns: A finished affiliate campaign and optional mail type, both as a single JSON object."""
+
+        key = self.result_cache_key()
+        if key is None:
+            return await self.generate_buffered()
+
+        result, self.cache_status = await result_cache.get(key, self.generate_buffered, self.refresh_buffered,
+                                                           force_refresh=self.force_refresh)
+        if self.cache_status != 'MISS':
+            logger.info(f"Result cache {self.cache_status.lower()} for {key}.")
+        return result
+
+    async def refresh_buffered(self) -> dict:
+        """ Generates a stale result again, in the background. Its completions wait behind interactive requests, and
+        the site is scraped again, so the refreshed result picks up changes to the site."""
+        ratelimit.priority.set('batch')
+        return await RequestHandler(dict(self.body, force_refresh=True), self.registry).generate_buffered()
+
+    async def generate_buffered(self) -> dict:
         """ Method for handling buffered responses. This method does **NOT** include streaming, but simply returns the
         entire desired output upon completion.
 
+        The client's connection isn't watched here. A request is cancelled when its handler is, e.g. by the server
+        when the client goes away, but a background revalidation of the result cache (see refresh_buffered) has no
+        client, and always runs to completion, or until the REQUEST_DEADLINE.
+
         Note: Should webscraping fail, then the program returns an HTTP
         error code along with the accompanying error message.
         :param self: The body of a given request. Validated with Pydantic.
         :returns: A finished affiliate campaign and optional mail type, both as a single JSON object."""
 
+        pipeline = None
         try:
             logger.info(f"Request Received! Generating Affiliate Campaign for {self.body.get('url')}\n\n")
+            logger.info(f"Language is: {self.body.get('lang', 'english')}")
 
-            result = {}                                         # Initialize an empty dictionary to store the results.
-            if self.should_generate_campaign():                 # Check if a campaign should be generated.
-                logger.info("URL present. Scraping website...")
-                site_text = self.invoke_webscraper_lambda()     # Invoke the WebScraper Lambda function.
-                if isinstance(site_text, dict):                 # Check if the response is an error.
-                    return site_text
-                else:
-                    pass                                        # If no error, continue with the process.
-
-                logger.info("Generating campaign and guidelines...\n")
-                logger.info(f"Language is: {self.body.get('lang', 'english')}")
-                campaign, platform = await self.generate_campaign_and_guidelines(site_text)
-
-                result.update(campaign)
-                result.update(platform)
-
-                if self.should_generate_message():
-                    logger.info("mail_type present. Generating mail template...")
-                    message = await self.generate_message(campaign)
-                    result.update(message)
-
-                return result
-            else:
-                logger.info(f"Campaign already present. Generating mail template for '{self.body.get('mail_type')}'")
-                campaign = self.customer_campaign               # If campaign is already provided, use that instead.
-                message = await self.generate_message(campaign)       # Generate the message.
+            pipeline = self.build_pipeline()
+            results = await pipeline.run()
+            logger.info(f"Stage timings: {pipeline.describe()}")
 
-                # Add the results to the dictionary.
-                result.update(message)
+            if self.languages:                                  # One result per language, keyed by language.
+                return {code: results[self.language_stage(code)] for code in self.languages}
 
-                return result                                   # Return the results.
+            result = {}                                         # Initialize an empty dictionary to store the results.
+            if self.should_generate_campaign():                 # Add the campaign and guidelines, if generated.
+                result.update(results['campaign'])
+                result.update(results['platform'])
+            if 'message' in results:
+                result.update(results['message'])
+
+            return result                                       # Return the results.
+        except StageTimeoutError as e:
+            self.cancel_reason = 'deadline'
+            logger.error(f"An error occurred: {str(e)}")
+            raise HTTPException(504, f"Error in buffered handler: {e}")
+        except RateLimitedError as e:
+            logger.error(f"An error occurred: {str(e)}")
+            raise rate_limited_exception(e)
+        except asyncio.CancelledError:
+            self.cancel_reason = 'disconnect'                   # E.g. the client of a batch went away.
+            raise
         except Exception as e:
             logger.error(f"An error occurred: {str(e)}")
             raise HTTPException(500, f"Error in buffered handler: {e}")
+        finally:
+            if pipeline is not None:
+                self.record_pipeline(pipeline)
 
-    async def fastapi_handler_stream(self) -> AsyncGenerator[str, None]:
+    async def fastapi_handler_stream(self, http_request: Optional[Request] = None) -> AsyncGenerator[str, None]:
         """ Method for handling streamed responses. This method **DOES** include streaming, first the campaign is
         streamed, then returns the entire desired JSON output upon completion.
 
+        When the client disconnects, everything still running for the request is cancelled, including the stream
+        from OpenAI, so no more tokens are paid for. The response simply ends.
+
         Note: Should webscraping fail, then the program returns an HTTP
         error code along with the accompanying error message.
         :param self: The body of a given request. Validated with Pydantic.
+        :param http_request: The incoming request, watched for disconnects.
         :returns: A finished affiliate campaign and optional mail type, both as a single JSON object."""
 
+        pipeline, watchdog = None, None
+        ratelimit.priority.set('streaming')                 # Its completions go first, under OpenAI's rate limits.
         try:
-            yield f"Request Received! Generating Affiliate Campaign for {self.body.get('url')}\n\n"
-
-            result = {}                                         # Initialize an empty dictionary to store the results.
-            if self.should_generate_campaign():                 # Check if a campaign should be generated.
-                site_text = self.invoke_webscraper_lambda()     # Invoke the WebScraper Lambda function.
-                if isinstance(site_text, dict):                 # Check if the response is an error.
-                    yield json.dumps(site_text)
-                else:
-                    pass
+            if self.stream_events:
+                yield self.event_line({"event": "received", "url": self.body.get('url')})
+            else:
+                yield f"Request Received! Generating Affiliate Campaign for {self.body.get('url')}\n\n"
+            logger.info(f"Language is: {self.body.get('lang', 'english')}")
 
-                logger.info(f"Language is: {self.body.get('lang', 'english')}")
-                summary = await self.ai.summarize_text(site_text)
-                campaign_stream = self.ai.stream_campaign(summary)
-                platform_future = asyncio.ensure_future(self.ai.create_platform_completion(summary))
+            campaign_chunks = asyncio.Queue()
+            pipeline = self.build_pipeline(campaign_chunks)
+            if 'campaign' in pipeline:                          # Ends the stream once it's done, also on errors.
+                pipeline.on_done('campaign', lambda: campaign_chunks.put_nowait(None))
+            if http_request is not None:
+                watchdog = asyncio.ensure_future(self.watch_disconnect(http_request, pipeline))
 
-                # Initialize an empty string to store the campaign, and then stream afterward.
-                campaign = ""
-                async for chunk in campaign_stream:
-                    campaign += chunk
+            result = {}                                         # Initialize an empty dictionary to store the results.
+            if self.languages:                                  # Every language as soon as it's done.
+                async for line in self.stream_languages(pipeline):
+                    yield line
+            elif self.should_generate_campaign():               # Check if a campaign should be generated.
+                # Stream the campaign (or its section events), while the platform guidelines are generated.
+                while (chunk := await campaign_chunks.get()) is not None:
                     yield chunk
 
-                platform = await platform_future      # Create platform completion while campaign is streaming.
+                await pipeline.result('campaign')
+                platform = await pipeline.result('platform')
 
-                # Parse streamed completion and add the results to the dictionary.
-                parsed_sections = self.parse_completion(campaign)
-                result.update({
-                    "title": parsed_sections["title"],
-                    "aboutCompany": parsed_sections["aboutCompany"],
-                    "description": parsed_sections["description"]
-                })
+                # Sections were parsed while streaming, add them to the dictionary.
+                result.update(self.section_parser.sections())
                 result.update(platform)
 
-                yield "\n\n" + json.dumps(result, indent=3) + "\n\n"
-
-                if self.should_generate_message():
-                    message = await self.generate_message(campaign)
-                    yield json.dumps({'message': message}, indent=3)
-                return
+                if self.stream_events:
+                    yield self.event_line({"event": "campaign", **result})
+                else:
+                    yield "\n\n" + json.dumps(result, indent=3) + "\n\n"
+
+                if 'message' in pipeline:
+                    message = await pipeline.result('message')  # Started as soon as the campaign was done.
+                    if self.stream_events:
+                        yield self.event_line({"event": "message", "message": message})
+                    else:
+                        yield json.dumps({'message': message}, indent=3)
             else:
-                campaign = self.customer_campaign  # If campaign is already provided, use that instead.
-                message = await self.generate_message(campaign)  # Generate the message.
-
-                # Add the results to the dictionary.
-                result['message'] = message
+                result['message'] = await pipeline.result('message')  # Message based on the customer's campaign.
 
-                yield "\n" + json.dumps(result) + "\n\n"
+                if self.stream_events:
+                    yield self.event_line({"event": "message", **result})
+                else:
+                    yield "\n" + json.dumps(result) + "\n\n"
+            logger.info(f"Stage timings: {pipeline.describe()}")
             return
+        except asyncio.CancelledError:
+            if self.cancel_reason == 'disconnect':              # Cancelled by the watchdog, nobody left to stream to.
+                return
+            self.cancel_reason = 'disconnect'                   # Cancelled by the server, as the client went away.
+            raise
+        except StageTimeoutError as e:
+            self.cancel_reason = 'deadline'
+            raise HTTPException(504, f"Error in streaming handler: {e}")
+        except RateLimitedError as e:
+            raise rate_limited_exception(e)
         except Exception as e:
             raise HTTPException(500, f"Error in streaming handler: {e}")
+        finally:
+            if watchdog is not None:
+                watchdog.cancel()
+            if pipeline is not None:
+                pipeline.cancel()   # Nothing left running once the response has ended.
+                self.record_pipeline(pipeline)
+
+    async def stream_languages(self, pipeline: Pipeline) -> AsyncGenerator[str, None]:
+        """ Yields the result of every language in the order they finish, as a 'language' event with 'stream_events',
+        or else as a JSON object keyed by the language."""
+        finished = asyncio.Queue()
+        for code in self.languages:
+            pipeline.on_done(self.language_stage(code), lambda code=code: finished.put_nowait(code))
+
+        for _ in self.languages:
+            code = await finished.get()
+            result = await pipeline.result(self.language_stage(code))   # Raises if the language failed.
+            if self.stream_events:
+                yield self.event_line({"event": "language", "lang": code, **result})
+            else:
+                yield "\n\n" + json.dumps({code: result}, indent=3) + "\n\n"
+
+    def record_pipeline(self, pipeline: Pipeline) -> None:
+        """ Records stage latencies, and what was saved if the request was cut short."""
+        metrics.record_stages(pipeline.timings(), pipeline.outcomes())
+        progress = {'campaign': estimate_tokens("".join(self.campaign_parts))} if self.campaign_parts else None
+        cancellations.record(pipeline, self.cancel_reason, progress)
+
+    async def watch_disconnect(self, http_request: Request, pipeline: Pipeline) -> None:
+        """ Polls the connection of the client, and cancels the pipeline once the client has disconnected."""
+        while not pipeline.done():
+            if await http_request.is_disconnected():
+                self.cancel_reason = 'disconnect'
+                logger.info(f"Client disconnected, cancelling the stages still running after "
+                            f"{pipeline.elapsed():.2f} seconds.")
+                pipeline.cancel()
+                return
+            await asyncio.sleep(DISCONNECT_POLL_SECONDS)
+
+    async def scrape_stage(self) -> str:
+        site_text = await self.scrape_site()                    # Scrape the website, or fetch it from cache.
+        if isinstance(site_text, dict):                         # Check if the response is an error.
+            raise HTTPException(502, json.dumps(site_text))
+        return site_text
+
+    async def customer_campaign_stage(self) -> str:
+        return self.customer_campaign                           # If campaign is already provided, use that instead.
+
+    async def stream_campaign_into(self, summary: str, campaign_chunks: asyncio.Queue) -> str:
+        """ Streams the campaign into a queue chunk by chunk, and returns the complete campaign at the end.
+        Every chunk is fed to the section parser as it arrives. With 'stream_events', the queue receives the parser's
+        events as NDJSON lines instead of the raw text."""
+        async with aclosing(self.ai.stream_campaign(summary)) as campaign_stream:   # Closes the upstream stream
+            async for chunk in campaign_stream:                                       # as soon as this is cancelled.
+                self.campaign_parts.append(chunk)
+                events = self.section_parser.feed(chunk)
+                if self.stream_events:
+                    for event in events:
+                        campaign_chunks.put_nowait(self.event_line(event))
+                else:
+                    campaign_chunks.put_nowait(chunk)
+
+        for event in self.section_parser.finish():
+            if self.stream_events:
+                campaign_chunks.put_nowait(self.event_line(event))
+        return "".join(self.campaign_parts)
+
+    @staticmethod
+    def event_line(event: dict) -> str:
+        return json.dumps(event, ensure_ascii=False) + "\n"
+
+    async def scrape_site(self) -> Union[str, dict]:
+        """
+        Returns the scraped text for the requested URL. Looks in the scrape cache first, unless the request has
+        'force_refresh' set, and only invokes the WebScraper Lambda function on a miss.
+
+        Concurrent requests for the same URL await a single scrape.
+
+        :return: Scraped text from the website.
+        """
+
+        key = normalize_url(self.body.get('url'))
+        return await scrape_flights.do((key, self.force_refresh), lambda: self._scrape_site(key))
+
+    async def _scrape_site(self, key: str) -> Union[str, dict]:
+        if not self.force_refresh:
+            cached = await scrape_cache.aget(key)
+            if cached is not None:
+                logger.info(f"Scrape cache hit for {key}. Skipping WebScraper.")
+                return cached
+
+        site_text = await self.invoke_webscraper_lambda()
+        if isinstance(site_text, str) and site_text.strip():    # Never cache errors or empty pages.
+            await scrape_cache.aset(key, site_text)
+        return site_text
 
     # TODO: Add API endpoint here, so we can call the webscraper directly from this API
     #  instead of the lambda function url.
-    def invoke_webscraper_lambda(self) -> Union[str, dict]:
+    async def invoke_webscraper_lambda(self) -> Union[str, dict]:
         """
         This method invokes the WebScraper Lambda function and returns the scraped text.
+        The invocation runs on the scraper client's thread pool, so the event loop keeps serving other requests.
 
         :return: Scraped text from the website.
         """
 
-        payload = {
-            "url": self.body.get('url')
-        }
-
         try:
-            # Invoke the Lambda function
-            response = self.client.invoke(
-                FunctionName='WebScraper_Service',
-                InvocationType='RequestResponse',
-                Payload=json.dumps(payload),
-            )
-
-            # Read the response from the Lambda function
-            response_payload = json.loads(response['Payload'].read().decode('utf-8'))
-            body = json.loads(response_payload['body'])
-
-            logger.info(f"Response from WebScraper Lambda function: {body}")
+            with tracing.span('scraper.invoke', url=self.body.get('url')) as span:
+                # The WebScraper records its own spans under this one, and returns them along with the text.
+                body = await self.scraper.scrape(self.body.get('url'), trace=tracing.inject())
+                cookie = body.get('cookie') or {}
+                span.set(extraction_path=body.get('extraction_path'), driver_warm=body.get('driver_warm'),
+                         scrape_seconds=body.get('scrape_seconds'), cookie_seconds=cookie.get('seconds'),
+                         cookie_outcome=cookie.get('outcome'))
+                tracing.add_remote_spans(body.pop('spans', None))
+            metrics.record_scrape(body)
+
+            # The scraped text itself is only logged at DEBUG, where it's cut off at LOG_MAX_CHARS.
+            logger.info(f"Response from WebScraper Lambda function: {len(body.get('site_text') or '')} characters "
+                        f"of text, path: {body.get('extraction_path')}, {body.get('scrape_seconds')} seconds, "
+                        f"cookies: {body.get('cookie')}.")
+            logger.debug(f"Scraped text: {body.get('site_text')}")
 
             # Extract the scraped text from the response body.
             scraped_text = body['site_text']
 
             return scraped_text
+        except ScraperTimeoutError as e:
+            raise HTTPException(504, f"Error invoking WebScraper Lambda function: {e}")
         except Exception as e:
             raise HTTPException(500, f"Error invoking WebScraper Lambda function: {e}")
 
-    async def generate_campaign_and_guidelines(self, site_text) -> tuple[dict, dict]:
-        summary = await self.ai.summarize_text(site_text)     # Generate summary.
-
-        # Wait for campaign and guidelines to finish and save upon completion.
-        campaign, guidelines = await self.ai.create_buffered_campaign(summary)
-        return campaign, guidelines
+    async def summarize(self, site_text: str) -> str:
+        """ Summarizes the scraped text. Concurrent requests for the same text and language await one summary."""
+        key = (OpenAIClient.summary_cache_key(site_text, self.body.get('lang', 'english')), self.force_refresh)
+        return await summary_flights.do(key, lambda: self.ai.summarize_text(site_text))
+
+    @staticmethod
+    def language_stage(code: str) -> str:
+        return f"language:{code}"
+
+    async def generate_language(self, code: str, summary: Optional[str] = None) -> dict:
+        """ Generates the campaign and platform guidelines from the shared summary, and the message, in one of the
+        requested languages. Without a summary, only the message is generated, from the customer's campaign.
+        At most LANGUAGE_CONCURRENCY languages of a request are generated at the same time."""
+        async with self.language_slots:
+            ai = OpenAIClient.AIGenerator(dict(self.body, lang=language_names[code]), self.registry)
+            result, campaign = {}, self.customer_campaign
+            if summary is not None:
+                campaign, platform = await asyncio.gather(ai.create_campaign_completion(summary),
+                                                          ai.create_platform_completion(summary))
+                result.update(campaign)
+                result.update(platform)
+            if self.should_generate_message():
+                result.update(await ai.create_message_completion(self.body.get('mail_type'), campaign))
+            return result
 
     async def generate_message(self, campaign) -> dict:
         return await self.ai.create_message_completion(self.body.get('mail_type'), campaign)
 
-    # TODO: Currently parsing streamed completions into proper JSON format is only supported in english.
-    #  Should be extended to other languages. Also, this method is static and should be moved to a utility class.
-    #  However, it doesn't properly format the streamed completions unless it is inside this class????
-    def parse_completion(self, text):
-        sections = {
-            "title": "",
-            "aboutCompany": "",
-            "description": ""
-        }
-
-        # Extracting the title
-        title_match = re.search(r"\*\*Campaign Title\*\*\n(.+)\n", text)
-        if title_match:
-            sections["title"] = title_match.group(1).strip()
-
-        # Extracting the aboutCompany section
-        about_match = re.search(r"\*\*About the Company\*\*\n(.+?)\n\n\*\*Campaign Description\*\*", text, re.DOTALL)
-        if about_match:
-            sections["aboutCompany"] = about_match.group(1).strip()
-
-        # Extracting the description and subsequent sections
-        description_match = re.search(r"\*\*Campaign Description\*\*\n(.+)", text, re.DOTALL)
-        if description_match:
-            description = description_match.group(1).strip()
-            sections["description"] = description
-
-        return sections
+    @staticmethod
+    def parse_completion(text: str) -> dict:
+        """ Splits a complete campaign into its title, aboutCompany and description sections."""
+        parser = SectionParser()
+        parser.feed(text)
+        parser.finish()
+        return parser.sections()
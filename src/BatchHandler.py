@@ -0,0 +1,72 @@
+import os
+import json
+import time
+import asyncio
+
+from typing import AsyncGenerator, Optional
+from fastapi import HTTPException
+from utils.logger import get_logger
+from utils import tracing, ratelimit
+
+from APIhandler import RequestHandler
+from ClientRegistry import ClientRegistry
+
+logger = get_logger(__name__)
+
+BATCH_CONCURRENCY = int(os.environ.get('BATCH_CONCURRENCY', 4))
+
+
+class BatchHandler:
+    """
+    This class is responsible for handling batches of requests, e.g. when onboarding an agency with dozens of
+    campaigns. All items run through one scheduler, which processes at most 'concurrency' items at the same time.
+    Items with the same URL share a single scrape and summary, through the RequestHandler's single-flight groups.
+
+    Results are streamed back as newline delimited JSON, one record per item, in the order they finish. Every record
+    carries the index of its item in the batch. A failing item produces an error record, and never aborts the batch.
+    """
+
+    def __init__(self, items: list[dict], registry: ClientRegistry, concurrency: Optional[int] = None):
+        self.items = items
+        self.registry = registry
+        self.concurrency = concurrency or BATCH_CONCURRENCY
+
+    async def run(self) -> AsyncGenerator[str, None]:
+        """ Processes all items and yields an NDJSON record for each, as soon as it is finished."""
+        flag1 = time.perf_counter()
+        logger.info(f"Batch of {len(self.items)} items received. Processing {self.concurrency} at a time.")
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        ratelimit.priority.set('batch')     # Interactive requests go first, when OpenAI's rate limits are reached.
+        tasks = [asyncio.ensure_future(self.run_item(index, item, semaphore)) for index, item in enumerate(self.items)]
+        failed = 0
+        try:
+            for next_finished in asyncio.as_completed(tasks):
+                record = await next_finished
+                failed += record['status'] == 'error'
+                yield json.dumps(record, ensure_ascii=False) + "\n"
+        finally:
+            # If the client goes away mid-batch, don't keep generating campaigns nobody will receive.
+            for task in tasks:
+                task.cancel()
+
+        flag2 = time.perf_counter()
+        logger.info(f"Batch of {len(self.items)} items finished in {flag2 - flag1:.2f} seconds. {failed} failed.")
+
+    async def run_item(self, index: int, item: dict, semaphore: asyncio.Semaphore) -> dict:
+        async with semaphore:
+            flag1 = time.perf_counter()
+            try:
+                with tracing.span('batch.item', index=index, url=item.get('url')):
+                    handle = RequestHandler(item, self.registry)
+                    result = await handle.fastapi_handler_buffered()
+                return {"index": index, "status": "ok", "seconds": round(time.perf_counter() - flag1, 2),
+                        "cache": handle.cache_status, "result": result}
+            except HTTPException as e:
+                logger.error(f"Batch item {index} failed: {e.detail}")
+                return {"index": index, "status": "error", "seconds": round(time.perf_counter() - flag1, 2),
+                        "error": str(e.detail)}
+            except Exception as e:
+                logger.error(f"Batch item {index} failed: {e}")
+                return {"index": index, "status": "error", "seconds": round(time.perf_counter() - flag1, 2),
+                        "error": str(e)}
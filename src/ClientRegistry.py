@@ -0,0 +1,119 @@
+import os
+import httpx
+
+from contextlib import contextmanager
+from typing import Optional
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+from dotenv import load_dotenv
+
+from ScraperClient import ScraperClient
+from utils.logger import get_logger
+from utils.monitor import check_env_for_dev_flag
+
+logger = get_logger(__name__)
+
+
+class PoolStats:
+    """ Tracks how many leases of a pooled client are in use, and the peak since startup."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.in_flight = 0
+        self.peak = 0
+        self.total = 0
+
+    @contextmanager
+    def lease(self):
+        self.in_flight += 1
+        self.total += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+
+    def report(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "peak": self.peak,
+            "total": self.total,
+            "capacity": self.capacity,
+            "utilization": round(self.in_flight / self.capacity, 3) if self.capacity else 0.0,
+        }
+
+
+class ClientRegistry:
+    """
+    Owns the clients that should live for the whole process, rather than being built on every request: the OpenAI
+    client with its HTTP connection pool, and the WebScraper client with its boto3 client and thread pool.
+
+    Created once in the FastAPI lifespan hook. Request scoped objects (RequestHandler, AIGenerator) borrow the clients
+    from here, so TLS sessions and keep-alive connections are reused across requests.
+    """
+
+    def __init__(self, openai_client: AsyncOpenAI, scraper: ScraperClient, api_key: str,
+                 max_connections: int, monitor: bool = False):
+        self.openai = openai_client
+        self.scraper = scraper
+        self.api_key = api_key
+        self.monitor = monitor
+        self.openai_pool = PoolStats(max_connections)
+
+    @classmethod
+    def from_env(cls) -> 'ClientRegistry':
+        """ Builds the registry from the environment. The OpenAI connection pool is sized with OPENAI_MAX_CONNECTIONS
+        (default 100) and OPENAI_MAX_KEEPALIVE (default 20), the WebScraper client with the SCRAPER_* variables."""
+        load_dotenv()
+        api_key = os.getenv("OPENAI_API_KEY")
+        if api_key is None:
+            raise ValueError("OPENAI_API_KEY is not set in the environment variables.")
+
+        max_connections = int(os.environ.get('OPENAI_MAX_CONNECTIONS', 100))
+        max_keepalive = int(os.environ.get('OPENAI_MAX_KEEPALIVE', 20))
+        http_client = DefaultAsyncHttpxClient(limits=httpx.Limits(max_connections=max_connections,
+                                                                  max_keepalive_connections=max_keepalive))
+        # Retries are left to the rate limiter, which coordinates them across requests (see utils.ratelimit).
+        openai_client = AsyncOpenAI(api_key=api_key, http_client=http_client,
+                                    max_retries=int(os.environ.get('OPENAI_CLIENT_MAX_RETRIES', 0)))
+
+        logger.info(f"Client registry created. OpenAI pool: {max_connections} connections, "
+                    f"{max_keepalive} keep-alive.")
+        return cls(openai_client, ScraperClient.from_env(), api_key, max_connections,
+                   monitor=check_env_for_dev_flag())
+
+    @contextmanager
+    def lease_openai(self):
+        """ Marks an OpenAI call as in flight, for the utilization report."""
+        with self.openai_pool.lease():
+            yield self.openai
+
+    def utilization(self) -> dict:
+        return {
+            "openai": self.openai_pool.report(),
+            "scraper": {
+                "in_flight": self.scraper.in_flight,
+                "capacity": self.scraper.max_concurrency,
+                "utilization": round(self.scraper.in_flight / self.scraper.max_concurrency, 3),
+            },
+        }
+
+    async def close(self) -> None:
+        logger.info(f"Closing client registry. Final utilization: {self.utilization()}")
+        await self.openai.close()
+        self.scraper.close()
+
+
+_registry: Optional[ClientRegistry] = None
+
+
+def get_registry() -> ClientRegistry:
+    """ Returns the registry of the running process. Created on first use, if the lifespan hook hasn't done so."""
+    global _registry
+    if _registry is None:
+        _registry = ClientRegistry.from_env()
+    return _registry
+
+
+def set_registry(registry: Optional[ClientRegistry]) -> None:
+    global _registry
+    _registry = registry
@@ -2,13 +2,21 @@ import os
 import json
 import time
 import asyncio
+import hashlib
 
+from utils import languages
 from utils.logger import get_logger
-from utils.monitor import check_env_for_dev_flag
+from utils.prompts import PromptRegistry
+from utils.metrics import record_usage
+from utils.ratelimit import scheduler
+from utils.hedging import hedger
+from utils import tracing
+from utils.cache import TieredCache
+from utils.tokens import estimate_tokens, chunk_text, truncate_text
 from typing import AsyncGenerator, Optional, Union
-from openai import AsyncOpenAI, NOT_GIVEN
-from dotenv import load_dotenv
+from openai import NOT_GIVEN, RateLimitError, APIConnectionError, InternalServerError
 from enum import Enum
+from ClientRegistry import ClientRegistry, get_registry
 
 logger = get_logger(__name__)
 
@@ -38,26 +46,60 @@ file_paths = {
 file_paths = {key: os.path.join(instructions_dir, value) for key, value in file_paths.items()}
 
 
-# Define an Enum class to hold the identifiers and their corresponding .txt instructions.
+# Define an Enum class to hold the identifiers and the key of their .txt instructions in the prompt registry.
 class Identifiers(Enum):
-    CAMPAIGN = open(file_paths["campaign"], 'r', encoding='utf-8').read()
-    BUFFERED_CAMPAIGN = open(file_paths["buffered_campaign"], 'r', encoding='utf-8').read()
-    PLATFORM = open(file_paths["platform"], 'r', encoding='utf-8').read()
-    SUMMARY = open(file_paths["summary"], 'r', encoding='utf-8').read()
-    INVITE = open(file_paths["invite"], 'r', encoding='utf-8').read()
-    WELCOME = open(file_paths["welcome"], 'r', encoding='utf-8').read()
-    REJECT = open(file_paths["reject"], 'r', encoding='utf-8').read()
+    CAMPAIGN = 'campaign'
+    BUFFERED_CAMPAIGN = 'buffered_campaign'
+    PLATFORM = 'platform'
+    SUMMARY = 'summary'
+    INVITE = 'invite'
+    WELCOME = 'welcome'
+    REJECT = 'reject'
 
 
+# All instructions are loaded once, at startup or on first use, with a system message per language, and reloaded when
+# their files change.
+prompts = PromptRegistry.from_env(file_paths, languages.values())
+
 logger.info(f"Currently in directory: \n{os.path.dirname(__file__)}")
 
+# Summaries keyed by a hash of the scraped text, the summary instructions and the target language. Regenerating a
+# campaign for the same site (e.g. with another mail_type) then skips the summary completion entirely.
+summary_cache = TieredCache.from_env('summary', prefix='SUMMARY_CACHE', ttl=24 * 3600, max_entries=1024,
+                                     max_bytes=16 * 1024 * 1024)
+
+# Pages estimated above this many tokens are summarized in chunks of this size (map), whose summaries are then
+# summarized together (reduce). SUMMARY_PARALLELISM caps how many chunks are summarized at once per request.
+SUMMARY_CHUNK_TOKENS = int(os.environ.get('SUMMARY_CHUNK_TOKENS', 4000))
+SUMMARY_PARALLELISM = int(os.environ.get('SUMMARY_PARALLELISM', 4))
+# Map rounds at most, when the partial summaries are still too large to reduce. After the last round, they are cut off
+# at SUMMARY_CHUNK_TOKENS instead, so a verbose model or a long non-English page can't keep spending completions.
+SUMMARY_MAX_DEPTH = int(os.environ.get('SUMMARY_MAX_DEPTH', 2))
+
+# Completion tokens assumed for calls without max_tokens, when estimating their share of the tokens per minute limit.
+EXPECTED_COMPLETION_TOKENS = int(os.environ.get('EXPECTED_COMPLETION_TOKENS', 700))
+
+# Errors worth another try: rate limits, dropped connections, timeouts and errors on OpenAI's side.
+RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, InternalServerError)
 
-def monitor_tokens(completion, identifier: Identifiers):
+
+def summary_cache_key(page_text: str, lang: str) -> str:
+    """Content address of a summary. Changing the page, the instructions or the language yields a new key."""
+    digest = hashlib.sha256()
+    for part in (page_text, prompts.get(Identifiers.SUMMARY.value).version, lang):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def monitor_tokens(completion, identifier: Identifiers, version: str):
     """
     Small method for monitoring token usage with OpenAI API.
     OpenAI charges their customers on token usage, so monitoring tokens helps see how much each completion costs.
+    The version of the prompt is logged along, to compare token usage between revisions of the instructions.
     """
 
+    logger.info(f"{str(identifier.name).capitalize()} prompt version: " + version)
     logger.info(f"{str(identifier.name).capitalize()} prompt tokens: " + str(completion.usage.prompt_tokens))
     logger.info(f"{str(identifier.name).capitalize()} completion tokens: " + str(completion.usage.completion_tokens))
     logger.info(f"{str(identifier.name).capitalize()} total tokens: " + str(completion.usage.total_tokens))
@@ -69,20 +111,13 @@ class AIGenerator:
     Class for generating AI completions with OpenAI API.
     """
 
-    def __init__(self, body: dict = None):
-        load_dotenv()
-        self.api_key = os.getenv("OPENAI_API_KEY")
+    def __init__(self, body: dict = None, registry: Optional[ClientRegistry] = None):
+        self.registry = registry if registry is not None else get_registry()   # Borrow the pooled clients.
+        self.api_key = self.registry.api_key
         self.body = body
 
-        if self.api_key is None:
-            raise ValueError("OPENAI_API_KEY is not set in the environment variables.")
-
-        self.Async_client = AsyncOpenAI(api_key=self.api_key)
-
-        if check_env_for_dev_flag():
-            self.monitor = True
-        else:
-            self.monitor = False
+        self.Async_client = self.registry.openai
+        self.monitor = self.registry.monitor
 
     async def create_completion(self, prompt: str, identifier: Identifiers, max_tokens: Optional[int] = None,
                                 stream: Optional[bool] = False) -> Union[str, dict]:
@@ -97,7 +132,6 @@ class AIGenerator:
 
         flag1 = time.perf_counter()
 
-        instruction = identifier.value
         if not isinstance(identifier, Identifiers):
             raise ValueError(f"Invalid identifier: {identifier}. Expected one of: 'Campaign', 'Platform', 'Summary', "
                              f", 'Invite', 'Welcome' or 'Reject'.")
@@ -113,40 +147,97 @@ class AIGenerator:
         response_format = NOT_GIVEN if identifier == Identifiers.SUMMARY or identifier == Identifiers.CAMPAIGN \
             else {"type": "json_object"}
 
-        language = "\nYou will generate this content in " + self.body.get('lang', 'english')
-
-        chat = await self.Async_client.chat.completions.create(
-            model=model,
-            response_format=response_format,
-            stream=stream,
-            messages=[
-                {"role": "system", "content": instruction + language},
-                {"role": "user", "content": prompt}
-            ],
-            n=1,    # Option for number of completions to create. Usually AI picks the completion with best fit.
-            temperature=0.6,  # Option for 'randomness', accepts values between 0-2. Lower values more deterministic.
-            max_tokens=max_tokens  # Max token usage for chat completions. A.K.A max tokens for the output.
-        )
-
-        content = chat.choices[0].message.content
+        instruction = prompts.get(identifier.value)     # Precomputed instructions, in the requested language.
+        system = instruction.system(self.body.get('lang', 'english'))
+        prompt_tokens = estimate_tokens(system) + estimate_tokens(prompt)
+        estimated = prompt_tokens + (max_tokens or EXPECTED_COMPLETION_TOKENS)
+
+        async def attempt(attempt_model: str) -> tuple:
+            with self.registry.lease_openai(), tracing.span('openai.completion', model=attempt_model,
+                                                            identifier=identifier.value,
+                                                            prompt_version=instruction.version) as span:
+                # Waits for room within the model's rate limits, and retries rate limited and failed calls.
+                chat = await scheduler.call(attempt_model, estimated, lambda: self.Async_client.chat.completions.create(
+                    model=attempt_model,
+                    response_format=response_format,
+                    stream=stream,
+                    messages=[
+                        {"role": "system", "content": system},
+                        {"role": "user", "content": prompt}
+                    ],
+                    n=1,    # Option for number of completions to create. Usually AI picks the completion with best fit.
+                    temperature=0.6,  # Option for 'randomness', accepts values between 0-2. Lower is less random.
+                    max_tokens=max_tokens  # Max token usage for chat completions. A.K.A max tokens for the output.
+                ), retry_on=RETRYABLE_ERRORS)
+                scheduler.settle(attempt_model, estimated, chat.usage.total_tokens if chat.usage is not None else None)
+                if chat.usage is not None:
+                    span.set(prompt_tokens=chat.usage.prompt_tokens, completion_tokens=chat.usage.completion_tokens)
+
+            record_usage(attempt_model, identifier.value, chat.usage)     # Always on, unlike the logging below.
+            content = chat.choices[0].message.content
+            # Parsed here, so that when hedging, a response with invalid JSON leaves the race to the other request.
+            return chat, json.loads(content) if response_format == {"type": "json_object"} else content
+
+        # Hedged with a second request when the stage is configured for it and the first is slow, see utils.hedging.
+        (chat, result), model = await hedger.run(
+            identifier.value, model, attempt, estimated_tokens=prompt_tokens, busy=scheduler.busy,
+            loser_tokens=lambda outcome: outcome[0].usage.total_tokens if outcome[0].usage is not None else 0)
 
         flag2 = time.perf_counter()
 
         if self.monitor:
-            monitor_tokens(chat, identifier)
-            logger.info(f"{str(identifier.name).capitalize()} has been generated in {flag2 - flag1:.2f} seconds.")
-            logger.debug(f"\n{str(identifier.name).capitalize()}: \n" + content)
+            monitor_tokens(chat, identifier, instruction.version)
+            logger.info(f"{str(identifier.name).capitalize()} has been generated by {model} in "
+                        f"{flag2 - flag1:.2f} seconds.")
+            logger.debug(f"\n{str(identifier.name).capitalize()}: \n" + chat.choices[0].message.content)
 
-        if response_format == {"type": "json_object"}:
-            return json.loads(content)
-        else:
-            return content
+        return result
 
     async def summarize_text(self, page_text: str) -> str:
         """In order to reduce token usage, when generating briefs with the more expensive AI models, we use GPT-3.5 for
         summarization. This is the cheapest model, and creates a coherent summary of the scraped website.
-        Also is a cheap way to reduce the token usage of the more expensive models."""
-        return await self.create_completion(page_text, Identifiers.SUMMARY)
+        Also is a cheap way to reduce the token usage of the more expensive models.
+
+        Summaries are cached by content, so byte-identical pages are only summarized once per language."""
+        key = summary_cache_key(page_text, self.body.get('lang', 'english'))
+        if not self.body.get('force_refresh', False):
+            cached = await summary_cache.aget(key)
+            if cached is not None:
+                logger.info("Summary cache hit. Skipping summary completion.")
+                return cached
+
+        if estimate_tokens(page_text) <= SUMMARY_CHUNK_TOKENS:
+            summary = await self.create_completion(page_text, Identifiers.SUMMARY)
+        else:
+            summary = await self.map_reduce_summary(page_text)
+        if summary:
+            await summary_cache.aset(key, summary)
+        return summary
+
+    async def map_reduce_summary(self, page_text: str, depth: int = 1) -> str:
+        """Summarizes a page that is too large for a single prompt. The page is split into chunks on paragraph
+        boundaries, the chunks are summarized concurrently (at most SUMMARY_PARALLELISM at a time), and the partial
+        summaries are summarized into one. If the partial summaries are still too large, they are summarized in chunks
+        again, for at most SUMMARY_MAX_DEPTH rounds, after which they are cut off to fit."""
+        chunks = chunk_text(page_text, SUMMARY_CHUNK_TOKENS)
+        logger.info(f"Page is ~{estimate_tokens(page_text)} tokens. Summarizing {len(chunks)} chunks.")
+
+        semaphore = asyncio.Semaphore(SUMMARY_PARALLELISM)
+
+        async def summarize_chunk(chunk: str) -> str:
+            async with semaphore:
+                return await self.create_completion(chunk, Identifiers.SUMMARY)
+
+        partial_summaries = await asyncio.gather(*(summarize_chunk(chunk) for chunk in chunks))
+        combined = '\n'.join(partial for partial in partial_summaries if partial)
+
+        if estimate_tokens(combined) > SUMMARY_CHUNK_TOKENS:
+            if len(chunks) > 1 and depth < SUMMARY_MAX_DEPTH:
+                return await self.map_reduce_summary(combined, depth + 1)
+            logger.warning(f"Partial summaries are still ~{estimate_tokens(combined)} tokens after {depth} rounds. "
+                           f"Cutting them off at {SUMMARY_CHUNK_TOKENS} tokens.")
+            combined = truncate_text(combined, SUMMARY_CHUNK_TOKENS)
+        return await self.create_completion(combined, Identifiers.SUMMARY)
 
     async def create_campaign_completion(self, summary: str) -> dict:
         return await self.create_completion(summary, Identifiers.BUFFERED_CAMPAIGN, 600)
@@ -167,26 +258,49 @@ class AIGenerator:
             raise ValueError(f"Invalid mail_type: {mail_type}. Expected one of: 'invite', 'welcome', 'reject'.")
 
     async def stream_campaign(self, summary: str) -> AsyncGenerator[str, None]:
-        with open(file_paths['campaign'], 'r', encoding='utf-8') as file:
-            campaign_instructions = file.read()
-
-            language = "\nYou will generate this content in " + self.body.get('lang', 'english')
-
-        campaign_stream = await self.Async_client.chat.completions.create(
-            model="gpt-3.5-turbo-0125",
-            messages=[
-                {"role": "system", "content": campaign_instructions + language},
-                {"role": "user", "content": summary}
-            ],
-            temperature=0.3,
-            stream=True
-        )
-        final_response = ""
-        async for chunk in campaign_stream:
-            chunk_response = chunk.choices[0].delta.content
-            if chunk_response:
-                final_response += chunk_response
-                yield chunk_response
+        instruction = prompts.get(Identifiers.CAMPAIGN.value)
+        if self.monitor:
+            logger.info(f"Campaign prompt version: {instruction.version}")
+
+        model = "gpt-3.5-turbo-0125"
+        system = instruction.system(self.body.get('lang', 'english'))
+        estimated = estimate_tokens(system) + estimate_tokens(summary) + EXPECTED_COMPLETION_TOKENS
+        with self.registry.lease_openai(), tracing.span('openai.stream', model=model, identifier='campaign',
+                                                        prompt_version=instruction.version) as span:
+            # Only opening the stream is retried. Once tokens have been sent, a failure ends the stream.
+            campaign_stream = await scheduler.call(model, estimated, lambda: self.Async_client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": system},
+                    {"role": "user", "content": summary}
+                ],
+                temperature=0.3,
+                stream=True,
+                stream_options={"include_usage": True}  # Adds a last chunk with the token usage of the stream.
+            ), retry_on=RETRYABLE_ERRORS)
+            usage, chunks, flag1 = None, 0, time.perf_counter()
+            try:
+                async for chunk in campaign_stream:
+                    if chunk.usage is not None:
+                        usage = chunk.usage
+                    if not chunk.choices:               # The usage chunk has no choices.
+                        continue
+                    chunk_response = chunk.choices[0].delta.content
+                    if chunk_response:
+                        if chunks == 0:
+                            span.set(first_token_seconds=round(time.perf_counter() - flag1, 3))
+                        chunks += 1
+                        yield chunk_response
+            finally:
+                await campaign_stream.close()   # Stops generation (and billing) if the consumer went away early.
+                record_usage(model, Identifiers.CAMPAIGN.value, usage)  # No usage if the stream was cut short.
+                scheduler.settle(model, estimated, usage.total_tokens if usage is not None else None)
+                span.set(chunks=chunks)
+                if usage is not None:
+                    span.set(prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens)
+                if self.monitor and usage is not None:
+                    logger.info(f"Campaign stream prompt tokens: {usage.prompt_tokens}, "
+                                f"completion tokens: {usage.completion_tokens}")
 
     async def create_buffered_campaign(self, summary: str) -> tuple[dict, dict]:
         """
@@ -0,0 +1,187 @@
+import os
+import sys
+import json
+import asyncio
+import threading
+
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class ScraperTransport(ABC):
+    """
+    Base class for the ways we can reach the WebScraper. A transport takes the request payload and returns the raw
+    response of the WebScraper handler, i.e. a dict with 'statusCode' and a JSON encoded 'body'.
+
+    Transports are blocking, and are always run on the ScraperClient's executor, never on the event loop.
+    """
+
+    @abstractmethod
+    def invoke(self, payload: dict) -> dict:
+        ...
+
+
+class LambdaTransport(ScraperTransport):
+    """ Invokes the WebScraper_Service Lambda function with boto3."""
+
+    def __init__(self, client=None, function_name: str = 'WebScraper_Service', region_name: str = 'eu-central-1',
+                 timeout: float = 60, max_pool_connections: int = 10):
+        if client is None:
+            import boto3
+            from botocore.config import Config
+
+            # Read timeout slightly above the client timeout, so boto3 never gives up before we do.
+            config = Config(read_timeout=timeout + 5, max_pool_connections=max_pool_connections,
+                            retries={'max_attempts': 0})
+            client = boto3.client('lambda', region_name=region_name, config=config)
+        self.client = client
+        self.function_name = function_name
+
+    def invoke(self, payload: dict) -> dict:
+        response = self.client.invoke(
+            FunctionName=self.function_name,
+            InvocationType='RequestResponse',
+            Payload=json.dumps(payload),
+        )
+        response_payload = json.loads(response['Payload'].read().decode('utf-8'))
+        if 'FunctionError' in response:
+            raise RuntimeError(f"WebScraper Lambda function failed: {response_payload.get('errorMessage')}")
+        return response_payload
+
+
+class LocalTransport(ScraperTransport):
+    """
+    Runs the WebScraper handler in-process instead of on Lambda. Used for local development and testing.
+
+    By default this imports 'webscraper_handler.handler' from webscraper_lambda/src, which needs Selenium and Chrome,
+    and must be run from the webscraper_lambda directory, since the scraper reads its files from 'utils/'.
+    Any callable with the same (event, context) signature can be passed instead, e.g. a stub returning fixtures.
+    """
+
+    def __init__(self, handler: Optional[Callable[[dict, object], dict]] = None):
+        if handler is None:
+            scraper_src = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                       'webscraper_lambda', 'src')
+            if scraper_src not in sys.path:
+                sys.path.append(scraper_src)
+            from webscraper_handler import handler
+        self.handler = handler
+
+    def invoke(self, payload: dict) -> dict:
+        return self.handler(payload, None)
+
+
+class HttpTransport(ScraperTransport):
+    """
+    Posts the payload to a WebScraper served over HTTP, e.g. behind a function URL, or the fake scraper of the
+    benchmarks. The response must be the handler's response as JSON. Each executor thread keeps its own session, so
+    connections are reused between scrapes.
+    """
+
+    def __init__(self, url: str, timeout: float = 60):
+        self.url = url
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def invoke(self, payload: dict) -> dict:
+        import requests
+
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        response = session.post(self.url, json=payload, timeout=self.timeout + 5)
+        response.raise_for_status()
+        return response.json()
+
+
+class ScraperTimeoutError(Exception):
+    pass
+
+
+class ScraperClient:
+    """
+    Async client for the WebScraper. Scrapes run on a dedicated thread pool with a fixed budget, so a slow scrape never
+    blocks the event loop, and concurrent requests on one worker scrape in parallel instead of one after another.
+
+    Each call is bounded by a timeout. If the awaiting task is cancelled or times out, it is released immediately,
+    while the underlying invocation finishes in the background and its result is discarded. The invocation keeps its
+    slot until its thread is free again, so abandoned invocations never take up the whole executor, leaving new scrapes
+    to time out in its queue without ever running. New scrapes wait for a slot instead.
+    """
+
+    def __init__(self, transport: ScraperTransport, max_concurrency: int = 8, timeout: float = 60):
+        self.transport = transport
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='scraper')
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.in_flight = 0              # Invocations holding a slot, including abandoned ones still running.
+
+    @classmethod
+    def from_env(cls) -> 'ScraperClient':
+        """ Builds a client from the SCRAPER_TRANSPORT ('lambda', 'local' or 'http', which posts to SCRAPER_URL),
+        SCRAPER_MAX_CONCURRENCY and SCRAPER_TIMEOUT environment variables."""
+        max_concurrency = int(os.environ.get('SCRAPER_MAX_CONCURRENCY', 8))
+        timeout = float(os.environ.get('SCRAPER_TIMEOUT', 60))
+        transport_name = os.environ.get('SCRAPER_TRANSPORT', 'lambda').lower()
+
+        if transport_name == 'local':
+            transport = LocalTransport()
+        elif transport_name == 'lambda':
+            transport = LambdaTransport(timeout=timeout, max_pool_connections=max_concurrency)
+        elif transport_name == 'http':
+            if not os.environ.get('SCRAPER_URL'):
+                raise ValueError("SCRAPER_URL must be set when SCRAPER_TRANSPORT is 'http'.")
+            transport = HttpTransport(os.environ['SCRAPER_URL'], timeout=timeout)
+        else:
+            raise ValueError(f"Invalid SCRAPER_TRANSPORT: {transport_name}. "
+                             f"Expected one of: 'lambda', 'local', 'http'.")
+        return cls(transport, max_concurrency=max_concurrency, timeout=timeout)
+
+    async def scrape(self, url: str, timeout: Optional[float] = None, **options) -> dict:
+        """
+        Scrapes a URL and returns the decoded response body of the WebScraper.
+
+        :param url: The URL to scrape.
+        :param timeout: Seconds before giving up. Defaults to the client's timeout.
+        :param options: Any additional fields for the payload, e.g. proxy=True.
+        :return: The response body as a dict, containing at least 'site_text'.
+        """
+        payload = {"url": url, **options}
+        timeout = self.timeout if timeout is None else timeout
+
+        loop = asyncio.get_running_loop()
+        await self._semaphore.acquire()
+        self.in_flight += 1
+        try:
+            invocation = self._executor.submit(self.transport.invoke, payload)
+        except BaseException:
+            self._release()
+            raise
+        # The slot is given back once the thread is done, not when we stop waiting for it.
+        invocation.add_done_callback(lambda _: self._release_threadsafe(loop))
+        try:
+            response = await asyncio.wait_for(asyncio.wrap_future(invocation), timeout)
+        except asyncio.TimeoutError:
+            raise ScraperTimeoutError(f"Scraping {url} timed out after {timeout:g} seconds.")
+
+        body = response['body']
+        return json.loads(body) if isinstance(body, str) else body
+
+    def _release(self) -> None:
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    def _release_threadsafe(self, loop: asyncio.AbstractEventLoop) -> None:
+        try:
+            loop.call_soon_threadsafe(self._release)
+        except RuntimeError:
+            pass    # The loop is closed, and nobody is left waiting for a slot.
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
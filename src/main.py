@@ -1,30 +1,71 @@
+import StartupProfiler   # First, so it can time the imports below when STARTUP_PROFILE is set.
+
 import asyncio
 import json
 import time
-import uvicorn
 import os
 
-from fastapi import FastAPI, HTTPException, Body
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Body, Request, Response
 from fastapi.responses import ORJSONResponse, StreamingResponse
 from APIhandler import RequestHandler, router
+from BatchHandler import BatchHandler
+from ClientRegistry import ClientRegistry, set_registry
+import OpenAIClient
 
-from utils import QueryRequest
+from utils import QueryRequest, BatchRequest
 from utils.logger import get_logger
-
-app = FastAPI(title="AI-Campaign-Manager")
+from utils import metrics
+from utils.tracing import tracer
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Creates the pooled OpenAI and WebScraper clients once at startup, and closes them again at shutdown."""
+    with StartupProfiler.step('client_registry'):
+        registry = ClientRegistry.from_env()
+    set_registry(registry)
+    app.state.registry = registry
+    with StartupProfiler.step('prompts'):
+        OpenAIClient.prompts.load()
+    StartupProfiler.ready(logger)
+    yield
+    await registry.close()
+    set_registry(None)
+
+
+app = FastAPI(title="AI-Campaign-Manager", lifespan=lifespan)
 app.include_router(router)
 
 logger = get_logger(__name__)
 logger.info("API is starting up...")
 logger.info(f"Currently in directory: \n {os.path.dirname(__file__)}")
 
+
+class FirstRequestTimer:
+    """ ASGI middleware, reporting when the first request has been answered in full. Only used when profiling."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        await self.app(scope, receive, send)
+        if scope["type"] == "http":
+            StartupProfiler.first_request(logger)
+
+
+if StartupProfiler.PROFILE:
+    app.add_middleware(FirstRequestTimer)
+
+
 # Note: run this command for testing:
 # curl --location 'http://localhost:8080/streaming' --header 'Content-Type: application/json' --data '{ "url": "https://www.unboxboardom.com", "mail_type": "reject"}'
 
 
 @app.post("/buffered", response_class=ORJSONResponse)
-async def buffered_handler(request_body: QueryRequest = Body(None)):
-    """Handler for parsing requests to the '/buffered' endpoint.
+async def buffered_handler(http_request: Request, response: Response, request_body: QueryRequest = Body(None)):
+    """Handler for parsing requests to the '/buffered' endpoint. The 'X-Cache' header of the response tells whether
+    the result came from the result cache: HIT, STALE (served, and refreshed in the background), MISS or BYPASS.
 
     :param request_body: The body of the request. Takes a JSON object containing the request parameters: URL,
         mail_type and customer_campaign.
@@ -35,9 +76,11 @@ async def buffered_handler(request_body: QueryRequest = Body(None)):
 
         flag1 = time.perf_counter()
 
-        handle = RequestHandler(request.model_dump(mode='json'))
+        handle = RequestHandler(request.model_dump(mode='json'), http_request.app.state.registry)
 
-        result = await handle.fastapi_handler_buffered()
+        with metrics.track_request('buffered'), tracer.trace('POST /buffered', url=handle.body.get('url')):
+            result = await handle.fastapi_handler_buffered()
+        response.headers['X-Cache'] = handle.cache_status
 
         flag2 = time.perf_counter()
 
@@ -45,13 +88,15 @@ async def buffered_handler(request_body: QueryRequest = Body(None)):
         logger.info(f"Entire process was executed in {flag2 - flag1:.2f} seconds.")
 
         return result
+    except HTTPException:
+        raise   # Keep the status of the handler, e.g. 504 when the deadline passed.
     except Exception as e:
         logger.error(f"An error occurred: \n{str(e)}\n")
         raise HTTPException(status_code=500, detail=f"Internal Server Error\n {e}")
 
 
 @app.post("/streaming", response_class=StreamingResponse)
-async def streaming_handler(request_body: QueryRequest = Body(None)):
+async def streaming_handler(http_request: Request, request_body: QueryRequest = Body(None)):
     """Handler for parsing requests to the '/streaming' endpoint.
 
     :param request_body: The body of the request. Takes a JSON object containing the request parameters: URL,
@@ -61,18 +106,36 @@ async def streaming_handler(request_body: QueryRequest = Body(None)):
     logger.info(f"Received request: \n{request_body}\n")
     try:
         request = request_body
-        flag1 = time.perf_counter()
 
         logger.info(f"Processed request: \n{request}\n")
-        handle = RequestHandler(request.model_dump(mode='json'))
+        handle = RequestHandler(request.model_dump(mode='json'), http_request.app.state.registry)
+
+        # The stream is timed from start to its last chunk, which is logged once the response has been sent.
+        media_type = "application/x-ndjson" if handle.stream_events else "text/event-stream"
+        stream = tracer.trace_stream('POST /streaming', handle.fastapi_handler_stream(http_request),
+                                     url=handle.body.get('url'))
+        stream = metrics.track_stream('streaming', stream, logger)
+        return StreamingResponse(stream, media_type=media_type)
+    except Exception as e:
+        logger.error(f"An error occurred: \n{str(e)}\n")
+        raise HTTPException(status_code=500, detail=f"Internal Server Error\n {e}")
 
-        flag2 = time.perf_counter()
 
-        # Calculate performance and return finished campaign and/or message templates.
-        logger.info(f"Entire process was executed in {flag2 - flag1:.2f} seconds.")
+@app.post("/batch", response_class=StreamingResponse)
+async def batch_handler(http_request: Request, request_body: BatchRequest = Body(None)):
+    """Handler for parsing requests to the '/batch' endpoint.
+
+    :param request_body: The body of the request. Takes a JSON object with a list of 'items', each containing the
+        same parameters as a request to '/buffered', and an optional 'concurrency'.
+    :returns: One JSON object per line for each item, in the order they finish, tagged with the item's index."""
 
-        # return await handle.fastapi_handler_stream()
-        return StreamingResponse(handle.fastapi_handler_stream(), media_type="text/event-stream")
+    logger.info(f"Received batch request with {len(request_body.items)} items.")
+    try:
+        items = [item.model_dump(mode='json') for item in request_body.items]
+        handle = BatchHandler(items, http_request.app.state.registry, request_body.concurrency)
+
+        stream = tracer.trace_stream('POST /batch', handle.run(), items=len(items))
+        return StreamingResponse(metrics.track_stream('batch', stream), media_type="application/x-ndjson")
     except Exception as e:
         logger.error(f"An error occurred: \n{str(e)}\n")
         raise HTTPException(status_code=500, detail=f"Internal Server Error\n {e}")
@@ -103,4 +166,6 @@ async def multi_response():
         raise HTTPException(status_code=500, detail=f"Internal Server Error\n {e}")
 
 if __name__ == "__main__":
+    import uvicorn      # Only needed when serving, not when the app is imported, e.g. by another server or a tool.
+
     uvicorn.run(app, host="0.0.0.0", port=int(os.environ.get("PORT", "8080")), log_level="info")
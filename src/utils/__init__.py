@@ -1,5 +1,5 @@
 from pydantic import BaseModel, HttpUrl, model_validator, Field, field_validator
-from typing import Optional, Literal, Any
+from typing import Optional, Literal, Any, List
 from typing_extensions import Self
 
 languages = {"en": "English", "es": "Español", "fr": "Français", "de": "Deutsch", "it": "Italiano",
@@ -17,6 +17,15 @@ class QueryRequest(BaseModel):
                                                                "campaign, put it here.")
     lang: Optional[str] = Field("en", max_length=2, validate_default=True,
                                 description="The language that you would like your affiliate brief or mail in.")
+    force_refresh: Optional[bool] = Field(False, description="Skip any cached results and scrape/generate "
+                                                             "everything from scratch.")
+    languages: Optional[List[str]] = Field(None, min_length=1, max_length=len(languages),
+                                           description="Generate the brief and mail in several languages at once, "
+                                                       "as two-letter abbreviations. The website is scraped and "
+                                                       "summarized once, and the results are keyed by language.")
+    stream_events: Optional[bool] = Field(False, description="Only for '/streaming'. Stream newline delimited JSON "
+                                                             "events, with the campaign split into sections, instead "
+                                                             "of plain text.")
 
     # Pydantic decorator for validating models.
     # See https://docs.pydantic.dev/latest/concepts/validators/#model-validators
@@ -77,3 +86,21 @@ class QueryRequest(BaseModel):
             else:
                 language_val = languages[language.lower()]
                 return language_val
+
+    @field_validator('languages', mode='after')
+    @classmethod
+    def validate_languages(cls, codes: Optional[List[str]]) -> Optional[List[str]]:
+        if codes is None:
+            return codes
+        unsupported = [code for code in codes if code.lower() not in languages]
+        if unsupported:
+            raise ValueError(f"Unsupported languages: {unsupported}, Please try others.\n")
+        return list(dict.fromkeys(code.lower() for code in codes))     # Without duplicates, in the given order.
+
+
+class BatchRequest(BaseModel):
+    items: List[QueryRequest] = Field(..., min_length=1, max_length=100,
+                                      description="The requests to process. Each item takes the same parameters "
+                                                  "as a request to '/buffered'.")
+    concurrency: Optional[int] = Field(None, ge=1, le=16, description="How many items to process at the same "
+                                                                      "time. Defaults to BATCH_CONCURRENCY.")
@@ -0,0 +1,251 @@
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import threading
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Optional
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Lambda only allows writing to /tmp, so that is where the on-disk tier lives unless told otherwise.
+CACHE_DIR = os.environ.get('CACHE_DIR', '/tmp/ai-campaign-manager')
+
+
+class TieredCache:
+    """
+    Two-tiered key/value cache. The first tier is an in-memory LRU, bounded by both entry count and size.
+    The second tier is a local SQLite file, which survives restarts of the process (and warm Lambda containers).
+
+    Values must be JSON serializable. Every entry carries the time it was stored, and is treated as missing once it
+    is older than the TTL. Hits, misses and evictions are counted per tier, see ``stats()``.
+
+    From async code, use the ``aget``/``aget_entry``/``aset``/``adelete`` variants. They serve memory hits right away,
+    and run the SQLite reads and writes on the cache's own single thread executor, never on the event loop.
+    """
+
+    def __init__(self, name: str, ttl: float = 3600, max_entries: int = 256, max_bytes: int = 32 * 1024 * 1024,
+                 disk: bool = True, disk_max_entries: int = 4096, path: Optional[str] = None):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.disk_max_entries = disk_max_entries
+
+        self._memory = OrderedDict()    # key -> (value, stored_at, size). Most recently used entries last.
+        self._memory_bytes = 0
+        self._lock = threading.Lock()         # Guards the memory tier and the counters.
+        self._disk_lock = threading.Lock()    # Guards the SQLite connection, never held along with the lock above.
+        self._counters = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'expired': 0,
+                          'memory_evictions': 0, 'disk_evictions': 0, 'writes': 0}
+
+        self._db = None
+        self._executor = None
+        if disk:
+            self.path = path or os.path.join(CACHE_DIR, f"{name}.sqlite3")
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                                 "stored_at REAL NOT NULL, accessed_at REAL NOT NULL)")
+            except sqlite3.Error as e:
+                # The disk tier is only an optimization, so fall back to memory only rather than failing requests.
+                logger.error(f"Could not open disk cache at {self.path}, using memory only: {e}")
+                self._db = None
+        if self._db is not None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'cache-{name}')
+
+    @classmethod
+    def from_env(cls, name: str, prefix: str, ttl: float, max_entries: int = 256,
+                 max_bytes: int = 32 * 1024 * 1024, disk: bool = True) -> 'TieredCache':
+        """ Builds a cache, where the given defaults can be overridden with environment variables named
+        <PREFIX>_TTL, <PREFIX>_MAX_ENTRIES, <PREFIX>_MAX_BYTES and <PREFIX>_DISK ('TRUE' or 'FALSE')."""
+        default_disk = 'TRUE' if disk else 'FALSE'
+        return cls(name,
+                   ttl=float(os.environ.get(f"{prefix}_TTL", ttl)),
+                   max_entries=int(os.environ.get(f"{prefix}_MAX_ENTRIES", max_entries)),
+                   max_bytes=int(os.environ.get(f"{prefix}_MAX_BYTES", max_bytes)),
+                   disk=os.environ.get(f"{prefix}_DISK", default_disk) == 'TRUE')
+
+    def get(self, key: str) -> Optional[Any]:
+        """ Returns the cached value for a key, or None if it is missing or has expired."""
+        entry = self.get_entry(key)
+        return entry[0] if entry is not None else None
+
+    def get_entry(self, key: str) -> Optional[tuple[Any, float]]:
+        """ Returns the cached value for a key along with the time it was stored, or None if missing/expired."""
+        entry = self._get_memory(key)
+        if entry is not None:
+            return entry
+        return self._get_disk(key)
+
+    def set(self, key: str, value: Any) -> None:
+        """ Stores a value in both tiers, evicting the least recently used entries if the cache is full."""
+        raw, now = self._set_memory(key, value)
+        self._write_disk(key, raw, now)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._drop_memory(key)
+        self._delete_disk(key)
+
+    async def aget(self, key: str) -> Optional[Any]:
+        entry = await self.aget_entry(key)
+        return entry[0] if entry is not None else None
+
+    async def aget_entry(self, key: str) -> Optional[tuple[Any, float]]:
+        entry = self._get_memory(key)
+        if entry is not None:
+            return entry
+        return await self._run_disk(self._get_disk, key)
+
+    async def aset(self, key: str, value: Any) -> None:
+        raw, now = self._set_memory(key, value)
+        await self._run_disk(self._write_disk, key, raw, now)
+
+    async def adelete(self, key: str) -> None:
+        with self._lock:
+            self._drop_memory(key)
+        await self._run_disk(self._delete_disk, key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counters)
+            stats['memory_entries'] = len(self._memory)
+            stats['memory_bytes'] = self._memory_bytes
+        stats['disk_entries'] = self._count_disk()
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_ratio'] = round((stats['memory_hits'] + stats['disk_hits']) / lookups, 3) if lookups else 0.0
+        return stats
+
+    async def astats(self) -> dict:
+        return await self._run_disk(self.stats)
+
+    def _get_memory(self, key: str) -> Optional[tuple[Any, float]]:
+        """ Looks a key up in the memory tier only. A miss is counted once the disk tier has been checked too."""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                if self._db is None:
+                    self._counters['misses'] += 1
+                return None
+            value, stored_at, size = entry
+            if time.time() - stored_at <= self.ttl:
+                self._memory.move_to_end(key)
+                self._counters['memory_hits'] += 1
+                return value, stored_at
+            self._drop_memory(key)
+            self._counters['expired'] += 1
+            if self._db is None:
+                self._counters['misses'] += 1
+            return None
+
+    def _get_disk(self, key: str) -> Optional[tuple[Any, float]]:
+        if self._db is None:
+            return None
+        now = time.time()
+        row = self._read_disk(key)
+        if row is not None:
+            raw, stored_at = row
+            if now - stored_at <= self.ttl:
+                value = json.loads(raw)
+                self._touch_disk(key, now)
+                with self._lock:
+                    current = self._memory.get(key)
+                    if current is None or current[1] < stored_at:   # Unless a newer value was set meanwhile.
+                        self._store_memory(key, value, stored_at, len(raw))     # Promote to the memory tier.
+                    self._counters['disk_hits'] += 1
+                return value, stored_at
+            self._delete_disk(key)
+            with self._lock:
+                self._counters['expired'] += 1
+        with self._lock:
+            self._counters['misses'] += 1
+        return None
+
+    def _set_memory(self, key: str, value: Any) -> tuple[str, float]:
+        raw = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self._counters['writes'] += 1
+            self._store_memory(key, value, now, len(raw))
+        return raw, now
+
+    async def _run_disk(self, function, *args):
+        if self._executor is None:
+            return function(*args)      # Memory only, nothing to wait for.
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    # The two methods below expect the lock to be held by the caller.
+    def _store_memory(self, key: str, value: Any, stored_at: float, size: int) -> None:
+        if size > self.max_bytes:
+            return      # A single entry larger than the whole memory tier only lives on disk.
+        self._drop_memory(key)
+        self._memory[key] = (value, stored_at, size)
+        self._memory_bytes += size
+        while len(self._memory) > self.max_entries or self._memory_bytes > self.max_bytes:
+            _, (_, _, evicted_size) = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted_size
+            self._counters['memory_evictions'] += 1
+
+    def _drop_memory(self, key: str) -> None:
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self._memory_bytes -= entry[2]
+
+    def _read_disk(self, key: str) -> Optional[tuple[str, float]]:
+        if self._db is None:
+            return None
+        try:
+            with self._disk_lock:
+                return self._db.execute("SELECT value, stored_at FROM entries WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"Disk cache '{self.name}' read failed: {e}")
+            return None
+
+    def _touch_disk(self, key: str, now: float) -> None:
+        try:
+            with self._disk_lock:
+                self._db.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+        except sqlite3.Error as e:
+            logger.error(f"Disk cache '{self.name}' update failed: {e}")
+
+    def _write_disk(self, key: str, raw: str, now: float) -> None:
+        if self._db is None:
+            return
+        try:
+            with self._disk_lock:
+                self._db.execute("INSERT OR REPLACE INTO entries (key, value, stored_at, accessed_at) "
+                                 "VALUES (?, ?, ?, ?)", (key, raw, now, now))
+                # Drop everything that has expired, then the least recently used entries beyond the size limit.
+                expired = self._db.execute("DELETE FROM entries WHERE stored_at < ?", (now - self.ttl,)).rowcount
+                overflow = self._db.execute("DELETE FROM entries WHERE key IN (SELECT key FROM entries "
+                                            "ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                                            (self.disk_max_entries,)).rowcount
+            with self._lock:
+                self._counters['disk_evictions'] += max(expired, 0) + max(overflow, 0)
+        except sqlite3.Error as e:
+            logger.error(f"Disk cache '{self.name}' write failed: {e}")
+
+    def _delete_disk(self, key: str) -> None:
+        if self._db is None:
+            return
+        try:
+            with self._disk_lock:
+                self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+        except sqlite3.Error as e:
+            logger.error(f"Disk cache '{self.name}' delete failed: {e}")
+
+    def _count_disk(self) -> int:
+        if self._db is None:
+            return 0
+        try:
+            with self._disk_lock:
+                return self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        except sqlite3.Error:
+            return 0
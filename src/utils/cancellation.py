@@ -0,0 +1,79 @@
+import json
+
+from typing import Iterable, Optional
+from utils.pipeline import Pipeline
+from utils.tokens import estimate_tokens
+
+
+class CancellationStats:
+    """
+    Keeps track of what early cancellation saves. Every pipeline that ends is recorded: stages that finished update a
+    running average of their duration and output tokens, and stages that were cancelled (or never started) because
+    the client disconnected or the deadline passed count as saved, estimated from those averages.
+
+    Tokens are estimated from the text the stages produced, and only counted for the stages calling the model.
+    """
+
+    def __init__(self, token_stages: Iterable[str] = (), smoothing: float = 0.1):
+        self.token_stages = set(token_stages)
+        self.smoothing = smoothing
+        self.averages = {}              # Stage name -> [seconds, output tokens].
+        self.cancelled = {}             # Reason -> pipelines cancelled.
+        self.stages_cancelled = 0
+        self.seconds_saved = 0.0
+        self.tokens_saved = 0
+
+    def record(self, pipeline: Pipeline, reason: Optional[str] = None, progress: Optional[dict] = None) -> None:
+        """ Records a pipeline once it has ended.
+
+        :param pipeline: The pipeline, after it finished or was cancelled.
+        :param reason: Why the pipeline was cut short, e.g. 'disconnect' or 'deadline'. None if it ran to completion.
+        :param progress: Output tokens already produced by cancelled stages, e.g. the streamed part of a campaign."""
+
+        timings, outcomes, results = pipeline.timings(), pipeline.outcomes(), pipeline.results()
+        for name, result in results.items():
+            tokens = self._tokens(result) if name in self.token_stages else 0
+            self._observe(name, timings[name]['seconds'] or 0.0, tokens)
+
+        if reason is None:
+            return
+        unfinished = [name for name, outcome in outcomes.items() if outcome in ('cancelled', 'timed_out', 'pending')]
+        if not unfinished:
+            return
+        self.cancelled[reason] = self.cancelled.get(reason, 0) + 1
+        for name in unfinished:
+            self.stages_cancelled += 1
+            average = self.averages.get(name)
+            if average is None:
+                continue                # Never seen this stage finish, so there's nothing to estimate from.
+            average_seconds, average_tokens = average
+            timing = timings.get(name)
+            if timing is None:
+                ran = 0.0               # Never started.
+            else:
+                ran = timing['seconds'] if timing['seconds'] is not None else pipeline.elapsed() - timing['start']
+            self.seconds_saved += max(average_seconds - ran, 0.0)
+            if name in self.token_stages:
+                produced = (progress or {}).get(name)
+                if produced is None:    # Assume tokens are produced at an even pace.
+                    produced = average_tokens * min(ran / average_seconds, 1.0) if average_seconds else 0
+                self.tokens_saved += int(max(average_tokens - produced, 0))
+
+    def _observe(self, name: str, seconds: float, tokens: int) -> None:
+        average = self.averages.get(name)
+        if average is None:
+            self.averages[name] = [seconds, tokens]
+        else:
+            average[0] += self.smoothing * (seconds - average[0])
+            average[1] += self.smoothing * (tokens - average[1])
+
+    def _tokens(self, result) -> int:
+        if isinstance(result, str):
+            return estimate_tokens(result)
+        return estimate_tokens(json.dumps(result, ensure_ascii=False))
+
+    def stats(self) -> dict:
+        return {"cancelled": dict(self.cancelled), "stages_cancelled": self.stages_cancelled,
+                "seconds_saved": round(self.seconds_saved, 2), "tokens_saved": self.tokens_saved,
+                "averages": {name: {"seconds": round(seconds, 2), "tokens": int(tokens)}
+                             for name, (seconds, tokens) in self.averages.items()}}
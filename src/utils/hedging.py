@@ -0,0 +1,167 @@
+import os
+import time
+import asyncio
+import collections
+
+from typing import Any, Awaitable, Callable, Optional
+from utils.logger import get_logger
+from utils import metrics
+
+logger = get_logger(__name__)
+
+# Identifiers of the completions to hedge, e.g. 'buffered_campaign,platform'. Empty, the default, turns hedging off.
+HEDGE_STAGES = [stage.strip() for stage in os.environ.get('HEDGE_STAGES', '').split(',') if stage.strip()]
+# A second request is sent when the first has taken longer than this percentile of recent completions.
+HEDGE_PERCENTILE = float(os.environ.get('HEDGE_PERCENTILE', 0.95))
+# Model of the second request. Empty sends it to the same model as the first.
+HEDGE_FALLBACK_MODEL = os.environ.get('HEDGE_FALLBACK_MODEL', '')
+# Share of the recent calls of a stage that may be hedged, so a slow OpenAI doesn't double our traffic.
+HEDGE_BUDGET = float(os.environ.get('HEDGE_BUDGET', 0.05))
+# Completions to observe before hedging, and never hedge sooner than HEDGE_MIN_DELAY seconds.
+HEDGE_MIN_SAMPLES = int(os.environ.get('HEDGE_MIN_SAMPLES', 20))
+HEDGE_MIN_DELAY = float(os.environ.get('HEDGE_MIN_DELAY', 1.0))
+HEDGE_WINDOW = int(os.environ.get('HEDGE_WINDOW', 200))
+
+
+class StageHedger:
+    """
+    Latency history and hedging budget of one stage. The delay before hedging is a percentile of the latencies of the
+    last HEDGE_WINDOW calls. A call that lost the race is recorded with the time it had taken when it was cancelled,
+    so the percentile doesn't drift down as hedging cuts off the slow calls it is based on.
+    """
+
+    def __init__(self, stage: str, percentile: float, budget: float, window: int, min_samples: int,
+                 min_delay: float):
+        self.stage = stage
+        self.percentile = percentile
+        self.budget = budget
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.latencies = collections.deque(maxlen=window)
+        self.recent = collections.deque(maxlen=window)     # Whether each of the recent calls was hedged.
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.over_budget = 0
+
+    def delay(self) -> Optional[float]:
+        """ Seconds to wait for the first request before hedging, or None while there are too few samples."""
+        if not self.latencies or len(self.latencies) < self.min_samples:
+            return None
+        ordered = sorted(self.latencies)
+        return max(ordered[min(int(self.percentile * len(ordered)), len(ordered) - 1)], self.min_delay)
+
+    def within_budget(self) -> bool:
+        return sum(self.recent) < max(1.0, self.budget * len(self.recent))
+
+    def stats(self) -> dict:
+        delay = self.delay()
+        return {"calls": self.calls, "hedged": self.hedged, "hedge_wins": self.hedge_wins,
+                "over_budget": self.over_budget, "delay_seconds": round(delay, 3) if delay is not None else None}
+
+
+class Hedger:
+    """
+    Runs completions of the configured stages as hedged requests: when the first request hasn't answered within the
+    stage's delay, a second one is sent, to the same or the fallback model. Whichever returns a valid result first
+    wins, and the other is cancelled. An attempt that fails (e.g. with invalid JSON) leaves the race to the other.
+    """
+
+    def __init__(self, stages: list, percentile: float = 0.95, fallback_model: str = '', budget: float = 0.05,
+                 window: int = 200, min_samples: int = 20, min_delay: float = 1.0):
+        self.fallback_model = fallback_model
+        self._stages = {stage: StageHedger(stage, percentile, budget, window, min_samples, min_delay)
+                        for stage in stages}
+
+    @classmethod
+    def from_env(cls) -> 'Hedger':
+        return cls(HEDGE_STAGES, HEDGE_PERCENTILE, HEDGE_FALLBACK_MODEL, HEDGE_BUDGET, HEDGE_WINDOW,
+                   HEDGE_MIN_SAMPLES, HEDGE_MIN_DELAY)
+
+    def enabled(self, stage: str) -> bool:
+        return stage in self._stages
+
+    async def run(self, stage: str, model: str, attempt: Callable[[str], Awaitable[Any]],
+                  loser_tokens: Callable[[Any], int] = lambda result: 0, estimated_tokens: int = 0,
+                  busy: Callable[[str], bool] = lambda model: False) -> tuple[Any, str]:
+        """
+        Calls attempt(model), hedged if the stage is configured for it. Returns the result and the model it came from.
+
+        :param loser_tokens: Tokens used by an attempt that finished but lost the race, from its result.
+        :param estimated_tokens: Prompt tokens spent by an attempt cancelled in flight, a lower bound of its cost.
+        :param busy: Whether a model is held back by its rate limiter, in which case hedging would only queue.
+        """
+        hedger = self._stages.get(stage)
+        flag1 = time.perf_counter()
+        try:
+            if hedger is None:
+                return await attempt(model), model
+            return await self._race(hedger, model, attempt, loser_tokens, estimated_tokens, busy)
+        finally:
+            metrics.OPENAI_COMPLETION_SECONDS.labels(stage, 'on' if hedger else 'off').observe(
+                time.perf_counter() - flag1)
+
+    async def _race(self, hedger: StageHedger, model: str, attempt, loser_tokens, estimated_tokens, busy):
+        hedger.calls += 1
+        flag1 = time.perf_counter()
+        primary = asyncio.ensure_future(attempt(model))
+        delay = hedger.delay()
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done:
+                hedger.recent.append(False)
+                result = await primary
+                hedger.latencies.append(time.perf_counter() - flag1)
+                return result, model
+        except BaseException:
+            primary.cancel()
+            raise
+
+        hedge_model = self.fallback_model or model
+        if not hedger.within_budget() or busy(hedge_model):
+            hedger.over_budget += 1
+            hedger.recent.append(False)
+            metrics.HEDGES.labels(hedger.stage, 'skipped').inc()
+            result = await primary
+            hedger.latencies.append(time.perf_counter() - flag1)
+            return result, model
+
+        hedger.hedged += 1
+        hedger.recent.append(True)
+        metrics.HEDGES.labels(hedger.stage, 'sent').inc()
+        logger.info(f"Hedging {hedger.stage}: no answer from {model} after {delay:.2f} seconds, "
+                    f"sending a second request to {hedge_model}.")
+        hedge = asyncio.ensure_future(attempt(hedge_model))
+        models = {primary: model, hedge: hedge_model}
+        pending, error = {primary, hedge}, None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((task for task in done if not task.exception()), None)
+                if winner is None:
+                    error = error or next(iter(done)).exception()
+                    continue
+                elapsed = time.perf_counter() - flag1
+                hedger.latencies.append(elapsed)    # Also a lower bound of the loser's latency.
+                if winner is hedge:
+                    hedger.hedge_wins += 1
+                metrics.HEDGES.labels(hedger.stage, 'won' if winner is hedge else 'lost').inc()
+                loser = primary if winner is hedge else hedge
+                if not loser.done():
+                    extra = estimated_tokens            # Cancelled in flight, its prompt at least was paid for.
+                elif loser.exception() is None:
+                    extra = loser_tokens(loser.result())    # Finished at the same time, its usage is known.
+                else:
+                    extra = 0
+                metrics.HEDGE_EXTRA_TOKENS.labels(hedger.stage, models[loser]).inc(extra)
+                return winner.result(), models[winner]
+            raise error
+        finally:
+            for task in (primary, hedge):
+                task.cancel()
+
+    def stats(self) -> dict:
+        return {stage: hedger.stats() for stage, hedger in self._stages.items()}
+
+
+hedger = Hedger.from_env()
@@ -1,18 +1,115 @@
-import logging
+import os
 import sys
+import queue
+import atexit
+import logging
+import threading
+
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional, TextIO
+
+# Level of our own loggers. Third party loggers keep the default of WARNING, so we don't log every HTTP request.
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+# Longer messages, e.g. scraped pages or completions logged at DEBUG, are cut off at this many characters. 0 disables.
+LOG_MAX_CHARS = int(os.environ.get('LOG_MAX_CHARS', 2000))
+# Records waiting to be written. When the queue is full, e.g. because stdout is blocked, new records are dropped
+# rather than blocking the event loop.
+LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))
+LOG_FORMAT = "[%(levelname)s] %(name)s: %(message)s"
+
+
+class TruncatingQueueHandler(QueueHandler):
+    """
+    Puts records on a queue, to be written by a listener on a background thread, so logging never waits for stdout.
+    The message is formatted here, on the calling thread, and cut off at 'max_chars', so large payloads neither sit in
+    the queue nor end up in the log in full.
+    """
+
+    def __init__(self, log_queue: queue.Queue, max_chars: int = LOG_MAX_CHARS):
+        super().__init__(log_queue)
+        self.max_chars = max_chars
+        self.truncated = 0
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = super().prepare(record)
+        if self.max_chars and len(record.msg) > self.max_chars:
+            self.truncated += 1
+            record.msg = f"{record.msg[:self.max_chars]}... [{len(record.msg) - self.max_chars} more characters]"
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class DrainingQueueListener(QueueListener):
+    """ Waits for room in a full queue at shutdown, rather than failing to stop."""
+
+    def enqueue_sentinel(self) -> None:
+        self.queue.put(self._sentinel)
+
+
+_lock = threading.Lock()
+_handler: Optional[TruncatingQueueHandler] = None
+_listener: Optional[DrainingQueueListener] = None
+
+
+def configure(stream: TextIO = None, max_chars: int = None, queue_size: int = None) -> TruncatingQueueHandler:
+    """
+    Sets up the logging pipeline: a queue handler on the root logger, and a listener thread writing the records to
+    'stream' (stdout by default). Replaces any pipeline set up earlier, after writing out what it had queued.
+    :returns: The queue handler, whose counters tell how many records were truncated or dropped.
+    """
+    with _lock:
+        return _install(stream, max_chars, queue_size)
+
+
+def _install(stream: TextIO = None, max_chars: int = None, queue_size: int = None) -> TruncatingQueueHandler:
+    global _handler, _listener
+
+    shutdown()
+    stream_handler = logging.StreamHandler(stream or sys.stdout)
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    log_queue = queue.Queue(LOG_QUEUE_SIZE if queue_size is None else queue_size)
+    _handler = TruncatingQueueHandler(log_queue, LOG_MAX_CHARS if max_chars is None else max_chars)
+    _listener = DrainingQueueListener(log_queue, stream_handler, respect_handler_level=True)
+    logging.getLogger().addHandler(_handler)
+    _listener.start()
+    return _handler
+
+
+def shutdown() -> None:
+    """ Writes out the queued records and removes the pipeline. Also runs at exit."""
+    global _handler, _listener
+
+    if _listener is not None:
+        _listener.stop()
+        logging.getLogger().removeHandler(_handler)
+        _handler, _listener = None, None
+
+
+atexit.register(shutdown)
+
+
+def stats() -> dict:
+    if _handler is None:
+        return {}
+    return {"queued": _handler.queue.qsize(), "truncated": _handler.truncated, "dropped": _handler.dropped}
 
 
-# Note: This method should probably be moved into a singular file along with the contents of 'monitor.py'
-# Doesn't make sense to have an entire file for just this method.
 def get_logger(name):
     """ Logger method to be called across all files, to log specific events.
+    The logging pipeline is set up on the first call, and shared by every logger.
     :param name: The name of the current file. Usually '__name__' suffices.
     :returns: A Logger object."""
 
+    with _lock:
+        if _handler is None:
+            _install()
     logger = logging.getLogger(name)
-    logger.setLevel(logging.DEBUG)
-    stream_handler = logging.StreamHandler(sys.stdout)
-    log_formatter = logging.Formatter("[%(levelname)s] %(name)s: %(message)s")
-    stream_handler.setFormatter(log_formatter)
-    logger.addHandler(stream_handler)
+    logger.setLevel(LOG_LEVEL)
     return logger
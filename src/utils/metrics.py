@@ -0,0 +1,269 @@
+import os
+import json
+import time
+import bisect
+import asyncio
+import logging
+import threading
+
+from contextlib import aclosing, contextmanager
+from typing import AsyncGenerator, Iterable, Optional
+
+# Upper bounds in seconds. Covers everything from a cache hit to a slow scrape followed by a long completion.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+# USD per million tokens (input, output), from OpenAI's price list. Override with OPENAI_PRICES, e.g.
+# '{"gpt-4o": [2.5, 10]}'. Models without a price still have their tokens counted.
+MODEL_PRICES = {
+    "gpt-4o": (5.00, 15.00),
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-3.5-turbo-0125": (0.50, 1.50),
+}
+MODEL_PRICES.update({model: tuple(prices)
+                     for model, prices in json.loads(os.environ.get('OPENAI_PRICES', '{}')).items()})
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        """ The child metric for a combination of label values. Keep a reference to it on hot paths."""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self._children.items()):
+            lines.extend(child.render(self.name, self.labelnames, values))
+        return lines
+
+
+class _Value:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def render(self, name: str, labelnames: tuple, values: tuple) -> list[str]:
+        return [f"{name}{_format_labels(labelnames, values)} {self.value:g}"]
+
+
+class _HistogramValue:
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)      # The last one counts everything above the largest bucket.
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def render(self, name: str, labelnames: tuple, values: tuple) -> list[str]:
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            cumulative += count
+            le = 'le="+Inf"' if bound == float('inf') else f'le="{bound:g}"'
+            lines.append(f"{name}_bucket{_format_labels(labelnames, values, le)} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(labelnames, values)} {self.sum:g}")
+        lines.append(f"{name}_count{_format_labels(labelnames, values)} {cumulative}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _Value()
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def _new_child(self):
+        return _Value()
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+
+class MetricsRegistry:
+    """
+    Minimal in-process metrics, rendered in the Prometheus text format. Recording is a dict lookup, a lock and an
+    addition (plus a bisect for histograms), so metrics stay on in production. Nothing is kept per request.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+
+    def counter(self, name: str, help_text: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name: str, help_text: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self._register(Gauge(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: Iterable[str] = (),
+                  buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def _register(self, metric: _Metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered.")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+REQUEST_SECONDS = registry.histogram('campaign_request_seconds', "Duration of requests, until the last byte "
+                                     "of the response.", ['endpoint', 'status'])
+FIRST_BYTE_SECONDS = registry.histogram('campaign_request_first_byte_seconds', "Time until the first chunk of "
+                                        "streamed responses.", ['endpoint'])
+IN_FLIGHT = registry.gauge('campaign_requests_in_flight', "Requests currently being processed.", ['endpoint'])
+STAGE_SECONDS = registry.histogram('campaign_stage_seconds', "Duration of pipeline stages.", ['stage', 'outcome'])
+OPENAI_REQUESTS = registry.counter('openai_requests_total', "Completions requested from OpenAI.",
+                                   ['model', 'identifier'])
+OPENAI_TOKENS = registry.counter('openai_tokens_total', "Tokens used with OpenAI, including streamed completions.",
+                                 ['model', 'identifier', 'kind'])
+OPENAI_COST = registry.counter('openai_cost_usd_total', "Estimated cost of OpenAI usage in USD, based on "
+                               "MODEL_PRICES.", ['model'])
+RATE_LIMIT_WAIT_SECONDS = registry.histogram('openai_rate_limit_wait_seconds', "Time completions waited for "
+                                             "the client side rate limiter.", ['model', 'priority'])
+OPENAI_RETRIES = registry.counter('openai_retries_total', "Completions retried after an error.", ['model', 'reason'])
+OPENAI_COMPLETION_SECONDS = registry.histogram('openai_completion_seconds', "Duration of buffered completions, "
+                                               "with or without hedging.", ['identifier', 'hedging'])
+HEDGES = registry.counter('openai_hedges_total', "Hedged completions, by whether the second request was sent, won or "
+                          "lost, or was skipped for the budget.", ['identifier', 'outcome'])
+HEDGE_EXTRA_TOKENS = registry.counter('openai_hedge_extra_tokens_total', "Tokens spent on the losing request of "
+                                      "hedged completions. Estimated prompt tokens when it was cancelled in flight.",
+                                      ['identifier', 'model'])
+SCRAPE_SECONDS = registry.histogram('scraper_seconds', "Duration of scrapes, as measured by the WebScraper, by "
+                                    "extraction path.", ['path'])
+COOKIE_SECONDS = registry.histogram('scraper_cookie_seconds', "Time scrapes in a browser spent on the cookie banner, "
+                                    "by outcome (clicked, none, timeout) and what found the button.",
+                                    ['outcome', 'source'])
+
+
+def record_usage(model: str, identifier: str, usage) -> None:
+    """ Counts the tokens and estimated cost of one completion, from the usage reported by OpenAI."""
+    OPENAI_REQUESTS.labels(model, identifier).inc()
+    if usage is None:
+        return
+    OPENAI_TOKENS.labels(model, identifier, 'prompt').inc(usage.prompt_tokens)
+    OPENAI_TOKENS.labels(model, identifier, 'completion').inc(usage.completion_tokens)
+    prices = MODEL_PRICES.get(model)
+    if prices is not None:
+        OPENAI_COST.labels(model).inc((usage.prompt_tokens * prices[0] + usage.completion_tokens * prices[1]) / 1e6)
+
+
+def record_scrape(body: dict) -> None:
+    """ Records the timings reported by the WebScraper for one scrape, including its cookie handling."""
+    if body.get('scrape_seconds') is not None:
+        SCRAPE_SECONDS.labels(body.get('extraction_path') or 'unknown').observe(body['scrape_seconds'])
+    cookie = body.get('cookie')
+    if cookie:
+        COOKIE_SECONDS.labels(cookie.get('outcome') or 'unknown', cookie.get('source') or 'none').observe(
+            cookie.get('seconds') or 0.0)
+
+
+def record_stages(timings: dict, outcomes: dict) -> None:
+    """ Records the duration of every stage of a pipeline that has started, see Pipeline.timings()."""
+    for stage, timing in timings.items():
+        if timing['seconds'] is not None:
+            STAGE_SECONDS.labels(stage, outcomes.get(stage, 'ok')).observe(timing['seconds'])
+
+
+@contextmanager
+def track_request(endpoint: str):
+    """ Times a buffered request, and counts it as in flight while it runs."""
+    in_flight = IN_FLIGHT.labels(endpoint)
+    in_flight.inc()
+    flag1, status = time.perf_counter(), 'ok'
+    try:
+        yield
+    except BaseException:
+        status = 'error'
+        raise
+    finally:
+        in_flight.dec()
+        REQUEST_SECONDS.labels(endpoint, status).observe(time.perf_counter() - flag1)
+
+
+async def track_stream(endpoint: str, stream: AsyncGenerator[str, None],
+                       logger: Optional[logging.Logger] = None) -> AsyncGenerator[str, None]:
+    """ Times a streamed response from start to the last chunk, instead of just until the response object is made.
+    Also records the time to the first chunk. The inner stream is closed along with this one, e.g. on a disconnect."""
+    in_flight = IN_FLIGHT.labels(endpoint)
+    in_flight.inc()
+    flag1, status, first = time.perf_counter(), 'ok', True
+    try:
+        async with aclosing(stream) as chunks:
+            async for chunk in chunks:
+                if first:
+                    FIRST_BYTE_SECONDS.labels(endpoint).observe(time.perf_counter() - flag1)
+                    first = False
+                yield chunk
+    except (GeneratorExit, asyncio.CancelledError):
+        status = 'cancelled'                    # The client went away.
+        raise
+    except BaseException:
+        status = 'error'
+        raise
+    finally:
+        in_flight.dec()
+        seconds = time.perf_counter() - flag1
+        REQUEST_SECONDS.labels(endpoint, status).observe(seconds)
+        if logger is not None:
+            logger.info(f"Entire process was executed in {seconds:.2f} seconds.")
@@ -0,0 +1,143 @@
+import time
+import asyncio
+
+from typing import Any, Awaitable, Callable, Iterable, Optional
+from utils import tracing
+
+
+class StageTimeoutError(TimeoutError):
+    """ Raised by a stage that didn't finish before the deadline of its pipeline."""
+
+
+class Stage:
+    """
+    A single step of a Pipeline. The function is called with the results of its dependencies as keyword arguments,
+    named after the stages they came from, e.g. Stage('campaign', make_campaign, deps=['summary']) calls
+    make_campaign(summary=...).
+    """
+
+    def __init__(self, name: str, func: Callable[..., Awaitable[Any]], deps: Iterable[str] = ()):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+
+
+class Pipeline:
+    """
+    Small dependency graph executor. Every stage starts as soon as all of its dependencies have finished, so
+    independent stages run concurrently, and a stage never waits for work it doesn't need.
+
+    If a stage fails, every stage depending on it fails with the same error, and run() cancels the remaining stages.
+    Start and end times of every stage are recorded, relative to the start of the pipeline.
+
+    With a deadline, every stage is cut off once the pipeline has been running for that many seconds, and fails with
+    a StageTimeoutError, as does every stage depending on it.
+    """
+
+    def __init__(self, stages: Iterable[Stage], deadline: Optional[float] = None):
+        self.stages = {}
+        for stage in stages:
+            missing = [dep for dep in stage.deps if dep not in self.stages]
+            if missing:
+                raise ValueError(f"Stage '{stage.name}' depends on unknown or later stages: {missing}")
+            self.stages[stage.name] = stage
+
+        self.deadline = deadline or None
+        self._tasks = {}
+        self._started_at = None
+        self._timings = {}
+
+    def start(self) -> None:
+        """ Schedules all stages. Results can then be awaited individually with result()."""
+        if self._tasks:
+            return
+        self._started_at = time.perf_counter()
+        for name, stage in self.stages.items():     # Stages are in dependency order, see __init__.
+            self._tasks[name] = asyncio.ensure_future(self._run_stage(stage))
+
+    async def result(self, name: str) -> Any:
+        """ Awaits the result of a single stage. Cancelling the caller doesn't cancel the stage."""
+        self.start()
+        return await asyncio.shield(self._tasks[name])
+
+    async def run(self) -> dict:
+        """ Runs every stage to completion and returns their results by name."""
+        self.start()
+        try:
+            await asyncio.gather(*self._tasks.values())
+        except BaseException:
+            self.cancel()
+            raise
+        return {name: task.result() for name, task in self._tasks.items()}
+
+    def on_done(self, name: str, callback: Callable[[], None]) -> None:
+        """ Calls back once a stage has finished, whether it succeeded, failed or was cancelled."""
+        self.start()
+        self._tasks[name].add_done_callback(lambda _: callback())
+
+    def cancel(self) -> None:
+        for task in self._tasks.values():
+            task.cancel()
+
+    def done(self) -> bool:
+        return bool(self._tasks) and all(task.done() for task in self._tasks.values())
+
+    def outcomes(self) -> dict:
+        """ How every stage ended: 'ok', 'failed', 'timed_out', 'cancelled', or 'pending' if it hasn't yet."""
+        outcomes = {}
+        for name in self.stages:
+            task = self._tasks.get(name)
+            if task is None or not task.done():
+                outcomes[name] = 'pending'
+            elif task.cancelled():
+                outcomes[name] = 'cancelled'
+            elif isinstance(task.exception(), StageTimeoutError):
+                outcomes[name] = 'timed_out'
+            else:
+                outcomes[name] = 'failed' if task.exception() is not None else 'ok'
+        return outcomes
+
+    def results(self) -> dict:
+        """ Results of the stages that finished successfully."""
+        return {name: self._tasks[name].result() for name, outcome in self.outcomes().items() if outcome == 'ok'}
+
+    def elapsed(self) -> float:
+        """ Seconds since the pipeline started."""
+        return time.perf_counter() - self._started_at if self._started_at is not None else 0.0
+
+    def timings(self) -> dict:
+        """ Start, end and duration in seconds of every stage that has started."""
+        return {name: {"start": round(start, 3), "end": round(end, 3) if end is not None else None,
+                       "seconds": round(end - start, 3) if end is not None else None}
+                for name, (start, end) in self._timings.items()}
+
+    def describe(self) -> str:
+        """ One line summary of the stage timings, for logging."""
+        return ", ".join(f"{name} {timing['start']:.2f}-{timing['end']:.2f}s"
+                         for name, timing in self.timings().items() if timing['end'] is not None)
+
+    async def _run_stage(self, stage: Stage) -> Any:
+        inputs = {dep: await asyncio.shield(self._tasks[dep]) for dep in stage.deps}
+        start = time.perf_counter() - self._started_at
+        self._timings[stage.name] = (start, None)
+        try:
+            with tracing.span(f"stage.{stage.name}"):
+                return await self._call_stage(stage, inputs, start)
+        finally:
+            self._timings[stage.name] = (start, time.perf_counter() - self._started_at)
+
+    async def _call_stage(self, stage: Stage, inputs: dict, start: float) -> Any:
+        if self.deadline is None:
+            return await stage.func(**inputs)
+        remaining = self.deadline - start
+        if remaining <= 0:
+            raise StageTimeoutError(f"Stage '{stage.name}' didn't start before the deadline of {self.deadline:g}s.")
+        try:
+            return await asyncio.wait_for(stage.func(**inputs), remaining)
+        except TimeoutError as e:
+            if time.perf_counter() - self._started_at < self.deadline:
+                raise   # A timeout of the stage itself, e.g. the scraper's.
+            raise StageTimeoutError(f"Stage '{stage.name}' exceeded the deadline of {self.deadline:g}s.") from e
+
+    def __contains__(self, name: Optional[str]) -> bool:
+        return name in self.stages
@@ -0,0 +1,105 @@
+import os
+import time
+import hashlib
+import threading
+
+from typing import Iterable
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+LANGUAGE_SUFFIX = "\nYou will generate this content in "
+
+
+class Prompt:
+    """ One revision of an instruction file, with its system message precomputed for every language."""
+
+    def __init__(self, key: str, path: str, text: str, mtime: float, languages: Iterable[str]):
+        self.key = key
+        self.path = path
+        self.text = text
+        self.mtime = mtime
+        self.version = hashlib.sha256(text.encode('utf-8')).hexdigest()[:12]   # Stable across restarts and hosts.
+        self._system = {language: text + LANGUAGE_SUFFIX + language for language in languages}
+
+    def system(self, language: str) -> str:
+        """ The system message for a language, i.e. the instructions and the language to generate content in."""
+        message = self._system.get(language)
+        if message is None:                 # E.g. the default 'english', when no language was given.
+            message = self._system[language] = self.text + LANGUAGE_SUFFIX + language
+        return message
+
+
+class PromptRegistry:
+    """
+    Holds every instruction file in memory, so requests never read prompts from disk. Files are loaded once, at
+    startup via load() or else on first use, and the system message of every (prompt, language) pair is built up front.
+
+    Changed files are picked up without a restart: at most once every 'reload_interval' seconds, a request checks the
+    modification times of the files and reloads those that changed. A file that fails to load keeps its previous
+    revision. Every revision carries a version, a short hash of its text, to tell apart results of different prompts.
+    """
+
+    def __init__(self, files: dict[str, str], languages: Iterable[str], reload_interval: float = 2.0):
+        self.files = dict(files)
+        self.languages = tuple(languages)
+        self.reload_interval = reload_interval
+        self.reloads = 0
+        self._lock = threading.Lock()
+        self._prompts = None
+        self._checked_at = time.monotonic()
+
+    @classmethod
+    def from_env(cls, files: dict[str, str], languages: Iterable[str]) -> 'PromptRegistry':
+        """ PROMPT_RELOAD_SECONDS sets the reload interval, 0 disables reloading."""
+        return cls(files, languages, reload_interval=float(os.environ.get('PROMPT_RELOAD_SECONDS', 2.0)))
+
+    def load(self) -> None:
+        """ Reads every file, unless that has been done already."""
+        if self._prompts is not None:
+            return
+        with self._lock:
+            if self._prompts is None:
+                self._prompts = {key: self._load(key, path) for key, path in self.files.items()}
+                self._checked_at = time.monotonic()
+
+    def get(self, key: str) -> Prompt:
+        if self._prompts is None:
+            self.load()
+        else:
+            self._maybe_reload()
+        return self._prompts[key]
+
+    def system(self, key: str, language: str) -> str:
+        return self.get(key).system(language)
+
+    def versions(self) -> dict:
+        self.load()
+        return {key: prompt.version for key, prompt in self._prompts.items()}
+
+    def _maybe_reload(self) -> None:
+        if not self.reload_interval or time.monotonic() - self._checked_at < self.reload_interval:
+            return
+        if not self._lock.acquire(blocking=False):
+            return                          # Another thread is checking right now.
+        try:
+            self._checked_at = time.monotonic()
+            for key, prompt in list(self._prompts.items()):
+                try:
+                    if os.stat(prompt.path).st_mtime == prompt.mtime:
+                        continue
+                    reloaded = self._load(key, prompt.path)
+                except OSError as e:
+                    logger.error(f"Failed to reload prompt '{key}', keeping version {prompt.version}: {e}")
+                    continue
+                if reloaded.version != prompt.version:
+                    self.reloads += 1
+                    logger.info(f"Reloaded prompt '{key}': version {prompt.version} -> {reloaded.version}")
+                self._prompts[key] = reloaded
+        finally:
+            self._lock.release()
+
+    def _load(self, key: str, path: str) -> Prompt:
+        mtime = os.stat(path).st_mtime
+        with open(path, 'r', encoding='utf-8') as file:
+            return Prompt(key, path, file.read(), mtime, self.languages)
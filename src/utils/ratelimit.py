@@ -0,0 +1,247 @@
+import os
+import json
+import time
+import heapq
+import random
+import asyncio
+import itertools
+import contextvars
+
+from typing import Any, Awaitable, Callable, Optional
+from utils.logger import get_logger
+from utils import metrics
+
+logger = get_logger(__name__)
+
+# Requests and tokens per minute allowed per model, from the rate limits of the OpenAI organization of the deployment,
+# e.g. OPENAI_RATE_LIMITS='{"gpt-4o": {"rpm": 5000, "tpm": 800000}}'. None by default, as they depend on the usage tier
+# of the organization. Models without limits are never held back, but their calls are still retried.
+MODEL_LIMITS = json.loads(os.environ.get('OPENAI_RATE_LIMITS', '{}'))
+
+# Lower goes first. Interactive streams are the most latency sensitive, batches the least.
+PRIORITIES = {'streaming': 0, 'buffered': 1, 'batch': 2}
+
+# Priority of the completions made by the current request. Set by the handler of the endpoint.
+priority = contextvars.ContextVar('openai_priority', default='buffered')
+
+
+class RateLimitedError(Exception):
+    """ Raised when a completion is still rate limited by OpenAI after all retries."""
+
+    def __init__(self, model: str, retry_after: Optional[float]):
+        super().__init__(f"Rate limit of {model} reached, retries exhausted.")
+        self.model = model
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    Allows 'per_minute' units per minute, in bursts of up to a minute's worth. The level may go below zero, when
+    more was used than estimated, and the debt is then paid off before anything else is let through.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def delay(self, amount: float, now: float) -> float:
+        """ Seconds until 'amount' units are available."""
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+        amount = min(amount, self.capacity)             # Larger amounts would never fit, let them through when full.
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float) -> None:
+        self.level -= amount
+
+    def drain(self) -> None:
+        self.level = min(self.level, 0.0)
+
+
+class ModelLimiter:
+    """
+    Keeps the completions of one model within its requests and tokens per minute. Completions that don't fit wait in
+    a queue ordered by priority, then by arrival, and a single task lets them through as the buckets refill. Tokens are
+    estimated up front and settled with the actual usage afterwards.
+
+    When OpenAI rate limits us anyway, e.g. because another process shares the organization, the buckets are emptied
+    and the model is paused for as long as OpenAI asked, which slows every caller down, not just the one that failed.
+    """
+
+    def __init__(self, model: str, rpm: float, tpm: float):
+        self.model = model
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.paused_until = 0.0
+        self.granted = 0
+        self.waited = 0
+        self.rate_limited = 0
+        self._waiters = []                              # Heap of (priority, arrival, tokens, future).
+        self._arrivals = itertools.count()
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    def _delay(self, tokens: float, now: float) -> float:
+        return max(self.paused_until - now, self.requests.delay(1, now), self.tokens.delay(tokens, now))
+
+    def _take(self, tokens: float) -> None:
+        self.requests.take(1)
+        self.tokens.take(tokens)
+        self.granted += 1
+
+    async def acquire(self, tokens: float, priority_name: str = 'buffered') -> float:
+        """ Waits until the completion fits within the limits. Returns the seconds waited."""
+        if not self._waiters and self._delay(tokens, time.monotonic()) == 0:
+            self._take(tokens)
+            return 0.0
+
+        flag1 = time.perf_counter()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (PRIORITIES.get(priority_name, 1), next(self._arrivals), tokens, future))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.ensure_future(self._dispatch())
+        self.waited += 1
+        await future                                    # If cancelled, the dispatcher skips the entry.
+        return time.perf_counter() - flag1
+
+    async def _dispatch(self) -> None:
+        while self._waiters:
+            _, _, tokens, future = self._waiters[0]
+            if future.done():                           # The caller was cancelled while waiting.
+                heapq.heappop(self._waiters)
+                continue
+            delay = self._delay(tokens, time.monotonic())
+            if delay > 0:
+                await asyncio.sleep(delay)              # Then look again, a more urgent caller may have arrived.
+                continue
+            heapq.heappop(self._waiters)
+            self._take(tokens)
+            future.set_result(None)
+
+    def busy(self) -> bool:
+        """ Whether calls are waiting, or the model is paused after a 429."""
+        return any(not future.done() for *_, future in self._waiters) or self.paused_until > time.monotonic()
+
+    def settle(self, estimated: float, actual: Optional[float]) -> None:
+        """ Corrects the estimate taken from the tokens bucket, once the actual usage is known."""
+        if actual is not None:
+            self.tokens.take(actual - estimated)
+
+    def pause(self, seconds: float) -> None:
+        self.rate_limited += 1
+        self.requests.drain()
+        self.tokens.drain()
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        self._delay(0, now)                             # Brings the bucket levels up to date.
+        return {"queued": sum(not future.done() for *_, future in self._waiters),
+                "requests_available": round(self.requests.level, 1), "tokens_available": round(self.tokens.level),
+                "paused_seconds": round(max(self.paused_until - now, 0.0), 3), "granted": self.granted,
+                "waited": self.waited, "rate_limited": self.rate_limited}
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """ How long OpenAI asked us to wait, from the headers of the error's response, if it says."""
+    headers = getattr(getattr(error, 'response', None), 'headers', None)
+    if not headers:
+        return None
+    try:
+        if headers.get('retry-after-ms') is not None:
+            return float(headers['retry-after-ms']) / 1000
+        if headers.get('retry-after') is not None:
+            return float(headers['retry-after'])
+    except ValueError:
+        pass                                            # E.g. an HTTP date, rather than seconds.
+    return None
+
+
+class RateLimiter:
+    """
+    Process wide scheduler for OpenAI calls. Every call waits for its model's limiter, and failed calls are retried
+    with jittered, exponential backoff. When the error says how long to wait (retry-after), that is waited instead,
+    plus some jitter, so the callers that were rate limited together don't all retry at the same moment.
+    """
+
+    def __init__(self, limits: dict, max_retries: int = 4, base_delay: float = 0.5, max_delay: float = 20.0):
+        self.limits = limits
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._limiters = {}
+
+    @classmethod
+    def from_env(cls) -> 'RateLimiter':
+        """ OPENAI_RETRIES sets the retries per call, OPENAI_RETRY_BASE_DELAY and OPENAI_RETRY_MAX_DELAY the backoff."""
+        return cls(MODEL_LIMITS, max_retries=int(os.environ.get('OPENAI_RETRIES', 4)),
+                   base_delay=float(os.environ.get('OPENAI_RETRY_BASE_DELAY', 0.5)),
+                   max_delay=float(os.environ.get('OPENAI_RETRY_MAX_DELAY', 20.0)))
+
+    def limiter(self, model: str) -> Optional[ModelLimiter]:
+        limiter = self._limiters.get(model)
+        if limiter is None and model in self.limits:
+            limiter = self._limiters[model] = ModelLimiter(model, self.limits[model]['rpm'],
+                                                           self.limits[model]['tpm'])
+        return limiter
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        if retry_after is not None:
+            return retry_after * random.uniform(1.0, 1.25)
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+        return random.uniform(delay / 2, delay)
+
+    async def call(self, model: str, tokens: float, func: Callable[[], Awaitable[Any]],
+                   retry_on: tuple = ()) -> Any:
+        """
+        Calls 'func' once its model has room for a request of an estimated 'tokens' tokens, with the priority of the
+        current request. Exceptions in 'retry_on' are retried, up to max_retries times.
+        """
+        limiter = self.limiter(model)
+        priority_name = priority.get()
+        attempt = 0
+        while True:
+            if limiter is not None:
+                waited = await limiter.acquire(tokens, priority_name)
+                metrics.RATE_LIMIT_WAIT_SECONDS.labels(model, priority_name).observe(waited)
+            try:
+                return await func()
+            except retry_on as e:
+                rate_limited = getattr(e, 'status_code', None) == 429
+                retry_after = retry_after_seconds(e)
+                delay = self.backoff(attempt, retry_after)
+                paused = rate_limited and limiter is not None
+                if limiter is not None:
+                    limiter.settle(tokens, 0)           # No tokens used, the next attempt takes its own estimate.
+                if paused:
+                    limiter.pause(delay)                # Holds back every call to the model, not just this one.
+                if attempt >= self.max_retries:
+                    if rate_limited:
+                        raise RateLimitedError(model, retry_after) from e
+                    raise
+                attempt += 1
+                metrics.OPENAI_RETRIES.labels(model, 'rate_limit' if rate_limited else type(e).__name__).inc()
+                logger.warning(f"{model} call failed ({type(e).__name__}), retry {attempt} of {self.max_retries} "
+                               f"in {delay:.2f} seconds.")
+                if not paused:
+                    await asyncio.sleep(delay)
+
+    def busy(self, model: str) -> bool:
+        limiter = self._limiters.get(model)
+        return limiter is not None and limiter.busy()
+
+    def settle(self, model: str, estimated: float, actual: Optional[float]) -> None:
+        limiter = self.limiter(model)
+        if limiter is not None:
+            limiter.settle(estimated, actual)
+
+    def stats(self) -> dict:
+        return {model: limiter.stats() for model, limiter in self._limiters.items()}
+
+
+scheduler = RateLimiter.from_env()
+if scheduler.limits:
+    logger.info(f"OpenAI rate limits in effect: {scheduler.limits}")
+else:
+    logger.info("No OpenAI rate limits set (OPENAI_RATE_LIMITS), calls are not held back up front, only retried.")
@@ -0,0 +1,77 @@
+import time
+import asyncio
+import contextvars
+
+from typing import Any, Awaitable, Callable
+from utils.logger import get_logger
+from utils.cache import TieredCache
+from utils.singleflight import SingleFlight
+
+logger = get_logger(__name__)
+
+
+class StaleWhileRevalidate:
+    """
+    Serves values from a TieredCache, and keeps them fresh in the background. An entry younger than the soft TTL is a
+    hit. An older one is still returned right away, as stale, while a fresh value is computed in the background and
+    stored for the next caller. Entries older than the cache's own TTL, the hard TTL, are gone, and are a miss.
+
+    Misses and refreshes for the same key share a single computation. Refreshes run detached from the request that
+    triggered them, in an empty context, so they are neither cancelled with it nor traced as part of it.
+    """
+
+    def __init__(self, cache: TieredCache, soft_ttl: float):
+        self.cache = cache
+        self.soft_ttl = soft_ttl
+        self._flights = SingleFlight(cache.name)
+        self._refreshing = {}           # Key -> background refresh, referenced here until it is done.
+        self._counters = {'hits': 0, 'stale': 0, 'misses': 0, 'refreshes': 0, 'refresh_failures': 0}
+
+    async def get(self, key: str, factory: Callable[[], Awaitable[Any]], refresh: Callable[[], Awaitable[Any]],
+                  force_refresh: bool = False) -> tuple[Any, str]:
+        """ Returns the value for a key, and whether it was a 'HIT', 'STALE' or 'MISS'.
+
+        :param factory: Computes the value on a miss, as part of the current request.
+        :param refresh: Computes the value in the background, when the cached one is stale.
+        :param force_refresh: Skips the cache, and computes and stores a fresh value."""
+
+        if not force_refresh:
+            entry = await self.cache.aget_entry(key)
+            if entry is not None:
+                value, stored_at = entry
+                if time.time() - stored_at <= self.soft_ttl:
+                    self._counters['hits'] += 1
+                    return value, 'HIT'
+                self._counters['stale'] += 1
+                self._refresh(key, refresh)
+                return value, 'STALE'
+
+        self._counters['misses'] += 1
+        return await self._flights.do(key, lambda: self._compute(key, factory)), 'MISS'
+
+    async def _compute(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        value = await factory()
+        await self.cache.aset(key, value)
+        return value
+
+    def _refresh(self, key: str, refresh: Callable[[], Awaitable[Any]]) -> None:
+        if key in self._refreshing:
+            return
+        self._counters['refreshes'] += 1
+        task = asyncio.get_running_loop().create_task(self._flights.do(key, lambda: self._compute(key, refresh)),
+                                                      context=contextvars.Context())
+        self._refreshing[key] = task
+        task.add_done_callback(lambda done: self._refreshed(key, done))
+
+    def _refreshed(self, key: str, task: asyncio.Task) -> None:
+        self._refreshing.pop(key, None)
+        if not task.cancelled() and task.exception() is not None:
+            # The stale entry stays in place, until the next request tries again or it reaches the hard TTL.
+            self._counters['refresh_failures'] += 1
+            logger.error(f"Background refresh of {key} failed: {task.exception()}")
+
+    async def astats(self) -> dict:
+        stats = dict(self._counters)
+        stats['refreshing'] = len(self._refreshing)
+        stats['cache'] = await self.cache.astats()
+        return stats
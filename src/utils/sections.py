@@ -0,0 +1,212 @@
+import re
+import unicodedata
+
+
+# Headers of the three campaign sections, as the model writes them in each of the supported languages (see
+# utils.languages). Matching ignores case, accents, markdown (** / #), numbering and a trailing colon.
+SECTION_HEADERS = {
+    "en": (["Campaign Title", "Title"],
+           ["About the Company", "About Company", "About Us"],
+           ["Campaign Description", "Description"]),
+    "es": (["Título de la campaña", "Título"],
+           ["Sobre la empresa", "Acerca de la empresa", "Sobre la compañía"],
+           ["Descripción de la campaña", "Descripción"]),
+    "fr": (["Titre de la campagne", "Titre"],
+           ["À propos de l'entreprise", "À propos de la société"],
+           ["Description de la campagne", "Description"]),
+    "de": (["Kampagnentitel", "Titel der Kampagne", "Titel"],
+           ["Über das Unternehmen", "Über die Firma"],
+           ["Kampagnenbeschreibung", "Beschreibung der Kampagne", "Beschreibung"]),
+    "it": (["Titolo della campagna", "Titolo"],
+           ["Informazioni sull'azienda", "Sull'azienda", "Chi siamo"],
+           ["Descrizione della campagna", "Descrizione"]),
+    "pt": (["Título da campanha", "Título"],
+           ["Sobre a empresa", "Acerca da empresa"],
+           ["Descrição da campanha", "Descrição"]),
+    "ru": (["Название кампании", "Заголовок кампании", "Название"],
+           ["О компании"],
+           ["Описание кампании", "Описание"]),
+    "nl": (["Campagnetitel", "Titel van de campagne"],
+           ["Over het bedrijf"],
+           ["Campagnebeschrijving", "Beschrijving van de campagne", "Beschrijving"]),
+    "sv": (["Kampanjtitel", "Kampanjens titel"],
+           ["Om företaget"],
+           ["Kampanjbeskrivning", "Beskrivning av kampanjen", "Beskrivning"]),
+    "no": (["Kampanjetittel", "Tittel"],
+           ["Om selskapet", "Om bedriften"],
+           ["Kampanjebeskrivelse", "Beskrivelse"]),
+    "da": (["Kampagnetitel"],
+           ["Om virksomheden", "Om firmaet"],
+           ["Kampagnebeskrivelse", "Beskrivelse"]),
+    "fi": (["Kampanjan otsikko", "Kampanjan nimi", "Otsikko"],
+           ["Tietoa yrityksestä", "Yrityksestä"],
+           ["Kampanjan kuvaus", "Kuvaus"]),
+    "pl": (["Tytuł kampanii", "Tytuł"],
+           ["O firmie", "O firmie i marce"],
+           ["Opis kampanii", "Opis"]),
+    "cs": (["Název kampaně", "Název"],
+           ["O společnosti", "O firmě"],
+           ["Popis kampaně", "Popis"]),
+    "el": (["Τίτλος καμπάνιας", "Τίτλος"],
+           ["Σχετικά με την εταιρεία"],
+           ["Περιγραφή καμπάνιας", "Περιγραφή"]),
+    "hu": (["Kampány címe", "Kampánycím", "Cím"],
+           ["A cégről", "A vállalatról"],
+           ["Kampány leírása", "Kampányleírás", "Leírás"]),
+    "ro": (["Titlul campaniei", "Titlu"],
+           ["Despre companie", "Despre firmă"],
+           ["Descrierea campaniei", "Descriere"]),
+    "bg": (["Заглавие на кампанията", "Заглавие"],
+           ["За компанията"],
+           ["Описание на кампанията"]),
+    "hr": (["Naslov kampanje", "Naslov"],
+           ["O tvrtki", "O kompaniji"],
+           ["Opis kampanje"]),
+    "sk": (["Názov kampane"],
+           ["O spoločnosti", "O firme"],
+           ["Popis kampane"]),
+    "sl": (["Naslov kampanje"],
+           ["O podjetju"],
+           ["Opis kampanje"]),
+    "lt": (["Kampanijos pavadinimas", "Pavadinimas"],
+           ["Apie įmonę", "Apie bendrovę"],
+           ["Kampanijos aprašymas", "Aprašymas"]),
+    "lv": (["Kampaņas nosaukums", "Nosaukums"],
+           ["Par uzņēmumu"],
+           ["Kampaņas apraksts", "Apraksts"]),
+    "et": (["Kampaania pealkiri", "Pealkiri"],
+           ["Ettevõttest", "Ettevõtte kohta"],
+           ["Kampaania kirjeldus", "Kirjeldus"]),
+    "ga": (["Teideal an Fheachtais", "Teideal"],
+           ["Faoin gComhlacht", "Maidir leis an gCuideachta", "Faoin gCuideachta"],
+           ["Cur Síos ar an bhFeachtas", "Cur Síos"]),
+    "mt": (["Titlu tal-Kampanja", "Titlu"],
+           ["Dwar il-Kumpanija", "Dwar il-Kumpannija"],
+           ["Deskrizzjoni tal-Kampanja", "Deskrizzjoni"]),
+}
+
+SECTIONS = ("title", "aboutCompany", "description")
+
+# Lines longer than this are never treated as headers, so they can be streamed on right away.
+MAX_HEADER_CHARS = 80
+
+HEADER_MARKUP = re.compile(r'^[\s#*_>]*(?:\d+[.)]\s*)?|[\s#*_:]*$')
+INLINE_HEADER = re.compile(r'^[\s#]*\*\*(?P<header>[^*]{1,80}?)\s*:?\s*\*\*\s*:?\s*(?P<rest>\S.*)?$')
+
+
+def normalize_header(text: str) -> str:
+    """ Lowercases a header and strips markdown, numbering, punctuation around it and accents."""
+    text = HEADER_MARKUP.sub('', text).replace('’', "'")
+    text = unicodedata.normalize('NFKD', text.casefold())
+    return ''.join(char for char in text if not unicodedata.combining(char))
+
+
+HEADER_ALIASES = {normalize_header(alias): section
+                  for aliases in SECTION_HEADERS.values()
+                  for section, section_aliases in zip(SECTIONS, aliases)
+                  for alias in section_aliases}
+
+# Every start of a header, to tell early on that a line of plain text can't become one.
+HEADER_PREFIXES = {alias[:end] for alias in HEADER_ALIASES for end in range(len(alias) + 1)}
+
+
+class SectionParser:
+    """
+    Incremental parser for streamed campaigns. Text is fed chunk by chunk, as it arrives from the model, and the parser
+    returns events for the sections it recognizes:
+
+        {"event": "section_start", "section": "title"}
+        {"event": "section_delta", "section": "title", "text": "..."}
+
+    Only the current, unfinished line is buffered, and only while it could still turn out to be a header, so the work
+    per chunk depends on the size of the chunk, not on how much text came before it. Each section is started once,
+    headers of sections already seen are kept as text of the current section. Text before the first header is skipped.
+    """
+
+    def __init__(self):
+        self.section = None                             # Section currently receiving text.
+        self.parts = {section: [] for section in SECTIONS}
+        self._line = ""                                 # Start of the current line, while it could still be a header.
+        self._line_is_text = False                      # Whether the current line is known not to be a header.
+        self._leading = True                            # Whether no text was written to the section yet.
+
+    def feed(self, chunk: str) -> list[dict]:
+        """ Parses the next chunk of the stream.
+
+        :param chunk: Text, as it was received.
+        :returns: Events for the chunk, in order. Deltas of the same section are merged."""
+
+        events = []
+        lines = chunk.split('\n')
+        for index, text in enumerate(lines):
+            end_of_line = index < len(lines) - 1
+            if self._line_is_text:
+                self._write(text + ('\n' if end_of_line else ''), events)
+            else:
+                self._line += text
+                if end_of_line:
+                    self._close_line(events)
+                elif len(self._line) > MAX_HEADER_CHARS or not self._could_be_header():
+                    self._flush_line(events)
+            if end_of_line:
+                self._line, self._line_is_text = "", False
+        return events
+
+    def finish(self) -> list[dict]:
+        """ Parses whatever is left of the last line, once the stream has ended."""
+        events = []
+        if self._line and not self._line_is_text:
+            self._close_line(events, newline=False)
+        self._line, self._line_is_text = "", False
+        return events
+
+    def sections(self) -> dict:
+        """ The text of every section so far, with surrounding whitespace removed."""
+        return {section: "".join(parts).strip() for section, parts in self.parts.items()}
+
+    def _could_be_header(self) -> bool:
+        line = self._line.lstrip()
+        if not line or line[0] in '#*_>' or line[0].isdigit():
+            return True                                 # Markdown or numbering, wait for the rest of the line.
+        return normalize_header(line) in HEADER_PREFIXES
+
+    def _close_line(self, events: list, newline: bool = True) -> None:
+        section = HEADER_ALIASES.get(normalize_header(self._line))
+        if section is not None and self._start(section, events):
+            return
+        self._flush_line(events)
+        if newline:
+            self._write('\n', events)
+
+    def _flush_line(self, events: list) -> None:
+        """ The buffered line is either an inline header ("**Title:** text") or plain text."""
+        inline = INLINE_HEADER.match(self._line)
+        if inline:
+            section = HEADER_ALIASES.get(normalize_header(inline.group('header')))
+            if section is not None and self._start(section, events):
+                self._write(inline.group('rest') or "", events)
+                self._line_is_text = True
+                return
+        self._write(self._line, events)
+        self._line_is_text = True
+
+    def _start(self, section: str, events: list) -> bool:
+        if self.parts[section] or section == self.section:
+            return False
+        self.section, self._leading = section, True
+        events.append({"event": "section_start", "section": section})
+        return True
+
+    def _write(self, text: str, events: list) -> None:
+        if self.section is None or not text:
+            return
+        if self._leading:                               # Skip blank lines between a header and its text.
+            text = text.lstrip()
+            if not text:
+                return
+            self._leading = False
+        self.parts[self.section].append(text)
+        if events and events[-1]["event"] == "section_delta" and events[-1]["section"] == self.section:
+            events[-1]["text"] += text
+        else:
+            events.append({"event": "section_delta", "section": self.section, "text": text})
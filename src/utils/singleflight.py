@@ -0,0 +1,75 @@
+import asyncio
+import contextvars
+
+from typing import Any, Awaitable, Callable, Hashable
+from utils import ratelimit
+
+
+class _Call:
+    def __init__(self, context: contextvars.Context):
+        self.context = context
+        self.task = None
+        self.waiters = 0
+
+    def join(self) -> None:
+        """ Raises the priority of the shared work to the one of the joining caller, if that is more urgent."""
+        current, joining = self.context[ratelimit.priority], ratelimit.priority.get()
+        if ratelimit.PRIORITIES.get(joining, 1) < ratelimit.PRIORITIES.get(current, 1):
+            # The task is suspended while another one runs, so its context can be entered here.
+            self.context.run(ratelimit.priority.set, joining)
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key into one. The first caller starts the work, and every caller arriving
+    while it is still in flight awaits the same shared future instead of starting duplicate work.
+
+    Cancellation is reference counted: a caller that is cancelled (e.g. its client disconnected) only stops waiting.
+    The shared work is cancelled once the last caller waiting for it is gone.
+
+    The shared work belongs to none of its callers, so it runs in a context of its own rather than in the one of the
+    first caller: outside of any caller's trace, with the OpenAI priority of the most urgent caller waiting for it.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls = {}
+        self.started = 0                # Calls that actually did the work.
+        self.duplicates_avoided = 0     # Calls that joined work already in flight.
+
+    async def do(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """ Returns the result of factory(), sharing it with any concurrent callers using the same key.
+
+        :param key: Identifies the work. Calls with equal keys are coalesced.
+        :param factory: Creates the coroutine doing the work. Only called if no call for the key is in flight.
+        :returns: The result of the shared work. Exceptions are raised to every caller."""
+
+        call = self._calls.get(key)
+        if call is None:
+            context = contextvars.Context()
+            context.run(ratelimit.priority.set, ratelimit.priority.get())
+            call = _Call(context)
+            call.task = asyncio.get_running_loop().create_task(factory(), context=context)
+            self._calls[key] = call
+            self.started += 1
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+        else:
+            call.join()
+            self.duplicates_avoided += 1
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # The last caller was cancelled, so nobody needs the result anymore.
+                self._forget(key, call)
+                call.task.cancel()
+
+    def _forget(self, key: Hashable, call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def stats(self) -> dict:
+        return {"started": self.started, "duplicates_avoided": self.duplicates_avoided, "in_flight": len(self._calls)}
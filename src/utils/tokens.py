@@ -0,0 +1,70 @@
+import re
+
+SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+
+
+def estimate_tokens(text: str) -> int:
+    """ Estimates the number of tokens in a text, without calling a tokenizer.
+    Latin script averages about 4 characters per token with OpenAI's tokenizers, while other scripts (Greek, Cyrillic,
+    or accented text) take considerably more tokens per character, so non-ASCII characters are counted at 2 per token.
+
+    :param text: The text to estimate.
+    :returns: Estimated token count. Errs on the high side."""
+
+    non_ascii = sum(1 for char in text if ord(char) > 127)
+    return int((len(text) - non_ascii) / 4 + non_ascii / 2) + 1
+
+
+def chunk_text(text: str, max_tokens: int) -> list[str]:
+    """ Splits a text into chunks of at most max_tokens estimated tokens, on paragraph (line) boundaries.
+    Paragraphs that are too large on their own are split on sentence boundaries, and as a last resort on words.
+
+    :param text: The text to split. Paragraphs are separated by newlines.
+    :param max_tokens: Token budget per chunk.
+    :returns: List of chunks, in the order of the text."""
+
+    pieces = []
+    for paragraph in text.split('\n'):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if estimate_tokens(paragraph) <= max_tokens:
+            pieces.append(paragraph)
+            continue
+        for sentence in SENTENCE_END.split(paragraph):
+            if estimate_tokens(sentence) <= max_tokens:
+                pieces.append(sentence)
+            else:
+                pieces.extend(_split_words(sentence, max_tokens))
+
+    chunks, current, current_tokens = [], [], 0
+    for piece in pieces:
+        piece_tokens = estimate_tokens(piece)
+        if current and current_tokens + piece_tokens > max_tokens:
+            chunks.append('\n'.join(current))
+            current, current_tokens = [], 0
+        current.append(piece)
+        current_tokens += piece_tokens
+    if current:
+        chunks.append('\n'.join(current))
+    return chunks
+
+
+def truncate_text(text: str, max_tokens: int) -> str:
+    """ Cuts a text off at the last boundary chunk_text() would split it on, within max_tokens estimated tokens."""
+    chunks = chunk_text(text, max_tokens)
+    return chunks[0] if chunks else ''
+
+
+def _split_words(text: str, max_tokens: int) -> list[str]:
+    parts, current, current_tokens = [], [], 0
+    for word in text.split(' '):
+        word_tokens = estimate_tokens(word)
+        if current and current_tokens + word_tokens > max_tokens:
+            parts.append(' '.join(current))
+            current, current_tokens = [], 0
+        current.append(word)
+        current_tokens += word_tokens
+    if current:
+        parts.append(' '.join(current))
+    return parts
@@ -0,0 +1,182 @@
+import os
+import json
+import time
+import random
+import asyncio
+import secrets
+import threading
+import contextvars
+
+from contextlib import aclosing, contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncGenerator, Optional
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# The span work is currently running in. Tasks inherit it when they are created, so spans of concurrent stages nest
+# under the span that started them. None when the current request isn't traced.
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+
+class Span:
+    """ A timed operation within a trace. Start and end are epoch seconds, so spans from the WebScraper line up."""
+
+    __slots__ = ('trace', 'name', 'span_id', 'parent_id', 'start', 'end', 'attributes', 'status', '_flag1')
+
+    def __init__(self, trace: 'Trace', name: str, parent_id: Optional[str], attributes: dict):
+        self.trace = trace
+        self.name = name
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.start = time.time()
+        self.end = None
+        self.attributes = attributes
+        self.status = 'ok'
+        self._flag1 = time.perf_counter()
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        self.end = self.start + (time.perf_counter() - self._flag1)
+        if error is not None:
+            self.status = 'cancelled' if isinstance(error, (asyncio.CancelledError, GeneratorExit)) else 'error'
+            self.attributes.setdefault('error', str(error) or type(error).__name__)
+        self.trace.spans.append(self.to_dict())
+
+    def to_dict(self) -> dict:
+        return {"name": self.name, "trace_id": self.trace.trace_id, "span_id": self.span_id,
+                "parent_id": self.parent_id, "start": round(self.start, 6), "end": round(self.end, 6),
+                "seconds": round(self.end - self.start, 6), "status": self.status, "attributes": self.attributes}
+
+
+class _NoopSpan:
+    """ Stands in for a span when the request isn't traced, so callers never have to check."""
+
+    def set(self, **attributes) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Trace:
+    def __init__(self):
+        self.trace_id = secrets.token_hex(16)
+        self.spans = []
+
+
+class Tracer:
+    """
+    Decides which requests are traced, and exports their spans once they have finished. A sampled request gets a
+    trace, and every span opened while handling it (in the request itself, or in tasks it started) is recorded.
+    Requests that aren't sampled only pay for a random number and a context variable lookup per span.
+
+    Finished traces are appended to a JSON lines file, one trace with all of its spans per line, by a single thread of
+    the Tracer's own, so that requests never wait on the file. Without a file to export to, nothing is sampled.
+    """
+
+    def __init__(self, sample_rate: float = 0.0, path: Optional[str] = None):
+        self.sample_rate = sample_rate if path else 0.0
+        self.path = path
+        self.exported = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='tracer') if path else None
+
+    @classmethod
+    def from_env(cls) -> 'Tracer':
+        """ TRACE_FILE is the JSON lines file to export to, TRACE_SAMPLE_RATE the share of requests traced."""
+        return cls(float(os.environ.get('TRACE_SAMPLE_RATE', 0.05)), os.environ.get('TRACE_FILE'))
+
+    @contextmanager
+    def trace(self, name: str, **attributes):
+        """ Starts a trace for a request, if it is sampled, and exports it once the block is done."""
+        if not self.sample_rate or random.random() >= self.sample_rate:
+            yield NOOP_SPAN
+            return
+
+        root = Span(Trace(), name, None, attributes)
+        token = _current_span.set(root)
+        error = None
+        try:
+            yield root
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            root.finish(error)
+            _reset(token)
+            self.export(root)
+
+    async def trace_stream(self, name: str, stream: AsyncGenerator[str, None],
+                           **attributes) -> AsyncGenerator[str, None]:
+        """ Traces a streamed response, from the start until its last chunk has been sent. The inner stream is closed
+        within the trace, also when this one is closed early."""
+        with self.trace(name, **attributes):
+            async with aclosing(stream) as chunks:
+                async for chunk in chunks:
+                    yield chunk
+
+    def export(self, root: Span) -> None:
+        record = {"trace_id": root.trace.trace_id, "name": root.name, "start": round(root.start, 6),
+                  "seconds": round(root.end - root.start, 6), "spans": root.trace.spans}
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        self._executor.submit(self._write, root.trace.trace_id, line)
+
+    def _write(self, trace_id: str, line: str) -> None:
+        try:
+            with self._lock, open(self.path, 'a', encoding='utf-8') as file:
+                file.write(line)
+            self.exported += 1
+        except OSError as e:
+            logger.error(f"Failed to export trace {trace_id} to {self.path}: {e}")
+
+
+def _reset(token: contextvars.Token) -> None:
+    try:
+        _current_span.reset(token)
+    except ValueError:
+        pass    # Finished from another context, e.g. a stream closed by the server. That context ends anyway.
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """ Records a span under the current one. Does nothing (and yields a no-op span) when the request isn't traced."""
+    parent = _current_span.get()
+    if parent is None:
+        yield NOOP_SPAN
+        return
+
+    current = Span(parent.trace, name, parent.span_id, attributes)
+    token = _current_span.set(current)
+    error = None
+    try:
+        yield current
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        current.finish(error)
+        _reset(token)
+
+
+def inject() -> Optional[dict]:
+    """ The trace context to pass along to another service, or None when the request isn't traced."""
+    current = _current_span.get()
+    if current is None:
+        return None
+    return {"trace_id": current.trace.trace_id, "parent_id": current.span_id, "sampled": True}
+
+
+def add_remote_spans(spans: Optional[list]) -> None:
+    """ Adds spans recorded by another service (with the context from inject()) to the current trace."""
+    current = _current_span.get()
+    if current is None or not spans:
+        return
+    for remote in spans:
+        if isinstance(remote, dict) and remote.get('trace_id') == current.trace.trace_id:
+            current.trace.spans.append(remote)
+
+
+tracer = Tracer.from_env()
@@ -0,0 +1,32 @@
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+# Query parameters that only exist for click tracking, and never change the content of the page.
+TRACKING_PARAMS = {'gclid', 'gclsrc', 'dclid', 'fbclid', 'msclkid', 'yclid', 'igshid', 'mc_cid', 'mc_eid', '_ga',
+                   '_gl', 'ref', 'ref_src', 'spm'}
+TRACKING_PREFIXES = ('utm_', 'pk_', 'hsa_')
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def normalize_url(url: str) -> str:
+    """ Normalizes a URL, such that different spellings of the same page map to the same key.
+    Scheme and host are lowercased, default ports, fragments and tracking parameters are stripped, the remaining
+    query parameters are sorted and any trailing slash is folded.
+
+    :param url: The URL to normalize.
+    :returns: The normalized URL as a string."""
+
+    parts = urlsplit(str(url).strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+
+    path = parts.path.rstrip('/')
+
+    query = [(key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+             if key.lower() not in TRACKING_PARAMS and not key.lower().startswith(TRACKING_PREFIXES)]
+    query.sort()
+
+    return urlunsplit((scheme, host, path, urlencode(query), ''))
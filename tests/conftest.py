@@ -0,0 +1,13 @@
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Both code bases import their modules from their src directory, as they do when run from there. Their module names
+# don't overlap.
+sys.path.insert(0, os.path.join(ROOT, 'webscraper_lambda', 'src'))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+# The caches the API creates on import keep their disk tier apart from the ones of a locally running server.
+os.environ.setdefault('CACHE_DIR', tempfile.mkdtemp(prefix='ai-campaign-manager-tests-'))
@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+
+import APIhandler
+import OpenAIClient
+from APIhandler import RequestHandler
+
+
+class FakeRegistry:
+    """ Stands in for the pooled clients. Scrapes, summaries and completions are replaced per test."""
+    api_key = 'test'
+    openai = None
+    monitor = False
+    scraper = None
+
+
+@pytest.fixture
+def completions(monkeypatch) -> list:
+    """ Replaces every completion with one naming its kind and language, and records them."""
+    made = []
+
+    async def create_completion(self, prompt, identifier, max_tokens=None, stream=False) -> dict:
+        made.append((identifier.name.lower(), self.body['lang']))
+        await asyncio.sleep(0.01)
+        return {identifier.name.lower(): f"{self.body['lang']}: {prompt}"}
+
+    monkeypatch.setattr(OpenAIClient.AIGenerator, 'create_completion', create_completion)
+    return made
+
+
+def make_handler(monkeypatch, body: dict) -> RequestHandler:
+    handler = RequestHandler(body, registry=FakeRegistry())
+    handler.scrapes = []
+
+    async def scrape_stage():
+        handler.scrapes.append(handler.body['url'])
+        return 'Nordic Games sells board games.'
+
+    async def summarize(site_text: str) -> str:
+        return 'summary'
+
+    monkeypatch.setattr(handler, 'scrape_stage', scrape_stage)
+    monkeypatch.setattr(handler, 'summarize', summarize)
+    return handler
+
+
+def test_languages_share_one_scrape_and_summary(monkeypatch, completions):
+    handler = make_handler(monkeypatch, {'url': 'https://example.com', 'customer_campaign': 'default_customer_campaign',
+                                         'mail_type': 'invite', 'languages': ['da', 'de']})
+    assert set(handler.build_pipeline().stages) == {'scrape', 'summary', 'language:da', 'language:de'}
+
+    result = asyncio.run(handler.generate_buffered())
+    assert list(result) == ['da', 'de']
+    assert result['de']['buffered_campaign'] == 'Deutsch: summary'
+    assert set(result['da']) == {'buffered_campaign', 'platform', 'invite'}
+    assert handler.scrapes == ['https://example.com']
+    assert sorted(completions) == sorted((kind, language) for kind in ('buffered_campaign', 'platform', 'invite')
+                                         for language in ('Dansk', 'Deutsch'))
+
+
+def test_customer_campaigns_only_get_a_message_per_language(monkeypatch, completions):
+    handler = make_handler(monkeypatch, {'customer_campaign': 'Our spring campaign', 'mail_type': 'welcome',
+                                         'languages': ['fr', 'it']})
+    assert set(handler.build_pipeline().stages) == {'language:fr', 'language:it'}
+
+    result = asyncio.run(handler.generate_buffered())
+    assert result == {'fr': {'welcome': 'Français: "Our spring campaign"'},
+                      'it': {'welcome': 'Italiano: "Our spring campaign"'}}
+    assert handler.scrapes == []
+
+
+def test_languages_are_generated_a_few_at_a_time(monkeypatch, completions):
+    monkeypatch.setattr(APIhandler, 'LANGUAGE_CONCURRENCY', 2)
+    handler = make_handler(monkeypatch, {'url': 'https://example.com', 'customer_campaign': 'default_customer_campaign',
+                                         'mail_type': 'default_mail_type', 'languages': ['da', 'de', 'fr', 'it']})
+    active, peak = {}, 0
+    create_completion = OpenAIClient.AIGenerator.create_completion
+
+    async def counting(self, prompt, identifier, max_tokens=None, stream=False):
+        nonlocal peak
+        language = self.body['lang']
+        active[language] = active.get(language, 0) + 1
+        peak = max(peak, len(active))
+        try:
+            return await create_completion(self, prompt, identifier, max_tokens, stream)
+        finally:
+            active[language] -= 1
+            if not active[language]:
+                del active[language]
+
+    monkeypatch.setattr(OpenAIClient.AIGenerator, 'create_completion', counting)
+    result = asyncio.run(handler.generate_buffered())
+    assert list(result) == ['da', 'de', 'fr', 'it']
+    assert peak == 2                # Languages with completions in flight at the same time.
+    assert len(completions) == 8
+
+
+def test_the_result_cache_key_includes_the_languages(monkeypatch):
+    body = {'url': 'https://example.com/', 'customer_campaign': 'default_customer_campaign', 'mail_type': 'invite'}
+    single = make_handler(monkeypatch, body).result_cache_key()
+    several = make_handler(monkeypatch, dict(body, languages=['da', 'de'])).result_cache_key()
+    assert several == single + '|da,de'
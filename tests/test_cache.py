@@ -0,0 +1,105 @@
+import time
+import asyncio
+import threading
+
+from utils.cache import TieredCache
+
+
+def make_cache(tmp_path, **kwargs) -> TieredCache:
+    return TieredCache('test', path=str(tmp_path / 'test.sqlite3'), **kwargs)
+
+
+def test_values_round_trip(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.set('page', {'text': 'Nordic Games', 'lang': ['da', 'en']})
+    assert cache.get('page') == {'text': 'Nordic Games', 'lang': ['da', 'en']}
+    assert cache.get('other') is None
+    stats = cache.stats()
+    assert (stats['memory_hits'], stats['misses'], stats['writes'], stats['disk_entries']) == (1, 1, 1, 1)
+
+
+def test_memory_tier_evicts_least_recently_used(tmp_path):
+    cache = make_cache(tmp_path, max_entries=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')                          # 'b' is now the least recently used.
+    cache.set('c', 3)
+    assert cache.stats()['memory_evictions'] == 1
+    assert cache.get('b') == 2              # Still on disk, and promoted back to memory.
+    stats = cache.stats()
+    assert (stats['memory_hits'], stats['disk_hits'], stats['memory_entries']) == (1, 1, 2)
+
+
+def test_memory_tier_is_bounded_by_size(tmp_path):
+    cache = make_cache(tmp_path, max_bytes=100)
+    cache.set('small', 'x' * 10)
+    cache.set('large', 'x' * 500)           # Larger than the whole memory tier, so it only lives on disk.
+    assert cache.stats()['memory_entries'] == 1
+    assert cache.get('large') == 'x' * 500
+    assert cache.stats()['disk_hits'] == 1
+
+
+def test_disk_tier_survives_restarts_and_is_bounded(tmp_path):
+    cache = make_cache(tmp_path, disk_max_entries=2)
+    for key in ('a', 'b', 'c'):
+        cache.set(key, key.upper())
+    restarted = make_cache(tmp_path, disk_max_entries=2)
+    assert restarted.get('a') is None
+    assert (restarted.get('b'), restarted.get('c')) == ('B', 'C')
+    assert cache.stats()['disk_evictions'] == 1
+
+
+def test_entries_expire_after_the_ttl(tmp_path):
+    cache = make_cache(tmp_path, ttl=0.05)
+    cache.set('page', 'text')
+    time.sleep(0.1)
+    assert cache.get('page') is None
+    assert make_cache(tmp_path, ttl=0.05).get('page') is None
+    assert cache.stats()['expired'] == 2         # Its copies in memory and on disk.
+
+
+def test_memory_only_cache():
+    cache = TieredCache('test', disk=False, max_entries=1)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert (cache.get('a'), cache.get('b')) == (None, 2)
+    stats = cache.stats()
+    assert (stats['memory_hits'], stats['misses'], stats['disk_entries'], stats['hit_ratio']) == (1, 1, 0, 0.5)
+
+
+def test_async_variants_do_disk_io_off_the_event_loop(tmp_path):
+    cache = make_cache(tmp_path, max_entries=1)
+    threads = set()
+    read_disk, write_disk = cache._read_disk, cache._write_disk
+
+    def record(function):
+        def wrapper(*args):
+            threads.add(threading.current_thread().name)
+            return function(*args)
+        return wrapper
+
+    cache._read_disk, cache._write_disk = record(read_disk), record(write_disk)
+
+    async def main():
+        await cache.aset('a', 1)
+        await cache.aset('b', 2)                # Evicts 'a' from memory.
+        results = await cache.aget('a'), await cache.aget_entry('b'), await cache.aget('missing')
+        await cache.adelete('a')
+        return results, await cache.aget('a'), await cache.astats()
+
+    (a, b, missing), deleted, stats = asyncio.run(main())
+    assert a == 1 and b[0] == 2 and missing is None and deleted is None
+    assert stats['disk_entries'] == 1
+    assert threads and all(name.startswith('cache-test') for name in threads)
+    assert threading.main_thread().name not in threads
+
+
+def test_async_variants_without_disk():
+    cache = TieredCache('test', disk=False)
+
+    async def main():
+        await cache.aset('a', 1)
+        return await cache.aget('a'), await cache.aget('b'), await cache.astats()
+
+    a, b, stats = asyncio.run(main())
+    assert (a, b, stats['memory_hits'], stats['misses']) == (1, None, 1, 1)
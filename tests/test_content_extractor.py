@@ -0,0 +1,56 @@
+import pytest
+
+from ContentExtractor import ContentExtractor, decode_html, extract_content
+
+PAGE = """<!DOCTYPE html><html><head><title> Nordic   Games &amp; Puzzles </title>
+<style>p { color: red; }</style><script>var p = "<p>not text</p>";</script></head>
+<body>
+<h1>Board games</h1>
+<p>Nordic Games sells   board games,<br>card games and puzzles.</p>
+<p>Free shipping above 500&nbsp;DKK.
+<div>Not in a paragraph.</div>
+<p>Nordic Games sells board games, card games and puzzles.</p>
+<p>Game nights every <a href="/events">Thursday</a> in Copenhagen.<p>Open daily.</p>
+</body></html>"""
+
+
+def test_title_and_paragraphs():
+    extractor = extract_content(PAGE)
+    assert extractor.title == 'Nordic Games & Puzzles'
+    assert extractor.paragraphs == ['Nordic Games sells board games, card games and puzzles.',
+                                    'Free shipping above 500 DKK.',
+                                    'Game nights every Thursday in Copenhagen.',
+                                    'Open daily.']
+    assert extractor.removed_chars == {'duplicates': len(extractor.paragraphs[0])}
+    assert extractor.page_text() == '\n' + '\n'.join(extractor.paragraphs)
+
+
+@pytest.mark.parametrize('split', range(1, len(PAGE), 7))
+def test_feeding_in_chunks_gives_the_same_result(split):
+    extractor = ContentExtractor()
+    extractor.feed(PAGE[:split])
+    extractor.feed(PAGE[split:])
+    extractor.close()
+    whole = extract_content(PAGE)
+    assert (extractor.title, extractor.paragraphs) == (whole.title, whole.paragraphs)
+
+
+def test_text_is_capped_at_max_chars():
+    extractor = extract_content(PAGE, max_chars=70)
+    assert extractor.truncated
+    assert extractor.chars == 70
+    assert extractor.paragraphs == ['Nordic Games sells board games, card games and puzzles.',
+                                    'Free shipping a']
+
+
+def test_empty_pages():
+    extractor = extract_content('')
+    assert (extractor.title, extractor.paragraphs, extractor.page_text()) == ('', [], '')
+
+
+def test_decode_html_prefers_the_declared_charset():
+    raw = '<html><head><meta charset="iso-8859-1"></head><p>Smørrebrød</p></html>'.encode('iso-8859-1')
+    assert 'Smørrebrød' in decode_html(raw)                     # From the <meta> tag.
+    assert 'Smørrebrød' in decode_html(raw, 'iso-8859-1')       # From the HTTP headers.
+    assert 'Smørrebrød' in decode_html('<p>Smørrebrød</p>'.encode('utf-8'))
+    assert '�' in decode_html(b'<p>Sm\xf8rrebr\xf8d</p>', 'unknown-charset')
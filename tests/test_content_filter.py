@@ -0,0 +1,74 @@
+import os
+import re
+import random
+
+import pytest
+
+from ContentFilter import ContentFilter, build_keyword_pattern
+
+KEYWORDS_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                             'webscraper_lambda', 'utils', 'keywords.txt')
+
+
+@pytest.fixture(scope='module')
+def content_filter() -> ContentFilter:
+    return ContentFilter.from_file(KEYWORDS_FILE)
+
+
+def test_trie_pattern_matches_like_an_alternation():
+    keywords = ['cookie', 'cookies', 'consent', 'co', 'Cookie policy', 'übersicht', 'a.b', 'x|y', '(kakor)']
+    pattern = build_keyword_pattern(keywords)
+    alternation = re.compile('|'.join(map(re.escape, keywords)), re.IGNORECASE)
+    rng = random.Random(1)
+    texts = ['We use cookies.', 'CONSENT', 'c', 'axb', 'a.b', 'x|y', 'cookies (kakor)', 'Übersicht', 'nothing here']
+    texts += [''.join(rng.choice('coknsetiaxb.|y() ') for _ in range(rng.randint(0, 12))) for _ in range(500)]
+    for text in texts:
+        assert (pattern.search(text.lower()) is not None) == (alternation.search(text) is not None), text
+
+
+def test_longer_keywords_sharing_a_prefix_are_left_out():
+    assert build_keyword_pattern(['cookie', 'cookies', 'cookie policy']).pattern == 'cookie'
+
+
+def test_no_keywords_match_nothing():
+    assert build_keyword_pattern([]).search('anything') is None
+
+
+def test_classify_reasons():
+    content_filter = ContentFilter(['we use cookies'])
+    assert content_filter.classify('We use cookies to improve your experience.') == 'keywords'
+    assert content_filter.classify('Home Shop About', link_chars=15) == 'links'
+    assert content_filter.classify('Home, shop and everything about our games.', container='nav') == 'container'
+    assert content_filter.classify('© 2024 Nordic Games', container='footer') == 'container'
+    assert content_filter.classify('A long paragraph in an aside. ' * 10, container='aside') is None
+    assert content_filter.classify('Kr.') == 'short'
+    assert content_filter.classify('Nordic Games sells board games.') is None
+
+
+def test_keywords_file_skips_comments_and_blank_lines(content_filter):
+    assert content_filter.keywords
+    assert not any(keyword.startswith('#') or not keyword.strip() for keyword in content_filter.keywords)
+
+
+@pytest.mark.parametrize('text', [
+    'We use cookies to personalise content and ads.',
+    'Vi bruger cookies til at forbedre din oplevelse.',
+    'Denna webbplats använder kakor (cookies).',
+    'Wir verwenden Cookies, um unsere Website zu verbessern.',
+    'Nous utilisons des cookies et autres traceurs.',
+    'Accept all cookies',
+    'Marketing cookies help us show you relevant ads.',
+])
+def test_consent_notices_are_removed(content_filter, text):
+    assert content_filter.classify(text) == 'keywords'
+
+
+@pytest.mark.parametrize('text', [
+    'Brightline is a performance marketing agency for webshops.',
+    'Our chocolate chip cookie is baked fresh every morning.',
+    'Kakor & Bröd is a Swedish bakery chain.',
+    'We rebuilt the marketing automation around customer consent.',
+    'Read how we handle your data in our privacy policy.',
+])
+def test_content_mentioning_generic_words_is_kept(content_filter, text):
+    assert content_filter.classify(text) is None
@@ -0,0 +1,70 @@
+from DriverPool import DriverPool, PooledDriver, origin_of
+
+
+class FakeDriver:
+    """ Records the DevTools commands a pooled driver is reset with. The page has a frame from another origin."""
+
+    def __init__(self, current_url: str = 'https://www.example.com/shop'):
+        self.current_url = current_url
+        self.window_handles = ['main']
+        self.switch_to = self
+        self.service = None             # No chromedriver process to measure.
+        self.commands = []
+        self.quit_called = False
+
+    def window(self, handle: str) -> None:
+        pass
+
+    def execute_cdp_cmd(self, command: str, params: dict) -> dict:
+        self.commands.append((command, params))
+        if command == 'Page.getFrameTree':
+            return {'frameTree': {'frame': {'securityOrigin': 'https://www.example.com'}, 'childFrames': [
+                {'frame': {'securityOrigin': 'https://consent.example.net'}},
+                {'frame': {'securityOrigin': '://'}}]}}
+        return {}
+
+    def get(self, url: str) -> None:
+        self.current_url = url
+
+    def quit(self) -> None:
+        self.quit_called = True
+
+
+def scraped(url: str, final_url: str) -> PooledDriver:
+    pooled = PooledDriver(FakeDriver(final_url), temp_dirs=[])
+    pooled.requested_url = url
+    return pooled
+
+
+def test_origin_of():
+    assert origin_of('https://WWW.Example.com:8443/shop?page=2') == 'https://www.example.com:8443'
+    assert origin_of('about:blank') is None
+    assert origin_of('data:text/html,hi') is None
+
+
+def test_reset_clears_the_storage_of_the_page_and_its_frames():
+    pool = DriverPool()
+    pooled = scraped('https://www.example.com/shop', 'https://www.example.com/shop/boardgames')
+    pool.release(pooled)
+    cleared = [params['origin'] for command, params in pooled.driver.commands
+               if command == 'Storage.clearDataForOrigin']
+    assert cleared == ['https://consent.example.net', 'https://www.example.com']
+    assert ('Network.clearBrowserCookies', {}) in pooled.driver.commands
+    assert pooled.driver.current_url == 'about:blank'
+    assert pool.idle is pooled and pooled.requested_url is None
+
+
+def test_drivers_that_moved_to_another_origin_are_recycled():
+    pool = DriverPool()
+    pooled = scraped('https://example.com', 'https://www.example-shop.com/')
+    pool.release(pooled)
+    assert pooled.driver.quit_called
+    assert pool.idle is None
+    assert pool.stats()['origin_changes'] == 1
+
+
+def test_broken_drivers_are_not_reused():
+    pool = DriverPool()
+    pooled = scraped('https://www.example.com', 'https://www.example.com')
+    pool.release(pooled, healthy=False)
+    assert pooled.driver.quit_called and pool.idle is None
@@ -0,0 +1,124 @@
+import asyncio
+
+import pytest
+
+from utils import metrics
+from utils.hedging import Hedger
+
+
+def make_hedger(stage: str, **kwargs) -> Hedger:
+    """ A hedger for 'stage' that hedges after 0.05 seconds."""
+    hedger = Hedger([stage], fallback_model=kwargs.pop('fallback_model', 'gpt-fallback'), min_samples=1,
+                    min_delay=0.05, **kwargs)
+    hedger._stages[stage].latencies.append(0.05)
+    return hedger
+
+
+def planned(plan: dict, cancelled: list):
+    """ An attempt that answers with plan[model] = (seconds, result), raising results that are exceptions."""
+    async def attempt(model: str):
+        seconds, result = plan[model]
+        try:
+            await asyncio.sleep(seconds)
+        except asyncio.CancelledError:
+            cancelled.append(model)
+            raise
+        if isinstance(result, Exception):
+            raise result
+        return result
+    return attempt
+
+
+def extra_tokens(stage: str, model: str) -> float:
+    return metrics.HEDGE_EXTRA_TOKENS.labels(stage, model).value
+
+
+def test_fast_answers_are_not_hedged():
+    hedger, cancelled = make_hedger('fast'), []
+    attempt = planned({'gpt-test': (0, 'primary')}, cancelled)
+    assert asyncio.run(hedger.run('fast', 'gpt-test', attempt)) == ('primary', 'gpt-test')
+    assert hedger.stats()['fast']['hedged'] == 0
+
+
+def test_stages_without_hedging_call_once():
+    hedger, cancelled = make_hedger('other'), []
+    attempt = planned({'gpt-test': (0.1, 'primary')}, cancelled)
+    assert asyncio.run(hedger.run('unhedged', 'gpt-test', attempt)) == ('primary', 'gpt-test')
+    assert hedger.stats()['other']['calls'] == 0
+
+
+def test_the_hedge_wins_and_the_primary_is_cancelled():
+    hedger, cancelled = make_hedger('hedge_wins'), []
+    attempt = planned({'gpt-test': (10, 'primary'), 'gpt-fallback': (0, 'hedge')}, cancelled)
+    result = asyncio.run(hedger.run('hedge_wins', 'gpt-test', attempt, estimated_tokens=300))
+    assert result == ('hedge', 'gpt-fallback')
+    assert cancelled == ['gpt-test']
+    stats = hedger.stats()['hedge_wins']
+    assert (stats['calls'], stats['hedged'], stats['hedge_wins']) == (1, 1, 1)
+    # Cancelled in flight, the primary is accounted for with the estimate of its prompt.
+    assert extra_tokens('hedge_wins', 'gpt-test') == 300
+
+
+def test_a_failed_hedge_leaves_the_race_to_the_primary():
+    hedger, cancelled = make_hedger('hedge_fails'), []
+    attempt = planned({'gpt-test': (0.1, 'primary'), 'gpt-fallback': (0, ValueError('invalid JSON'))}, cancelled)
+    result = asyncio.run(hedger.run('hedge_fails', 'gpt-test', attempt, estimated_tokens=300))
+    assert result == ('primary', 'gpt-test')
+    assert cancelled == []
+    assert (hedger.stats()['hedge_fails']['hedge_wins'], extra_tokens('hedge_fails', 'gpt-fallback')) == (0, 0)
+
+
+def test_both_failing_raises_the_first_error():
+    hedger, cancelled = make_hedger('both_fail'), []
+    attempt = planned({'gpt-test': (0.1, ValueError('primary')), 'gpt-fallback': (0, ValueError('hedge'))},
+                      cancelled)
+    with pytest.raises(ValueError, match='hedge'):
+        asyncio.run(hedger.run('both_fail', 'gpt-test', attempt))
+
+
+def test_losers_that_finished_are_accounted_for_with_their_usage():
+    async def main():
+        hedger, release = make_hedger('tie', fallback_model=''), asyncio.Event()
+        attempts = []
+
+        async def attempt(model: str):
+            attempts.append(model)
+            if len(attempts) == 1:
+                await release.wait()
+            else:
+                release.set()           # The primary finishes right after, before the race looks at the results.
+            return f'attempt {len(attempts)}'
+
+        result = await hedger.run('tie', 'gpt-test', attempt, loser_tokens=lambda result: 42, estimated_tokens=300)
+        return result, attempts
+
+    (result, model), attempts = asyncio.run(main())
+    assert result in ('attempt 1', 'attempt 2')
+    assert model == 'gpt-test' and attempts == ['gpt-test', 'gpt-test']
+    assert extra_tokens('tie', 'gpt-test') == 42
+
+
+def test_hedges_over_budget_are_skipped():
+    hedger, cancelled = make_hedger('over_budget', budget=0.05), []
+    hedger._stages['over_budget'].recent.append(True)      # The one hedge the budget allows in a short window.
+    attempt = planned({'gpt-test': (0.1, 'primary'), 'gpt-fallback': (0, 'hedge')}, cancelled)
+    assert asyncio.run(hedger.run('over_budget', 'gpt-test', attempt)) == ('primary', 'gpt-test')
+    stats = hedger.stats()['over_budget']
+    assert (stats['hedged'], stats['over_budget']) == (0, 1)
+
+
+def test_busy_fallback_models_are_not_hedged_to():
+    hedger, cancelled = make_hedger('busy'), []
+    attempt = planned({'gpt-test': (0.1, 'primary'), 'gpt-fallback': (0, 'hedge')}, cancelled)
+    result = asyncio.run(hedger.run('busy', 'gpt-test', attempt, busy=lambda model: model == 'gpt-fallback'))
+    assert result == ('primary', 'gpt-test')
+    assert hedger.stats()['busy']['over_budget'] == 1
+
+
+def test_the_delay_is_a_percentile_of_recent_latencies():
+    hedger = Hedger(['stage'], percentile=0.9, min_samples=10, min_delay=0.01)
+    stage = hedger._stages['stage']
+    stage.latencies.extend([0.1] * 9)
+    assert stage.delay() is None                        # Too few samples.
+    stage.latencies.extend([0.1] * 90 + [5.0] * 11)
+    assert stage.delay() == 5.0
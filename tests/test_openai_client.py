@@ -0,0 +1,131 @@
+import asyncio
+
+import pytest
+
+import OpenAIClient
+from utils.cache import TieredCache
+from OpenAIClient import AIGenerator, Identifiers, summary_cache_key
+
+
+class FakeRegistry:
+    """ Stands in for the pooled clients. No test here reaches OpenAI, completions are replaced per generator."""
+    api_key = 'test'
+    openai = None
+    monitor = False
+
+
+@pytest.fixture
+def summary_cache(monkeypatch) -> TieredCache:
+    cache = TieredCache('summary', disk=False)
+    monkeypatch.setattr(OpenAIClient, 'summary_cache', cache)
+    return cache
+
+
+def make_generator(monkeypatch, body: dict) -> AIGenerator:
+    """ A generator whose completions return a short summary of their prompt, and are recorded in .prompts."""
+    generator = AIGenerator(body, registry=FakeRegistry())
+    generator.prompts = []
+
+    async def create_completion(prompt: str, identifier: Identifiers, max_tokens=None, stream=False) -> str:
+        generator.prompts.append(prompt)
+        await asyncio.sleep(0)
+        return f"Summary of {len(prompt)} characters."
+
+    monkeypatch.setattr(generator, 'create_completion', create_completion)
+    return generator
+
+
+def test_summary_cache_key_is_a_content_address():
+    key = summary_cache_key('Nordic Games sells board games.', 'English')
+    assert key == summary_cache_key('Nordic Games sells board games.', 'English')
+    assert key != summary_cache_key('Nordic Games sells board games!', 'English')
+    assert key != summary_cache_key('Nordic Games sells board games.', 'Dansk')
+
+
+def test_identical_pages_are_summarized_once_per_language(monkeypatch, summary_cache):
+    english = make_generator(monkeypatch, {'lang': 'English'})
+    first = asyncio.run(english.summarize_text('Nordic Games sells board games.'))
+    second = asyncio.run(english.summarize_text('Nordic Games sells board games.'))
+    assert first == second
+    assert len(english.prompts) == 1
+    assert summary_cache.stats()['memory_hits'] == 1
+
+    danish = make_generator(monkeypatch, {'lang': 'Dansk'})
+    asyncio.run(danish.summarize_text('Nordic Games sells board games.'))
+    assert len(danish.prompts) == 1
+
+
+def test_force_refresh_skips_the_cache(monkeypatch, summary_cache):
+    asyncio.run(make_generator(monkeypatch, {'lang': 'English'}).summarize_text('Nordic Games'))
+    refreshing = make_generator(monkeypatch, {'lang': 'English', 'force_refresh': True})
+    asyncio.run(refreshing.summarize_text('Nordic Games'))
+    assert len(refreshing.prompts) == 1
+
+
+def test_empty_summaries_are_not_cached(monkeypatch, summary_cache):
+    generator = make_generator(monkeypatch, {'lang': 'English'})
+
+    async def empty(prompt, identifier, max_tokens=None, stream=False):
+        return ''
+
+    monkeypatch.setattr(generator, 'create_completion', empty)
+    asyncio.run(generator.summarize_text('Nordic Games'))
+    assert summary_cache.stats()['writes'] == 0
+
+
+def large_page(paragraphs: int = 40) -> str:
+    return '\n'.join(f"Paragraph {number}: Nordic Games sells board games, card games and puzzles." * 3
+                     for number in range(paragraphs))
+
+
+def test_short_pages_are_summarized_in_one_call(monkeypatch, summary_cache):
+    generator = make_generator(monkeypatch, {'lang': 'English'})
+    asyncio.run(generator.summarize_text('Nordic Games sells board games.'))
+    assert generator.prompts == ['Nordic Games sells board games.']
+
+
+def test_large_pages_are_summarized_in_chunks_then_reduced(monkeypatch, summary_cache):
+    monkeypatch.setattr(OpenAIClient, 'SUMMARY_CHUNK_TOKENS', 200)
+    monkeypatch.setattr(OpenAIClient, 'SUMMARY_PARALLELISM', 2)
+    generator = make_generator(monkeypatch, {'lang': 'English'})
+    running, peak = 0, 0
+    summarize = generator.create_completion
+
+    async def counting(prompt, identifier, max_tokens=None, stream=False):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        try:
+            return await summarize(prompt, identifier)
+        finally:
+            running -= 1
+
+    monkeypatch.setattr(generator, 'create_completion', counting)
+    page = large_page()
+    summary = asyncio.run(generator.summarize_text(page))
+
+    chunks = OpenAIClient.chunk_text(page, 200)
+    assert len(chunks) > 2
+    assert generator.prompts[:len(chunks)] == chunks
+    assert len(generator.prompts) == len(chunks) + 1           # One reduce step over the partial summaries.
+    assert generator.prompts[-1].count('Summary of') == len(chunks)
+    assert summary.startswith('Summary of')
+    assert peak <= 2
+
+
+def test_summaries_that_dont_shrink_stop_after_the_max_depth(monkeypatch, summary_cache):
+    monkeypatch.setattr(OpenAIClient, 'SUMMARY_CHUNK_TOKENS', 200)
+    monkeypatch.setattr(OpenAIClient, 'SUMMARY_MAX_DEPTH', 2)
+    generator = make_generator(monkeypatch, {'lang': 'English'})
+
+    async def verbose(prompt, identifier, max_tokens=None, stream=False):
+        generator.prompts.append(prompt)
+        return prompt                                           # A model that repeats rather than summarizes.
+
+    monkeypatch.setattr(generator, 'create_completion', verbose)
+    page = large_page()
+    asyncio.run(generator.summarize_text(page))
+
+    chunks = len(OpenAIClient.chunk_text(page, 200))
+    assert len(generator.prompts) == 2 * chunks + 1            # Two map rounds, then one reduce.
+    assert OpenAIClient.estimate_tokens(generator.prompts[-1]) <= 200
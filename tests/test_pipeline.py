@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+from utils.pipeline import Pipeline, Stage, StageTimeoutError
+
+
+async def value(result, seconds: float = 0.0, **inputs):
+    await asyncio.sleep(seconds)
+    return result
+
+
+def test_stages_get_the_results_of_their_dependencies():
+    async def main():
+        pipeline = Pipeline([Stage('scrape', lambda: value('text')),
+                             Stage('summary', lambda scrape: value(scrape.upper()), deps=['scrape']),
+                             Stage('campaign', lambda summary: value(summary + '!'), deps=['summary']),
+                             Stage('platform', lambda summary: value(len(summary)), deps=['summary'])])
+        return await pipeline.run()
+
+    assert asyncio.run(main()) == {'scrape': 'text', 'summary': 'TEXT', 'campaign': 'TEXT!', 'platform': 4}
+
+
+def test_unknown_dependencies_are_rejected():
+    with pytest.raises(ValueError):
+        Pipeline([Stage('summary', value, deps=['scrape'])])
+
+
+def test_deadline_times_out_the_stage_and_its_dependents():
+    async def main():
+        pipeline = Pipeline([Stage('scrape', lambda: value('text')),
+                             Stage('summary', lambda scrape: value('summary', 10), deps=['scrape']),
+                             Stage('campaign', lambda summary: value('campaign'), deps=['summary']),
+                             Stage('platform', lambda scrape: value('platform'), deps=['scrape'])],
+                            deadline=0.05)
+        assert await pipeline.result('platform') == 'platform'
+        for name in ('summary', 'campaign'):
+            with pytest.raises(StageTimeoutError):
+                await pipeline.result(name)
+        return pipeline, pipeline.elapsed()
+
+    pipeline, elapsed = asyncio.run(main())
+    assert elapsed < 1
+    assert pipeline.outcomes() == {'scrape': 'ok', 'summary': 'timed_out', 'campaign': 'timed_out',
+                                   'platform': 'ok'}
+
+
+def test_stages_starting_after_the_deadline_time_out_right_away():
+    async def main():
+        started = []
+
+        async def late():
+            started.append(1)
+            return 'never'
+
+        pipeline = Pipeline([Stage('scrape', lambda: value('text', 0.05)),
+                             Stage('summary', lambda scrape: late(), deps=['scrape'])], deadline=0.01)
+        with pytest.raises(StageTimeoutError):
+            await pipeline.result('summary')
+        return started
+
+    # The scrape is cut off by the deadline, so the summary never starts.
+    assert asyncio.run(main()) == []
+
+
+def test_timeouts_of_the_stage_itself_are_not_deadline_errors():
+    async def main():
+        async def scrape():
+            raise asyncio.TimeoutError('scraper timed out')
+
+        pipeline = Pipeline([Stage('scrape', scrape)], deadline=10)
+        with pytest.raises(TimeoutError) as error:
+            await pipeline.run()
+        return error.value
+
+    assert not isinstance(asyncio.run(main()), StageTimeoutError)
@@ -0,0 +1,60 @@
+import os
+
+from utils.prompts import LANGUAGE_SUFFIX, PromptRegistry
+
+
+def write(path, text: str, mtime: float) -> None:
+    path.write_text(text, encoding='utf-8')
+    os.utime(path, (mtime, mtime))
+
+
+def make_registry(tmp_path, reload_interval: float = 1e-6) -> PromptRegistry:
+    write(tmp_path / 'summary.txt', 'Summarize the page.', 1000)
+    write(tmp_path / 'campaign.txt', 'Write a campaign.', 1000)
+    return PromptRegistry({'summary': str(tmp_path / 'summary.txt'), 'campaign': str(tmp_path / 'campaign.txt')},
+                          ['danish', 'english'], reload_interval=reload_interval)
+
+
+def test_system_messages_carry_the_language(tmp_path):
+    registry = make_registry(tmp_path)
+    assert registry.system('summary', 'danish') == 'Summarize the page.' + LANGUAGE_SUFFIX + 'danish'
+    assert registry.system('summary', 'german') == 'Summarize the page.' + LANGUAGE_SUFFIX + 'german'
+
+
+def test_versions_are_stable_hashes_of_the_text(tmp_path):
+    versions = make_registry(tmp_path).versions()
+    assert versions == make_registry(tmp_path).versions()
+    assert versions['summary'] != versions['campaign'] and len(versions['summary']) == 12
+
+
+def test_changed_files_are_reloaded(tmp_path):
+    registry = make_registry(tmp_path)
+    before = registry.versions()
+    write(tmp_path / 'summary.txt', 'Summarize the page briefly.', 2000)
+    assert registry.get('summary').text == 'Summarize the page briefly.'
+    after = registry.versions()
+    assert after['summary'] != before['summary'] and after['campaign'] == before['campaign']
+    assert registry.reloads == 1
+
+
+def test_touched_files_keep_their_version(tmp_path):
+    registry = make_registry(tmp_path)
+    version = registry.get('summary').version
+    write(tmp_path / 'summary.txt', 'Summarize the page.', 2000)
+    prompt = registry.get('summary')
+    assert (prompt.version, prompt.mtime, registry.reloads) == (version, 2000, 0)
+
+
+def test_files_are_not_checked_within_the_interval(tmp_path):
+    registry = make_registry(tmp_path, reload_interval=3600)
+    registry.load()
+    write(tmp_path / 'summary.txt', 'Summarize the page briefly.', 2000)
+    assert registry.get('summary').text == 'Summarize the page.'
+
+
+def test_files_failing_to_load_keep_their_previous_revision(tmp_path):
+    registry = make_registry(tmp_path)
+    version = registry.get('summary').version
+    os.remove(tmp_path / 'summary.txt')
+    assert registry.get('summary').version == version
+    assert registry.reloads == 0
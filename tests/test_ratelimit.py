@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+from utils.ratelimit import ModelLimiter, RateLimiter, RateLimitedError
+
+
+class FlakyError(Exception):
+    def __init__(self, status_code: int = 500):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def flaky(failures: int, status_code: int = 500):
+    """ A completion that fails 'failures' times before it succeeds, and counts its attempts."""
+    attempts = []
+
+    async def func():
+        attempts.append(1)
+        if len(attempts) <= failures:
+            raise FlakyError(status_code)
+        return 'completion'
+    return func, attempts
+
+
+def test_settle_corrects_the_estimate():
+    limiter = ModelLimiter('gpt-test', rpm=100, tpm=1000)
+    limiter.tokens.take(300)
+    limiter.settle(300, 100)
+    assert limiter.tokens.level == pytest.approx(900)
+    limiter.settle(300, None)               # Unknown usage keeps the estimate.
+    assert limiter.tokens.level == pytest.approx(900)
+
+
+def test_failed_attempts_are_refunded():
+    async def main():
+        scheduler = RateLimiter({'gpt-test': {'rpm': 100, 'tpm': 1000}}, max_retries=4, base_delay=0)
+        func, attempts = flaky(2)
+        result = await scheduler.call('gpt-test', 300, func, retry_on=(FlakyError,))
+        return result, attempts, scheduler.limiter('gpt-test')
+
+    result, attempts, limiter = asyncio.run(main())
+    assert result == 'completion'
+    assert len(attempts) == 3
+    # Only the attempt that succeeded holds on to its estimate, until it is settled with the actual usage.
+    assert limiter.tokens.level == pytest.approx(700, abs=5)
+    assert limiter.granted == 3
+
+
+def test_retries_are_exhausted():
+    async def main():
+        # A 429 empties the buckets, so they refill fast here, to keep the test short.
+        scheduler = RateLimiter({'gpt-test': {'rpm': 60000, 'tpm': 600000}}, max_retries=2, base_delay=0)
+        func, attempts = flaky(10, status_code=429)
+        with pytest.raises(RateLimitedError):
+            await scheduler.call('gpt-test', 300, func, retry_on=(FlakyError,))
+        return attempts, scheduler.limiter('gpt-test')
+
+    attempts, limiter = asyncio.run(main())
+    assert len(attempts) == 3
+    assert limiter.rate_limited == 3
+
+
+def test_models_without_limits_are_not_held_back():
+    async def main():
+        scheduler = RateLimiter({}, max_retries=1, base_delay=0)
+        func, attempts = flaky(1)
+        return await scheduler.call('gpt-test', 10 ** 9, func, retry_on=(FlakyError,)), scheduler.stats()
+
+    assert asyncio.run(main()) == ('completion', {})
+
+
+def test_waiting_calls_go_by_priority():
+    async def main():
+        limiter = ModelLimiter('gpt-test', rpm=600, tpm=10 ** 6)
+        limiter.requests.level = 0                  # Refills one request every 0.1 seconds.
+        order = []
+
+        async def call(name: str, priority_name: str):
+            await limiter.acquire(1, priority_name)
+            order.append(name)
+
+        batch = asyncio.ensure_future(call('batch', 'batch'))
+        await asyncio.sleep(0)
+        stream = asyncio.ensure_future(call('streaming', 'streaming'))
+        await asyncio.gather(batch, stream)
+        return order
+
+    assert asyncio.run(main()) == ['streaming', 'batch']
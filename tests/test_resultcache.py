@@ -0,0 +1,108 @@
+import asyncio
+import contextvars
+
+from utils.cache import TieredCache
+from utils.resultcache import StaleWhileRevalidate
+
+
+def make_swr(soft_ttl: float = 60) -> StaleWhileRevalidate:
+    return StaleWhileRevalidate(TieredCache('swr', disk=False), soft_ttl=soft_ttl)
+
+
+def returning(value, calls: list, seconds: float = 0):
+    async def compute():
+        calls.append(value)
+        await asyncio.sleep(seconds)
+        if isinstance(value, Exception):
+            raise value
+        return value
+    return compute
+
+
+def test_misses_are_computed_and_then_hit():
+    async def main():
+        swr, calls = make_swr(), []
+        first = await swr.get('key', returning('campaign', calls), returning('refreshed', calls))
+        second = await swr.get('key', returning('other', calls), returning('refreshed', calls))
+        return first, second, calls, await swr.astats()
+
+    first, second, calls, stats = asyncio.run(main())
+    assert (first, second, calls) == (('campaign', 'MISS'), ('campaign', 'HIT'), ['campaign'])
+    assert (stats['hits'], stats['misses'], stats['refreshes']) == (1, 1, 0)
+
+
+def test_stale_values_are_served_and_refreshed_in_the_background():
+    async def main():
+        swr, calls = make_swr(soft_ttl=0.01), []
+        await swr.get('key', returning('old', calls), returning('refreshed', calls))
+        await asyncio.sleep(0.02)
+        stale = await swr.get('key', returning('other', calls), returning('new', calls, seconds=0.01))
+        again = await swr.get('key', returning('other', calls), returning('newer', calls))
+        refreshing = (await swr.astats())['refreshing']
+        await asyncio.sleep(0.05)
+        swr.soft_ttl = 60
+        fresh = await swr.get('key', returning('other', calls), returning('newer', calls))
+        return stale, again, refreshing, fresh, calls, await swr.astats()
+
+    stale, again, refreshing, fresh, calls, stats = asyncio.run(main())
+    assert (stale, again, fresh) == (('old', 'STALE'), ('old', 'STALE'), ('new', 'HIT'))
+    # The second stale read joined the refresh already in flight.
+    assert (refreshing, calls) == (1, ['old', 'new'])
+    assert (stats['stale'], stats['refreshes'], stats['refreshing']) == (2, 1, 0)
+
+
+def test_refreshes_run_detached_from_the_request():
+    marker = contextvars.ContextVar('marker', default=None)
+
+    async def main():
+        swr, calls, seen = make_swr(soft_ttl=0.01), [], []
+
+        async def refresh():
+            seen.append(marker.get())
+            return 'new'
+
+        await swr.get('key', returning('old', calls), refresh)
+        await asyncio.sleep(0.02)
+        marker.set('request')
+        stale = await swr.get('key', returning('other', calls), refresh)
+        await asyncio.sleep(0.01)
+        return stale, seen, await swr.cache.aget('key')
+
+    assert asyncio.run(main()) == (('old', 'STALE'), [None], 'new')
+
+
+def test_failed_refreshes_keep_the_stale_value():
+    async def main():
+        swr, calls = make_swr(soft_ttl=0.01), []
+        await swr.get('key', returning('old', calls), returning('refreshed', calls))
+        await asyncio.sleep(0.02)
+        await swr.get('key', returning('other', calls), returning(ValueError('OpenAI failed'), calls))
+        await asyncio.sleep(0.01)
+        return await swr.get('key', returning('other', calls), returning('refreshed', calls, seconds=1)), \
+            await swr.astats()
+
+    value, stats = asyncio.run(main())
+    assert value == ('old', 'STALE')
+    assert stats['refresh_failures'] == 1
+
+
+def test_concurrent_misses_share_one_computation():
+    async def main():
+        swr, calls = make_swr(), []
+        results = await asyncio.gather(*(swr.get('key', returning('campaign', calls, seconds=0.01),
+                                                 returning('refreshed', calls)) for _ in range(3)))
+        return results, calls
+
+    results, calls = asyncio.run(main())
+    assert results == [('campaign', 'MISS')] * 3
+    assert calls == ['campaign']
+
+
+def test_forced_refreshes_skip_the_cache():
+    async def main():
+        swr, calls = make_swr(), []
+        await swr.get('key', returning('old', calls), returning('refreshed', calls))
+        forced = await swr.get('key', returning('new', calls), returning('refreshed', calls), force_refresh=True)
+        return forced, await swr.get('key', returning('other', calls), returning('refreshed', calls))
+
+    assert asyncio.run(main()) == (('new', 'MISS'), ('new', 'HIT'))
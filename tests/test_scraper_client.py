@@ -0,0 +1,58 @@
+import json
+import asyncio
+import threading
+
+import pytest
+
+from ScraperClient import ScraperClient, ScraperTimeoutError, ScraperTransport
+
+
+class BlockingTransport(ScraperTransport):
+    """ Answers right away, except for URLs containing 'slow', which wait until released."""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.invoked = []
+
+    def invoke(self, payload: dict) -> dict:
+        self.invoked.append(payload['url'])
+        if 'slow' in payload['url']:
+            self.release.wait(5)
+        return {'statusCode': 200, 'body': json.dumps({'site_text': f"Text of {payload['url']}"})}
+
+
+def test_transports_must_implement_invoke():
+    with pytest.raises(TypeError):
+        ScraperTransport()
+
+
+def test_scrapes_return_the_decoded_body():
+    client = ScraperClient(BlockingTransport(), max_concurrency=2, timeout=1)
+    try:
+        assert asyncio.run(client.scrape('https://example.com')) == {'site_text': 'Text of https://example.com'}
+        assert client.in_flight == 0
+    finally:
+        client.close()
+
+
+def test_timed_out_invocations_keep_their_slot_until_they_finish():
+    transport = BlockingTransport()
+    client = ScraperClient(transport, max_concurrency=1, timeout=0.05)
+
+    async def main():
+        with pytest.raises(ScraperTimeoutError):
+            await client.scrape('https://example.com/slow')
+        assert client.in_flight == 1            # The invocation still runs on the only executor thread.
+
+        fast = asyncio.ensure_future(client.scrape('https://example.com/fast', timeout=1))
+        await asyncio.sleep(0.1)
+        assert not fast.done() and transport.invoked == ['https://example.com/slow']
+
+        transport.release.set()                 # The slow invocation finishes, and hands its slot on.
+        return await fast
+
+    try:
+        assert asyncio.run(main()) == {'site_text': 'Text of https://example.com/fast'}
+        assert client.in_flight == 0
+    finally:
+        client.close()
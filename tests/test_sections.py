@@ -0,0 +1,87 @@
+import re
+import random
+
+import pytest
+
+from utils.sections import SectionParser
+
+CAMPAIGN = (
+    "**Campaign Title**\n"
+    "Play more, pay less with Nordic Games\n"
+    "\n"
+    "**About the Company**\n"
+    "Nordic Games is a Danish board game shop, with more than 4,000 games in stock.\n"
+    "\n"
+    "They ship across Scandinavia within two days, and host game nights in Copenhagen.\n"
+    "\n"
+    "**Campaign Description**\n"
+    "Promote the *Spring Sale* to families and hobby gamers:\n"
+    "- 20% off every family game\n"
+    "- Free shipping on orders above 500 DKK\n"
+    "\n"
+    "Affiliates earn 10% on every sale."
+)
+
+
+def legacy_parse(text: str) -> dict:
+    """ How campaigns were split into sections before the SectionParser, with regexes over the complete text."""
+    sections = {"title": "", "aboutCompany": "", "description": ""}
+    title_match = re.search(r"\*\*Campaign Title\*\*\n(.+)\n", text)
+    if title_match:
+        sections["title"] = title_match.group(1).strip()
+    about_match = re.search(r"\*\*About the Company\*\*\n(.+?)\n\n\*\*Campaign Description\*\*", text, re.DOTALL)
+    if about_match:
+        sections["aboutCompany"] = about_match.group(1).strip()
+    description_match = re.search(r"\*\*Campaign Description\*\*\n(.+)", text, re.DOTALL)
+    if description_match:
+        sections["description"] = description_match.group(1).strip()
+    return sections
+
+
+def parse(chunks: list) -> tuple[dict, list]:
+    parser = SectionParser()
+    events = []
+    for chunk in chunks:
+        events.extend(parser.feed(chunk))
+    events.extend(parser.finish())
+    return parser.sections(), events
+
+
+def test_whole_campaign_matches_the_regexes():
+    sections, events = parse([CAMPAIGN])
+    assert sections == legacy_parse(CAMPAIGN)
+    assert [event['section'] for event in events if event['event'] == 'section_start'] == \
+        ['title', 'aboutCompany', 'description']
+
+
+@pytest.mark.parametrize('split', range(1, len(CAMPAIGN)))
+def test_every_chunk_boundary_matches_the_regexes(split):
+    assert parse([CAMPAIGN[:split], CAMPAIGN[split:]])[0] == legacy_parse(CAMPAIGN)
+
+
+def test_single_characters_and_random_chunks_match_the_regexes():
+    expected = legacy_parse(CAMPAIGN)
+    assert parse(list(CAMPAIGN))[0] == expected
+    rng = random.Random(42)
+    for _ in range(200):
+        cuts = sorted(rng.sample(range(1, len(CAMPAIGN)), rng.randint(2, 40)))
+        chunks = [CAMPAIGN[start:end] for start, end in zip([0] + cuts, cuts + [len(CAMPAIGN)])]
+        assert parse(chunks)[0] == expected
+
+
+def test_deltas_add_up_to_the_sections():
+    rng = random.Random(7)
+    cuts = sorted(rng.sample(range(1, len(CAMPAIGN)), 30))
+    sections, events = parse([CAMPAIGN[start:end] for start, end in zip([0] + cuts, cuts + [len(CAMPAIGN)])])
+    streamed = {section: '' for section in sections}
+    for event in events:
+        if event['event'] == 'section_delta':
+            streamed[event['section']] += event['text']
+    assert {section: text.strip() for section, text in streamed.items()} == sections
+
+
+def test_other_languages_and_inline_headers():
+    campaign = ("## 1. Kampagnetitel:\nSpil mere\n\n**Om virksomheden:** En dansk butik.\n\n"
+                "### Kampagnebeskrivelse\nTyve procent rabat.")
+    assert parse([campaign])[0] == {"title": "Spil mere", "aboutCompany": "En dansk butik.",
+                                    "description": "Tyve procent rabat."}
@@ -0,0 +1,138 @@
+import asyncio
+import contextvars
+
+import pytest
+
+from utils import ratelimit
+from utils.singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_result():
+    async def main():
+        flights, started = SingleFlight('test'), []
+
+        async def work():
+            started.append(1)
+            await asyncio.sleep(0.01)
+            return 'page'
+
+        results = await asyncio.gather(*(flights.do('key', work) for _ in range(5)))
+        return results, started, flights.stats()
+
+    results, started, stats = asyncio.run(main())
+    assert results == ['page'] * 5
+    assert len(started) == 1
+    assert stats == {"started": 1, "duplicates_avoided": 4, "in_flight": 0}
+
+
+def test_cancelling_one_caller_keeps_the_shared_work():
+    async def main():
+        flights, release = SingleFlight('test'), asyncio.Event()
+
+        async def work():
+            await release.wait()
+            return 'page'
+
+        first = asyncio.ensure_future(flights.do('key', work))
+        second = asyncio.ensure_future(flights.do('key', work))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        return first, await second
+
+    first, second = asyncio.run(main())
+    assert first.cancelled()
+    assert second == 'page'
+
+
+def test_cancelling_the_last_caller_cancels_the_work():
+    async def main():
+        flights, cancelled = SingleFlight('test'), asyncio.Event()
+
+        async def work():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        callers = [asyncio.ensure_future(flights.do('key', work)) for _ in range(2)]
+        await asyncio.sleep(0)
+        for caller in callers:
+            caller.cancel()
+        await asyncio.wait_for(cancelled.wait(), 1)
+        return flights.stats()
+
+    assert asyncio.run(main())['in_flight'] == 0
+
+
+def test_errors_reach_every_caller_and_are_not_cached():
+    async def main():
+        flights, attempts = SingleFlight('test'), []
+
+        async def work():
+            attempts.append(1)
+            await asyncio.sleep(0)
+            raise ValueError('scrape failed')
+
+        results = await asyncio.gather(*(flights.do('key', work) for _ in range(3)), return_exceptions=True)
+        with pytest.raises(ValueError):
+            await flights.do('key', work)
+        return results, attempts
+
+    results, attempts = asyncio.run(main())
+    assert all(isinstance(result, ValueError) for result in results)
+    assert len(attempts) == 2
+
+
+def test_shared_work_runs_outside_the_callers_context():
+    async def main():
+        flights, release, seen = SingleFlight('test'), asyncio.Event(), []
+        marker = contextvars.ContextVar('marker', default=None)
+
+        async def work():
+            seen.append((marker.get(), ratelimit.priority.get()))
+            await release.wait()
+            seen.append((marker.get(), ratelimit.priority.get()))
+            return 'page'
+
+        async def caller(name: str, priority_name: str):
+            marker.set(name)
+            ratelimit.priority.set(priority_name)
+            return await flights.do('key', work)
+
+        batch = asyncio.ensure_future(caller('batch', 'batch'))
+        await asyncio.sleep(0.01)
+        stream = asyncio.ensure_future(caller('stream', 'streaming'))
+        await asyncio.sleep(0.01)
+        release.set()
+        return await asyncio.gather(batch, stream), seen
+
+    results, seen = asyncio.run(main())
+    assert results == ['page', 'page']
+    # Nothing of the first caller leaks into the work, but its priority, which is raised by the streaming caller.
+    assert seen == [(None, 'batch'), (None, 'streaming')]
+
+
+def test_less_urgent_callers_do_not_lower_the_priority():
+    async def main():
+        flights, release, seen = SingleFlight('test'), asyncio.Event(), []
+
+        async def work():
+            await release.wait()
+            seen.append(ratelimit.priority.get())
+
+        async def caller(priority_name: str):
+            ratelimit.priority.set(priority_name)
+            await flights.do('key', work)
+
+        first = asyncio.ensure_future(caller('streaming'))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(caller('batch'))
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(first, second)
+        return seen
+
+    assert asyncio.run(main()) == ['streaming']
@@ -0,0 +1,47 @@
+import pytest
+
+from utils.tokens import chunk_text, estimate_tokens, truncate_text
+
+PARAGRAPHS = [f"Paragraph {number} is about board games, card games and puzzles for the whole family." * (number % 4 + 1)
+              for number in range(60)]
+PAGE = '\n'.join(PARAGRAPHS)
+
+
+def test_estimate_tokens():
+    assert estimate_tokens('') == 1
+    assert estimate_tokens('a' * 400) == 101
+    # Non-ASCII text takes more tokens per character, and is counted at 2 characters per token.
+    assert estimate_tokens('æ' * 400) == 201
+    assert estimate_tokens('Описание кампании') > estimate_tokens('Campaign description')
+
+
+@pytest.mark.parametrize('max_tokens', [25, 60, 200, 1000])
+def test_chunks_fit_the_budget_and_keep_every_paragraph(max_tokens):
+    chunks = chunk_text(PAGE, max_tokens)
+    assert all(estimate_tokens(chunk) <= max_tokens for chunk in chunks)
+    assert ' '.join(' '.join(chunks).split()) == ' '.join(PAGE.split())
+
+
+def test_paragraphs_are_never_split_when_they_fit():
+    chunks = chunk_text(PAGE, 200)
+    assert set('\n'.join(chunks).split('\n')) == set(PARAGRAPHS)
+
+
+def test_oversized_paragraphs_are_split_on_sentences_then_words():
+    sentences = 'First sentence here. Second sentence here! Third one?'
+    assert chunk_text(sentences, 6) == ['First sentence here.', 'Second sentence here!', 'Third one?']
+    words = 'word ' * 40
+    assert all(estimate_tokens(chunk) <= 5 for chunk in chunk_text(words, 5))
+
+
+def test_blank_lines_are_dropped():
+    assert chunk_text('\n\n  first  \n\n\nsecond\n', 100) == ['first\nsecond']
+    assert chunk_text('\n \n', 100) == []
+
+
+def test_truncate_text():
+    truncated = truncate_text(PAGE, 100)
+    assert estimate_tokens(truncated) <= 100
+    assert PAGE.startswith(truncated.split('\n')[0])
+    assert truncate_text('short', 100) == 'short'
+    assert truncate_text('', 100) == ''
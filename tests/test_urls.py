@@ -0,0 +1,27 @@
+import pytest
+
+from utils.urls import normalize_url
+
+
+@pytest.mark.parametrize('url', [
+    'https://www.example.com/shop',
+    'HTTPS://WWW.Example.com/shop/',
+    'https://www.example.com:443/shop',
+    'https://www.example.com/shop#reviews',
+    'https://www.example.com/shop?utm_source=mail&utm_campaign=spring',
+    'https://www.example.com/shop?gclid=abc&fbclid=def',
+    '  https://www.example.com/shop  ',
+])
+def test_spellings_of_the_same_page_share_a_key(url):
+    assert normalize_url(url) == 'https://www.example.com/shop'
+
+
+def test_query_parameters_are_kept_and_sorted():
+    assert normalize_url('https://example.com/search?q=games&page=2&utm_medium=cpc') == \
+        'https://example.com/search?page=2&q=games'
+
+
+def test_different_pages_keep_different_keys():
+    keys = {normalize_url(url) for url in ('https://example.com/a', 'https://example.com/b', 'http://example.com/a',
+                                            'https://example.com:8443/a', 'https://example.com/a?id=1')}
+    assert len(keys) == 5
@@ -0,0 +1,123 @@
+"""
+Time spent on cookie banners per scrape. Compares the previous CookieClicker (implicitly_wait(5), then WebDriverWait for
+3 seconds on the union of all XPaths) with the current one (one script for known consent managers and the XPaths,
+waiting only when a consent manager is on the page), in a pooled Chrome, on locally served pages:
+- the HTML fixtures, which have no banner,
+- the fixtures with a OneTrust banner added, scraped twice, the second time with the selector learned for the domain.
+
+Needs Selenium and Chrome as in the Lambda image (see DriverPool). Run from the webscraper_lambda directory:
+    python benchmarks/bench_cookies.py [--repeat 3]
+"""
+import os
+import re
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import statistics
+
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+os.environ.setdefault('COOKIE_SELECTOR_CACHE', os.path.join(tempfile.mkdtemp(), 'cookie_selectors.json'))
+
+import CookieClicker  # noqa: E402
+from DriverPool import driver_pool  # noqa: E402
+
+FIXTURES = os.path.join(ROOT, 'benchmarks', 'fixtures')
+
+BANNER = ('<div id="onetrust-consent-sdk"><div id="onetrust-banner-sdk"><p>We use cookies to improve your '
+          'experience.</p><button id="onetrust-accept-btn-handler">Accept All Cookies</button></div></div>')
+
+
+def legacy_click(driver) -> bool:
+    """ The cookie handling as it was done before the fast detection, kept here for comparison."""
+    from selenium.common import TimeoutException
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.wait import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as ec
+
+    driver.implicitly_wait(5)
+    try:
+        button = WebDriverWait(driver, 3).until(
+            ec.visibility_of_any_elements_located((By.XPATH, ' | '.join(CookieClicker.XPATHS))))[0]
+        driver.execute_script("arguments[0].click();", button)
+        return True
+    except TimeoutException:
+        return False
+    finally:
+        driver.implicitly_wait(0)
+
+
+def serve(directory: str) -> str:
+    server = ThreadingHTTPServer(('127.0.0.1', 0), partial(QuietHandler, directory=directory))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args) -> None:
+        pass
+
+
+def prepare_pages() -> tuple[str, list, list]:
+    """ Copies the fixtures to a temporary directory, along with a version of each that has a consent banner."""
+    directory = tempfile.mkdtemp()
+    plain, banner = [], []
+    for name in sorted(os.listdir(FIXTURES)):
+        shutil.copy(os.path.join(FIXTURES, name), os.path.join(directory, name))
+        with open(os.path.join(FIXTURES, name), 'r', encoding='utf-8') as file:
+            html = file.read()
+        with open(os.path.join(directory, 'banner_' + name), 'w', encoding='utf-8') as file:
+            file.write(re.sub(r'(<body[^>]*>)', lambda match: match.group(1) + BANNER, html, count=1))
+        plain.append(name)
+        banner.append('banner_' + name)
+    return directory, plain, banner
+
+
+def measure(driver, url: str, mode: str) -> tuple[float, bool]:
+    driver.get(url)
+    flag1 = time.perf_counter()
+    if mode == 'legacy':
+        clicked = legacy_click(driver)
+    else:
+        clicked = CookieClicker.Cookie(driver, url).click_accept_cookies()
+    return time.perf_counter() - flag1, clicked
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    directory, plain, banner = prepare_pages()
+    base_url = serve(directory)
+    pooled, _ = driver_pool.acquire()
+    driver = pooled.driver
+    try:
+        cases = [('no banner', plain, 'legacy'), ('no banner', plain, 'fast'),
+                 ('banner', banner, 'legacy'), ('banner, first visit', banner, 'fast'),
+                 ('banner, learned', banner, 'fast')]
+        print(f"{'pages':<22}{'mode':>8}{'median':>9}{'max':>9}{'clicked':>9}")
+        for label, pages, mode in cases:
+            seconds, clicks = [], 0
+            for _ in range(args.repeat):
+                for page in pages:
+                    if label == 'banner, first visit':
+                        CookieClicker.selector_cache.forget(CookieClicker.cookie_domain(base_url))
+                    elapsed, clicked = measure(driver, f"{base_url}/{page}", mode)
+                    seconds.append(elapsed)
+                    clicks += clicked
+            print(f"{label:<22}{mode:>8}{statistics.median(seconds):>9.3f}{max(seconds):>9.3f}"
+                  f"{clicks:>5}/{len(seconds):<3}")
+    finally:
+        driver_pool.release(pooled, healthy=False)
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Micro-benchmark for page text extraction. Compares the previous implementation of WebScraper.extract_text
+(BeautifulSoup with html.parser, find_all('p') and string concatenation) with the single pass ContentExtractor, on the
+stored HTML fixtures. Each fixture is also scaled up, to show how both behave on large pages.
+
+Run from the webscraper_lambda directory:
+    python benchmarks/bench_extract.py [--scale 1 10 100] [--repeat 5]
+"""
+import os
+import re
+import sys
+import time
+import argparse
+import importlib.util
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+from ContentExtractor import extract_content  # noqa: E402
+from ContentFilter import ContentFilter  # noqa: E402
+
+FIXTURES = os.path.join(ROOT, 'benchmarks', 'fixtures')
+
+
+def legacy_extract(html: str, keywords: list) -> str:
+    """ The extraction as it was done before ContentExtractor, kept here for comparison."""
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, "html.parser")
+    keywords_pattern = re.compile('|'.join(map(re.escape, keywords)), re.IGNORECASE)
+    items = soup.find_all('p')
+    title = soup.title.get_text()
+    page_text = ""
+    for item in items:
+        item_text = item.get_text()
+        if not keywords_pattern.search(item_text):
+            page_text += f" {item_text}"
+    return title + page_text
+
+
+def single_pass_extract(html: str, content_filter: ContentFilter) -> str:
+    extractor = extract_content(html, content_filter)
+    return extractor.title + extractor.page_text()
+
+
+def scale_page(html: str, factor: int) -> str:
+    """ Repeats the body of a page, numbering the paragraphs, so the copies aren't dropped as duplicates."""
+    start, end = html.index('<body'), html.rindex('</body>')
+    body = html[html.index('>', start) + 1:end]
+    copies = [body.replace('<p>', f'<p>[{i}] ').replace('<p ', f'<p data-copy="{i}" ') for i in range(factor)]
+    return html[:html.index('>', start) + 1] + ''.join(copies) + html[end:]
+
+
+def measure(func, *args, repeat: int) -> tuple[float, float]:
+    """ Returns the best wall time over 'repeat' runs in milliseconds, and the peak traced memory in KiB."""
+    best = float('inf')
+    for _ in range(repeat):
+        flag1 = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - flag1)
+
+    tracemalloc.start()
+    func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best * 1000, peak / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    content_filter = ContentFilter.from_file(os.path.join(ROOT, 'utils', 'keywords.txt'))
+    keywords = content_filter.keywords
+    has_bs4 = importlib.util.find_spec('bs4') is not None
+    if not has_bs4:
+        print("beautifulsoup4 is not installed, only the single pass extractor is measured.\n")
+
+    print(f"{'fixture':<24}{'scale':>6}{'size KiB':>10}{'legacy ms':>11}{'legacy KiB':>12}"
+          f"{'new ms':>9}{'new KiB':>10}{'speedup':>9}")
+    for name in sorted(os.listdir(FIXTURES)):
+        with open(os.path.join(FIXTURES, name), 'r', encoding='utf-8') as file:
+            page = file.read()
+        for factor in args.scale:
+            html = scale_page(page, factor)
+            new_ms, new_kib = measure(single_pass_extract, html, content_filter, repeat=args.repeat)
+            if has_bs4:
+                old_ms, old_kib = measure(legacy_extract, html, keywords, repeat=args.repeat)
+                print(f"{name:<24}{factor:>6}{len(html) / 1024:>10.0f}{old_ms:>11.2f}{old_kib:>12.0f}"
+                      f"{new_ms:>9.2f}{new_kib:>10.0f}{old_ms / new_ms:>8.1f}x")
+            else:
+                print(f"{name:<24}{factor:>6}{len(html) / 1024:>10.0f}{'-':>11}{'-':>12}"
+                      f"{new_ms:>9.2f}{new_kib:>10.0f}{'-':>9}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""
+Throughput benchmark for the boilerplate keyword matcher. Compares the previous approach (one case insensitive
+alternation regex over all keywords, rebuilt per scrape) with the trie shaped pattern of ContentFilter, on the
+paragraphs of the stored HTML fixtures. Besides the keywords in utils/keywords.txt, the keyword list is padded with
+generated keywords, to show how both scale to hundreds of keywords per language.
+
+Also shows how much of a marketing-heavy page is kept, with the cookie and consent phrases of utils/keywords.txt and
+with those plus the generic words the list used to have, which dropped paragraphs about the company's own marketing.
+
+Run from the webscraper_lambda directory:
+    python benchmarks/bench_filter.py [--keywords 0 500 2000] [--repeat 5]
+"""
+import os
+import re
+import sys
+import time
+import random
+import string
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+from ContentExtractor import extract_content  # noqa: E402
+from ContentFilter import ContentFilter, build_keyword_pattern  # noqa: E402
+
+FIXTURES = os.path.join(ROOT, 'benchmarks', 'fixtures')
+
+# Words utils/keywords.txt used to have, which also occur in the content of the page.
+GENERIC_KEYWORDS = ['cookie', 'marketing', 'Privacy Policy', 'samtykke', 'privacidad', 'seguimiento', 'kakor',
+                    'einwilligung', 'impressum', 'adatvédelmi', 'куки']
+
+# A marketing agency's page, with a cookie banner and a footer. Everything in <main> is content.
+MARKETING_PAGE = """<html><head><title>Brightline - Performance marketing agency</title></head><body>
+<div id="cookie-banner"><p>We use cookies to personalise content and ads. Read our cookie policy, or accept all
+cookies to continue.</p><button>Accept all cookies</button></div>
+<nav><a href="/">Home</a> <a href="/services">Services</a> <a href="/cases">Cases</a>
+<a href="/contact">Contact</a></nav>
+<main>
+<h1>Marketing that pays for itself</h1>
+<p>Brightline is a performance marketing agency for webshops and subscription businesses. We plan, run and measure
+campaigns across search, social and email, and only take a fee on the revenue they bring in.</p>
+<p>Our marketing team has run more than 400 campaigns for brands in Scandinavia and Germany, from small cookie bakeries
+to national telecom providers.</p>
+<h2>Services</h2>
+<p>Email marketing: welcome flows, abandoned cart reminders and newsletters, written and tested by our copywriters.</p>
+<p>Content marketing: articles, guides and videos that rank in search and answer the questions your customers ask.</p>
+<p>Influencer marketing: we find creators whose audience matches yours, and track every sale back to them.</p>
+<p>Privacy-first tracking: server side conversion tracking that respects the Privacy Policy of your site and the
+consent of your visitors, without losing sight of what works.</p>
+<h2>Cases</h2>
+<p>For Kakor &amp; Bröd, a Swedish bakery chain, our seasonal marketing campaign doubled online pre-orders of
+semlor in February, at a third of the cost per order of the previous year.</p>
+<p>For a German fintech, we rebuilt the marketing automation around the customer's einwilligung, and raised email
+opt-in rates from 18 to 31 percent.</p>
+</main>
+<footer><p>© 2024 Brightline ApS. All rights reserved.</p><p><a href="/privacy">Privacy Policy</a></p></footer>
+</body></html>"""
+
+
+def load_paragraphs(copies: int = 50) -> list:
+    """ Every paragraph of every fixture, unfiltered, repeated to get a measurable amount of text."""
+    paragraphs = []
+    for name in sorted(os.listdir(FIXTURES)):
+        with open(os.path.join(FIXTURES, name), 'r', encoding='utf-8') as file:
+            paragraphs.extend(extract_content(file.read()).paragraphs)
+    return paragraphs * copies
+
+
+def padding_keywords(count: int) -> list:
+    """ Random, plausible looking keywords, that never occur in the fixtures."""
+    rng = random.Random(42)
+    letters = string.ascii_lowercase + 'æøåäöüéè'
+    return [' '.join(''.join(rng.choice(letters) for _ in range(rng.randint(4, 10))) for _ in range(rng.randint(1, 3)))
+            for _ in range(count)]
+
+
+def legacy_filter(paragraphs: list, keywords: list) -> int:
+    keywords_pattern = re.compile('|'.join(map(re.escape, keywords)), re.IGNORECASE)
+    return sum(1 for text in paragraphs if keywords_pattern.search(text))
+
+
+def trie_filter(paragraphs: list, pattern: re.Pattern) -> int:
+    return sum(1 for text in paragraphs if pattern.search(text.lower()))
+
+
+def retained(html: str, keywords: list) -> tuple[int, int, dict]:
+    """ The paragraphs and characters kept of a page, and the characters removed by reason."""
+    extractor = extract_content(html, ContentFilter(keywords))
+    return len(extractor.paragraphs), extractor.chars, extractor.removed_chars
+
+
+def best_of(repeat: int, func, *args) -> tuple[float, int]:
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        flag1 = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - flag1)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--keywords', type=int, nargs='+', default=[0, 500, 2000],
+                        help="Number of generated keywords to add to utils/keywords.txt.")
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    base = ContentFilter.from_file(os.path.join(ROOT, 'utils', 'keywords.txt')).keywords
+    paragraphs = load_paragraphs()
+    megabytes = sum(len(text.encode('utf-8')) for text in paragraphs) / (1024 * 1024)
+    print(f"{len(paragraphs)} paragraphs, {megabytes:.2f} MB of text.\n")
+
+    print(f"{'keywords':>9}{'legacy MB/s':>13}{'trie MB/s':>11}{'speedup':>9}{'matches':>9}")
+    for extra in args.keywords:
+        keywords = base + padding_keywords(extra)
+        legacy_seconds, legacy_matches = best_of(args.repeat, legacy_filter, paragraphs, keywords)
+        pattern = build_keyword_pattern(keywords)           # Built once per container, so not part of the timing.
+        trie_seconds, trie_matches = best_of(args.repeat, trie_filter, paragraphs, pattern)
+        assert legacy_matches == trie_matches, "Both matchers should flag the same paragraphs."
+        print(f"{len(keywords):>9}{megabytes / legacy_seconds:>13.2f}{megabytes / trie_seconds:>11.2f}"
+              f"{legacy_seconds / trie_seconds:>8.1f}x{trie_matches:>9}")
+
+    print(f"\nMarketing-heavy page:\n{'keywords':<22}{'paragraphs':>11}{'kept chars':>12}  removed chars")
+    for label, keywords in (('cookie/consent phrases', base), ('plus generic words', base + GENERIC_KEYWORDS)):
+        paragraphs, chars, removed = retained(MARKETING_PAGE, keywords)
+        print(f"{label:<22}{paragraphs:>11}{chars:>12}  {removed}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+import re
+
+from html.parser import HTMLParser
+from typing import Optional
+from ContentFilter import ContentFilter
+
+# Text inside these tags is never page content.
+SKIPPED_TAGS = {'script', 'style', 'noscript', 'template', 'svg'}
+
+# Block level tags, that implicitly end an open paragraph when they start or end (like browsers do).
+BLOCK_TAGS = {'address', 'article', 'aside', 'blockquote', 'body', 'dd', 'details', 'div', 'dl', 'dt', 'fieldset',
+              'figcaption', 'figure', 'footer', 'form', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header', 'hr', 'html',
+              'li', 'main', 'nav', 'ol', 'pre', 'section', 'table', 'td', 'th', 'tr', 'ul'}
+
+# Containers that hold site chrome, rather than content.
+BOILERPLATE_CONTAINERS = ('nav', 'footer', 'aside')
+
+META_CHARSET = re.compile(rb'<meta[^>]+charset=["\']?([\w-]+)', re.IGNORECASE)
+
+
+def decode_html(raw: bytes, declared: Optional[str] = None) -> str:
+    """
+    Decodes raw HTML. Uses the charset declared in the HTTP headers, then the one in a <meta> tag, then UTF-8.
+    Undecodable bytes are replaced rather than failing the scrape.
+    """
+    candidates = [declared]
+    match = META_CHARSET.search(raw[:4096])
+    if match:
+        candidates.append(match.group(1).decode('ascii', 'ignore'))
+    candidates.append('utf-8')
+
+    for charset in candidates:
+        if not charset:
+            continue
+        try:
+            return raw.decode(charset)
+        except (LookupError, UnicodeDecodeError):
+            continue
+    return raw.decode('utf-8', errors='replace')
+
+
+class _ExtractionDone(Exception):
+    """ Raised internally to stop tokenizing, once the character cap has been reached."""
+
+
+class ContentExtractor(HTMLParser):
+    """
+    Single pass extractor for the title and paragraph text of an HTML page. Unlike building a BeautifulSoup tree and
+    searching it afterward, text is collected while the HTML is being tokenized, and no tree is ever built.
+
+    Whitespace within each paragraph is normalized, exact duplicate paragraphs are dropped, boilerplate paragraphs
+    are left out according to the ContentFilter, and extraction stops once max_chars characters of text have been
+    collected. HTML can be fed in chunks with feed(), e.g. while it is being downloaded.
+    """
+
+    def __init__(self, content_filter: Optional[ContentFilter] = None, max_chars: Optional[int] = None):
+        super().__init__(convert_charrefs=True)
+        self.content_filter = content_filter
+        self.max_chars = max_chars
+
+        self.title = ""
+        self.paragraphs = []            # Text of every kept paragraph, in document order.
+        self.chars = 0                  # Characters of paragraph text collected so far.
+        self.removed_chars = {}         # Characters left out, by reason ('duplicates', 'keywords', 'links' etc.).
+        self.truncated = False
+
+        self._seen = set()
+        self._in_title = False
+        self._title_done = False
+        self._title_parts = []
+        self._in_paragraph = False
+        self._paragraph_parts = []
+        self._link_parts = []           # Text of the current paragraph, that is inside links.
+        self._link_depth = 0
+        self._skip_depth = 0
+        self._containers = {name: 0 for name in BOILERPLATE_CONTAINERS}
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self._containers:
+            self._containers[tag] += 1
+        if tag == 'a':
+            self._link_depth += 1
+        elif tag in SKIPPED_TAGS:
+            self._skip_depth += 1
+        elif tag == 'title' and not self._title_done and not self._skip_depth:
+            self._in_title = True
+        elif tag == 'p':
+            self._end_paragraph()       # A new paragraph implicitly ends the previous one.
+            self._in_paragraph = True
+        elif tag == 'br' and self._in_paragraph:
+            self._paragraph_parts.append(' ')
+        elif tag in BLOCK_TAGS:
+            self._end_paragraph()
+
+    def handle_startendtag(self, tag, attrs):
+        if tag == 'br' and self._in_paragraph:
+            self._paragraph_parts.append(' ')
+
+    def handle_endtag(self, tag):
+        if tag in self._containers:
+            self._containers[tag] = max(self._containers[tag] - 1, 0)
+        if tag == 'a':
+            self._link_depth = max(self._link_depth - 1, 0)
+        elif tag in SKIPPED_TAGS:
+            self._skip_depth = max(self._skip_depth - 1, 0)
+        elif tag == 'title' and self._in_title:
+            self._in_title = False
+            self._title_done = True
+            self.title = ' '.join(''.join(self._title_parts).split())
+        elif tag == 'p' or tag in BLOCK_TAGS:
+            self._end_paragraph()
+
+    def handle_data(self, data):
+        if self._skip_depth:
+            return
+        if self._in_title:
+            self._title_parts.append(data)
+        elif self._in_paragraph and not self.truncated:
+            self._paragraph_parts.append(data)
+            if self._link_depth:
+                self._link_parts.append(data)
+
+    def feed(self, data):
+        if self.truncated:
+            return
+        try:
+            super().feed(data)
+        except _ExtractionDone:
+            self.rawdata = ''           # Nothing past the cap is needed, so don't tokenize the rest.
+
+    def close(self):
+        if self.truncated:
+            return
+        try:
+            super().close()
+            self._end_paragraph()
+        except _ExtractionDone:
+            self.rawdata = ''
+
+    def _end_paragraph(self):
+        if not self._in_paragraph:
+            return
+        self._in_paragraph = False
+        text = ' '.join(''.join(self._paragraph_parts).split())    # Collapse runs of spaces, tabs and newlines.
+        link_chars = len(' '.join(''.join(self._link_parts).split()))
+        self._paragraph_parts = []
+        self._link_parts = []
+
+        if not text or self.truncated:
+            return
+        if text in self._seen:
+            self._remove(text, 'duplicates')
+            return
+        self._seen.add(text)
+        if self.content_filter is not None:
+            container = next((name for name, depth in self._containers.items() if depth), None)
+            reason = self.content_filter.classify(text, link_chars, container)
+            if reason is not None:
+                self._remove(text, reason)
+                return
+
+        if self.max_chars is not None and self.chars + len(text) > self.max_chars:
+            text = text[:max(self.max_chars - self.chars, 0)]
+            self.truncated = True
+        if text:
+            self.paragraphs.append(text)
+            self.chars += len(text)
+        if self.truncated:
+            raise _ExtractionDone()
+
+    def _remove(self, text: str, reason: str):
+        self.removed_chars[reason] = self.removed_chars.get(reason, 0) + len(text)
+
+    def page_text(self) -> str:
+        """ The kept paragraphs, one per line."""
+        return '\n' + '\n'.join(self.paragraphs) if self.paragraphs else ''
+
+
+def extract_content(html: str, content_filter: Optional[ContentFilter] = None,
+                    max_chars: Optional[int] = None) -> ContentExtractor:
+    """ Runs a ContentExtractor over a complete HTML document and returns it, holding the results."""
+    extractor = ContentExtractor(content_filter, max_chars)
+    extractor.feed(html)
+    extractor.close()
+    return extractor
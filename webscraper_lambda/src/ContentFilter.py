@@ -0,0 +1,86 @@
+import re
+
+from typing import Optional
+
+
+def build_keyword_pattern(keywords: list) -> re.Pattern:
+    """
+    Compiles keywords into a single regex shaped like a trie, e.g. 'cookie', 'cookies' and 'consent' become
+    'co(?:nsent|okie)'. The regex engine then follows one branch per character of the text, instead of trying every
+    keyword at every position, so matching stays fast with hundreds of keywords.
+
+    Since we only need to know whether any keyword occurs, a keyword that extends a shorter one is redundant and left
+    out. Keywords are lowercased, so the pattern should be matched against lowercased text.
+    """
+    trie = {}
+    for keyword in sorted({keyword.lower() for keyword in keywords if keyword}, key=len):
+        node = trie
+        for char in keyword[:-1]:
+            child = node.setdefault(char, {})
+            if child is True:
+                break           # A shorter keyword is a prefix of this one, and already matches it.
+            node = child
+        else:
+            node[keyword[-1]] = True
+
+    def to_regex(node: dict) -> str:
+        ends = sorted(re.escape(char) for char, child in node.items() if child is True)
+        branches = [re.escape(char) + to_regex(child) for char, child in sorted(node.items()) if child is not True]
+        if ends:
+            branches.append(ends[0] if len(ends) == 1 else '[' + ''.join(ends) + ']')
+        return branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+
+    if not trie:
+        return re.compile(r'(?!)')     # Matches nothing.
+    return re.compile(to_regex(trie))
+
+
+class ContentFilter:
+    """
+    Decides which paragraphs of a page are boilerplate, rather than content about the company. Built once per
+    container, and shared by every scrape.
+
+    A paragraph is boilerplate, when it:
+        - contains any of the keywords (phrases of cookie and consent notices, in all supported languages),
+        - mostly consists of link text (menus, link lists),
+        - sits in a <nav>, or is short and sits in a <footer> or <aside>,
+        - is too short to carry any meaning (a lone word or price).
+    """
+
+    def __init__(self, keywords: list, max_link_density: float = 0.5, min_words: int = 2,
+                 container_min_chars: int = 150):
+        self.keywords = keywords
+        self.pattern = build_keyword_pattern(keywords)
+        self.max_link_density = max_link_density
+        self.min_words = min_words
+        self.container_min_chars = container_min_chars
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs) -> 'ContentFilter':
+        """ Reads keywords from a file, one per line. Empty lines and lines starting with '#' are ignored."""
+        with open(path, 'r', encoding='utf-8') as file:
+            keywords = [line.strip() for line in file.read().splitlines()
+                        if line.strip() and not line.lstrip().startswith('#')]
+        return cls(keywords, **kwargs)
+
+    def has_keyword(self, text: str) -> bool:
+        return self.pattern.search(text.lower()) is not None
+
+    def classify(self, text: str, link_chars: int = 0, container: Optional[str] = None) -> Optional[str]:
+        """
+        Classifies a single paragraph.
+
+        :param text: Whitespace normalized text of the paragraph.
+        :param link_chars: How many of its characters are inside <a> tags.
+        :param container: The boilerplate container the paragraph is in ('nav', 'footer' or 'aside'), if any.
+        :return: The reason it is boilerplate ('keywords', 'links', 'container' or 'short'), or None to keep it.
+        """
+        if self.has_keyword(text):
+            return 'keywords'
+        if link_chars / len(text) > self.max_link_density:
+            return 'links'
+        if container == 'nav' or (container is not None and len(text) < self.container_min_chars):
+            return 'container'
+        if len(text.split(' ', self.min_words)) < self.min_words:
+            return 'short'
+        return None
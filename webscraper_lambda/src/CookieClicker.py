@@ -1,51 +1,252 @@
+import os
+import json
+import time
 import logging
-from selenium.common import TimeoutException
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.wait import WebDriverWait
-from selenium.webdriver.support import expected_conditions as ec
+import tempfile
+
+from typing import Optional
+from urllib.parse import urlsplit
 
 logger = logging.getLogger()
 logger.setLevel("INFO")
 
+# Read the XPath selectors once per container, rather than once per scrape.
+with open('utils/xpaths.txt', 'r') as xpaths_file:
+    XPATHS = [xpath for xpath in xpaths_file.read().splitlines() if xpath.strip()]
+
+# How long to keep looking for the accept button, when a consent manager is on the page but hasn't shown its banner
+# yet, and how often to look again meanwhile. Pages without a consent manager are never waited for.
+COOKIE_WAIT_SECONDS = float(os.environ.get('COOKIE_WAIT_SECONDS', 3))
+COOKIE_POLL_SECONDS = float(os.environ.get('COOKIE_POLL_SECONDS', 0.25))
+
+# Where the selector that worked on each domain is kept, so it survives warm Lambda containers. Lambda only allows
+# writing to /tmp.
+COOKIE_SELECTOR_CACHE = os.environ.get('COOKIE_SELECTOR_CACHE', '/tmp/cookie_selectors.json')
+COOKIE_SELECTOR_CACHE_MAX_ENTRIES = int(os.environ.get('COOKIE_SELECTOR_CACHE_MAX_ENTRIES', 5000))
+
+# Consent management platforms we recognize, by the globals their scripts define or the elements they insert, along
+# with the selectors of their 'accept all' buttons. Buttons inside the (open) shadow roots of those elements are found
+# too, e.g. Usercentrics'. '__tcfapi' is defined by any IAB TCF compliant platform.
+KNOWN_CMPS = {
+    'onetrust': {'globals': ['OneTrust', 'OptanonWrapper'], 'elements': ['#onetrust-consent-sdk'],
+                 'accept': ['#onetrust-accept-btn-handler']},
+    'cookiebot': {'globals': ['Cookiebot'], 'elements': ['#CybotCookiebotDialog'],
+                  'accept': ['#CybotCookiebotDialogBodyLevelButtonLevelOptinAllowAll',
+                             '#CybotCookiebotDialogBodyButtonAccept']},
+    'cookieinformation': {'globals': ['CookieInformation'], 'elements': ['#coiOverlay'],
+                          'accept': ['.coi-banner__accept']},
+    'didomi': {'globals': ['Didomi'], 'elements': ['#didomi-host'], 'accept': ['#didomi-notice-agree-button']},
+    'usercentrics': {'globals': ['UC_UI'], 'elements': ['#usercentrics-root', '#usercentrics-cmp-ui'],
+                     'accept': ['[data-testid="uc-accept-all-button"]']},
+    'quantcast': {'globals': [], 'elements': ['.qc-cmp2-container'],
+                  'accept': ['.qc-cmp2-summary-buttons button[mode="primary"]']},
+    'trustarc': {'globals': ['truste'], 'elements': ['#truste-consent-track'], 'accept': ['#truste-consent-button']},
+    'cookieyes': {'globals': [], 'elements': ['.cky-consent-container'], 'accept': ['.cky-btn-accept']},
+    'complianz': {'globals': [], 'elements': ['#cmplz-cookiebanner-container'], 'accept': ['.cmplz-btn.cmplz-accept']},
+    'osano': {'globals': ['Osano'], 'elements': ['.osano-cm-window'], 'accept': ['.osano-cm-accept-all']},
+    'cookiefirst': {'globals': ['CookieFirst'], 'elements': ['.cookiefirst-root'],
+                    'accept': ['[data-cookiefirst-action="accept"]']},
+    'iubenda': {'globals': ['_iub'], 'elements': ['#iubenda-cs-banner'], 'accept': ['.iubenda-cs-accept-btn']},
+    'borlabs': {'globals': ['BorlabsCookie'], 'elements': ['#BorlabsCookieBox'], 'accept': ['._brlbs-btn-accept-all']},
+    'cookienotice': {'globals': [], 'elements': ['#cookie-notice'], 'accept': ['#cn-accept-cookie']},
+    'tcf': {'globals': ['__tcfapi'], 'elements': [], 'accept': []},
+}
+
+# Looks for a visible accept button and clicks it, in a single round-trip to the browser. Tries the selector learned
+# for the domain first, then the buttons of the known consent managers, then every XPath. Returns what was clicked, or
+# which consent managers are on the page, if nothing was.
+DETECT_SCRIPT = """
+const [learned, cmps, xpaths] = arguments;
+const visible = (element) => {
+    if (!element) return false;
+    const rect = element.getBoundingClientRect();
+    const style = window.getComputedStyle(element);
+    return rect.width > 0 && rect.height > 0 && style.visibility !== 'hidden' && style.display !== 'none';
+};
+const roots = [document];
+const present = [];
+for (const [name, cmp] of Object.entries(cmps)) {
+    const hosts = cmp.elements.map((selector) => document.querySelector(selector)).filter(Boolean);
+    if (hosts.length || cmp.globals.some((global) => window[global] !== undefined)) present.push(name);
+    for (const host of hosts) if (host.shadowRoot) roots.push(host.shadowRoot);
+}
+const byCss = (selector) => {
+    for (const root of roots) {
+        const element = Array.from(root.querySelectorAll(selector)).find(visible);
+        if (element) return element;
+    }
+    return null;
+};
+const byXpath = (xpath) => {
+    const nodes = document.evaluate(xpath, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+    for (let index = 0; index < nodes.snapshotLength; index++) {
+        if (visible(nodes.snapshotItem(index))) return nodes.snapshotItem(index);
+    }
+    return null;
+};
+const click = (element, kind, selector, cmp) => {
+    element.click();
+    return {clicked: true, kind: kind, selector: selector, cmp: cmp, present: present};
+};
+if (learned) {
+    const element = learned.kind === 'css' ? byCss(learned.selector) : byXpath(learned.selector);
+    if (element) return click(element, learned.kind, learned.selector, learned.cmp);
+}
+for (const [name, cmp] of Object.entries(cmps)) {
+    for (const selector of cmp.accept) {
+        const element = byCss(selector);
+        if (element) return click(element, 'css', selector, name);
+    }
+}
+for (const xpath of xpaths) {
+    try {
+        const element = byXpath(xpath);
+        if (element) return click(element, 'xpath', xpath, null);
+    } catch (error) {}
+}
+return {clicked: false, present: present};
+"""
+
+
+def cookie_domain(url: str) -> str:
+    """ The domain selectors are remembered under, e.g. 'example.com' for 'https://www.example.com/shop'."""
+    host = (urlsplit(url).hostname or '').lower()
+    return host[4:] if host.startswith('www.') else host
+
+
+class SelectorCache:
+    """
+    The selector that accepted the cookies on each domain, kept in memory and in a JSON file, so that the next scrape
+    of the domain tries it first. The file is read on first use, and rewritten whenever a selector is learned. Beyond
+    'max_entries' domains, the ones learned longest ago are dropped.
+    """
+
+    def __init__(self, path: str, max_entries: int = 5000):
+        self.path = path
+        self.max_entries = max_entries
+        self._selectors = None
+
+    def load(self) -> dict:
+        if self._selectors is None:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as file:
+                    self._selectors = json.load(file)
+            except FileNotFoundError:
+                self._selectors = {}
+            except (OSError, ValueError) as e:
+                logger.warning(f"Could not read the cookie selector cache at {self.path}, starting empty: {e}")
+                self._selectors = {}
+        return self._selectors
+
+    def get(self, domain: str) -> Optional[dict]:
+        return self.load().get(domain)
+
+    def remember(self, domain: str, kind: str, selector: str, cmp: Optional[str]) -> None:
+        selectors = self.load()
+        entry = {'kind': kind, 'selector': selector, 'cmp': cmp}
+        if selectors.get(domain) == entry:
+            return
+        selectors.pop(domain, None)                                         # Most recently learned last.
+        selectors[domain] = entry
+        while len(selectors) > self.max_entries:
+            del selectors[next(iter(selectors))]
+        self._save()
+
+    def forget(self, domain: str) -> None:
+        if self.load().pop(domain, None) is not None:
+            self._save()
+
+    def __len__(self) -> int:
+        return len(self.load())
+
+    def _save(self) -> None:
+        # Written to a temporary file first, so a crash never leaves a half written cache behind.
+        try:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=directory, delete=False) as file:
+                json.dump(self._selectors, file)
+            os.replace(file.name, self.path)
+        except OSError as e:
+            logger.warning(f"Could not write the cookie selector cache at {self.path}: {e}")
+
+
+# Shared by every scrape in the container.
+selector_cache = SelectorCache(COOKIE_SELECTOR_CACHE, COOKIE_SELECTOR_CACHE_MAX_ENTRIES)
+
 
 class Cookie:
     """
-    Class for identifying cookie buttons and clicking on them. Searches for the buttons, by going through a list of
-    possible XPATHs, which are saved in utils/keywords. Once a matching path has been found,
-    the browser navigates to the button and clicks it.
+    Class for identifying cookie buttons and clicking on them. A single script, run in the browser, looks for the
+    accept button of a known consent management platform, or for any of the possible XPATHs, which are saved in
+    utils/xpaths.txt, and clicks the first visible match.
 
     Please note that if no XPATH on the list matches the path on a specific file, then it has to be manually added to
     the file, containing saids paths.
 
-    If no match is found, we wait 3 seconds and then proceed to scrape.
+    Pages without a consent management platform are done after that one look. If one is on the page, but its banner
+    hasn't shown up yet, we look again every COOKIE_POLL_SECONDS, for at most COOKIE_WAIT_SECONDS. The selector that
+    worked is remembered for the domain, and tried first on its next scrape.
+
     The idea is to avoid scraping cookie-related policy text, if possible. If any text DOES manage to be scraped,
     then we have fault tolerance for this, but is still best to increase speed of scraping and exclude unwanted text.
     """
-    def __init__(self, driver):
+    def __init__(self, driver, url: str = ''):
         self.pop_up_found = None    # Flag to indicate if a cookie pop-up was found.
         self.pop_up_clicked = None  # Flag to indicate if a cookie pop-up was successfully clicked.
         self.driver = driver
+        self.domain = cookie_domain(url)
+        self.xpaths = XPATHS
+
+        self.outcome = None         # 'clicked', 'none' (no consent manager or button) or 'timeout'.
+        self.source = None          # What found the button: 'learned', 'cmp' or 'xpath'.
+        self.cmp = None             # Name of the consent manager, if it's a known one.
+        self.polls = 0              # Round-trips to the browser.
+        self.seconds = 0.0          # Time spent on cookies.
 
-        # Read the XPath selectors from a file.
-        with open('utils/xpaths.txt', 'r') as file:
-            self.xpaths = file.read().splitlines()
+    def click_accept_cookies(self) -> bool:
+        flag1 = time.perf_counter()
+        learned = selector_cache.get(self.domain)
+        try:
+            while True:
+                result = self.driver.execute_script(DETECT_SCRIPT, learned, KNOWN_CMPS, self.xpaths)
+                self.polls += 1
+                if result['clicked']:
+                    return self._clicked(result, learned)
 
-    def click_accept_cookies(self):
+                # Only wait for a banner that is on its way: a consent manager is loaded, or the domain had one before.
+                waiting = bool(result['present']) or learned is not None
+                if not waiting or time.perf_counter() - flag1 + COOKIE_POLL_SECONDS > COOKIE_WAIT_SECONDS:
+                    return self._not_clicked(result, learned, waiting)
+                time.sleep(COOKIE_POLL_SECONDS)
+        finally:
+            self.seconds = time.perf_counter() - flag1
 
-        # Join the selectors with ' | ' to create the final XPath expression.
-        xpath_selectors = ' | '.join(self.xpaths)
+    def _clicked(self, result: dict, learned: Optional[dict]) -> bool:
+        self.pop_up_found = True    # Raise flag if pop-up was found.
+        self.pop_up_clicked = True  # Raise flag if pop-up was clicked.
+        self.outcome, self.cmp = 'clicked', result['cmp']
+        if learned is not None and learned['selector'] == result['selector']:
+            self.source = 'learned'
+        else:
+            self.source = 'cmp' if result['cmp'] else 'xpath'
+            selector_cache.remember(self.domain, result['kind'], result['selector'], result['cmp'])
+        logger.info(f"Cookie pop-up was successfully clicked, with the {self.source} selector {result['selector']}.")
+        return True
 
-        try:
-            # Wait for any of the elements to be visible and get the first one available.
-            cookie_button = WebDriverWait(self.driver, 3).until(
-                ec.visibility_of_any_elements_located((By.XPATH, xpath_selectors))
-            )[0]
-            self.pop_up_found = True    # Raise flag if pop-up was found.
-            self.driver.execute_script("arguments[0].click();", cookie_button)
-            self.pop_up_clicked = True  # Raise flag if pop-up was clicked.
-            logger.info("Cookie pop-up was successfully clicked.")
-            return True
-        except TimeoutException:
-            # If no element is found, assume no pop-up.
+    def _not_clicked(self, result: dict, learned: Optional[dict], waited: bool) -> bool:
+        self.pop_up_found = False
+        self.outcome = 'timeout' if waited else 'none'
+        if result['present']:
+            self.cmp = result['present'][0]
+        if learned is not None:
+            selector_cache.forget(self.domain)  # The site has changed, or doesn't show a banner to us anymore.
+        if waited:
+            logger.info(f"No cookie pop-up showed up within {COOKIE_WAIT_SECONDS:g} seconds, "
+                        f"consent managers on the page: {result['present']}.")
+        else:
             logger.info("No cookie pop-up was found.")
-            return False
+        return False
+
+    def stats(self) -> dict:
+        return {'outcome': self.outcome, 'source': self.source, 'cmp': self.cmp, 'polls': self.polls,
+                'seconds': round(self.seconds, 3)}
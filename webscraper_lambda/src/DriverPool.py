@@ -0,0 +1,234 @@
+import os
+import time
+import shutil
+import logging
+
+from typing import Optional
+from tempfile import mkdtemp
+from urllib.parse import urlsplit
+
+logger = logging.getLogger()
+logger.setLevel("INFO")
+
+
+def process_tree_rss_mb(root_pid: int) -> float:
+    """
+    Sums the resident memory of a process and all of its descendants, by walking /proc. Used to measure Chrome, which
+    runs as children of chromedriver. Returns 0 where /proc is unavailable.
+    """
+    children = {}
+    rss_kb = {}
+    try:
+        for entry in os.listdir('/proc'):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f'/proc/{entry}/status', 'r') as file:
+                    status = file.read()
+            except OSError:
+                continue    # The process exited while we were looking.
+            fields = dict(line.split(':', 1) for line in status.splitlines() if ':' in line)
+            pid, ppid = int(entry), int(fields.get('PPid', '0').strip())
+            children.setdefault(ppid, []).append(pid)
+            rss_kb[pid] = int(fields.get('VmRSS', '0 kB').split()[0])
+    except OSError:
+        return 0.0
+
+    total, stack = 0, [root_pid]
+    while stack:
+        pid = stack.pop()
+        total += rss_kb.get(pid, 0)
+        stack.extend(children.get(pid, []))
+    return total / 1024
+
+
+def directory_size_mb(path: str) -> float:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total / (1024 * 1024)
+
+
+def origin_of(url: str) -> Optional[str]:
+    """ The origin of a URL, e.g. 'https://www.example.com', or None if it has none (about:blank, data: etc.)."""
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.netloc:
+        return None
+    return f"{parts.scheme}://{parts.netloc.lower()}"
+
+
+class PooledDriver:
+    """
+    A Chrome driver owned by the DriverPool, along with the temporary directories it was launched with.
+    """
+    def __init__(self, driver, temp_dirs: list):
+        self.driver = driver
+        self.temp_dirs = temp_dirs
+        self.pages_served = 0
+        self.created_at = time.time()
+        self.requested_url = None       # The page the scraper asked for last, set before loading it.
+
+    def rss_mb(self) -> float:
+        service_process = getattr(self.driver.service, 'process', None)
+        return process_tree_rss_mb(service_process.pid) if service_process else 0.0
+
+    def tmp_mb(self) -> float:
+        return sum(directory_size_mb(path) for path in self.temp_dirs)
+
+
+class DriverPool:
+    """
+    Keeps a launched Chrome driver alive between warm Lambda invocations, instead of launching a new browser for every
+    page. Between pages the driver is reset (cookies, storage and extra tabs are cleared), and it is recycled after
+    serving max_pages pages, or once its memory or temporary files grow past their limits.
+
+    Storage can only be cleared per origin, for the origins we know the page used: that of the page and those of its
+    frames. A page that ended up on another origin than the one requested may have passed through origins we can't
+    see, e.g. with client-side redirects, so its driver is recycled rather than reset.
+
+    Lambda only runs one invocation per container at a time, so a single idle driver is kept.
+    """
+    def __init__(self, max_pages: int = 20, max_rss_mb: float = 1200, max_tmp_mb: float = 300):
+        self.max_pages = max_pages
+        self.max_rss_mb = max_rss_mb
+        self.max_tmp_mb = max_tmp_mb
+        self.idle = None
+        self.launches = 0
+        self.reuses = 0
+        self.origin_changes = 0
+
+    @classmethod
+    def from_env(cls) -> 'DriverPool':
+        return cls(max_pages=int(os.environ.get('DRIVER_MAX_PAGES', 20)),
+                   max_rss_mb=float(os.environ.get('DRIVER_MAX_RSS_MB', 1200)),
+                   max_tmp_mb=float(os.environ.get('DRIVER_MAX_TMP_MB', 300)))
+
+    def acquire(self) -> tuple[PooledDriver, bool]:
+        """ Returns a ready driver, and whether it was warm (reused) or had to be launched."""
+        if self.idle is not None:
+            pooled, self.idle = self.idle, None
+            self.reuses += 1
+            return pooled, True
+        return self._launch(), False
+
+    def release(self, pooled: PooledDriver, healthy: bool = True) -> None:
+        """ Hands a driver back to the pool. Broken or worn out drivers are quit and their directories removed."""
+        pooled.pages_served += 1
+        if not healthy or self._origin_changed(pooled) or not self._reset(pooled) or self._should_recycle(pooled):
+            self._destroy(pooled)
+            return
+        if self.idle is not None:
+            self._destroy(self.idle)
+        self.idle = pooled
+
+    def stats(self) -> dict:
+        return {'launches': self.launches, 'reuses': self.reuses, 'origin_changes': self.origin_changes,
+                'idle_pages_served': self.idle.pages_served if self.idle else 0}
+
+    def _launch(self) -> PooledDriver:
+        from selenium import webdriver      # Imported on first launch, so scrapes on the static path never load it.
+
+        options = webdriver.ChromeOptions()
+        service = webdriver.ChromeService('/opt/chromedriver')
+        temp_dirs = [mkdtemp(), mkdtemp(), mkdtemp()]
+
+        options.binary_location = '/opt/chrome/chrome'                      # Define path for chrome binaries.
+        options.add_argument('--disable-javascript')                        # Disabling Javascript.
+        options.add_argument('--disable-extensions')                        # Disabling extenisons.
+        options.add_argument('--single-process')                            # Make chrome run on single a process.
+        options.add_argument('--disable-dev-shm-usage')                     # Disabling shm partition.
+        options.add_argument('--disable-dev-tools')                         # Disabling development tools.
+        options.add_argument('--no-zygote')                                 # Disabling Zygote, so no zombie processes.
+        options.add_argument('--no-sandbox')                                # Disabling sandbox.
+        options.add_argument('--disable-gpu')                               # Disabling GPU.
+        options.add_argument('--log-level=3')                               # Define log-level.
+        options.add_argument(f'user-data-dir={temp_dirs[0]}')               # Define user-data to tmp folder.
+        options.add_argument(f'--data-path={temp_dirs[1]}')                 # Define data-path to tmp folder.
+        options.add_argument(f'--disk-cache-dir={temp_dirs[2]}')            # Define disk cache to tmp folder.
+        options.page_load_strategy = 'normal'                               # Define loading strategy.
+        options.add_argument('--headless=new')                              # Enabling headless mode.
+
+        flag1 = time.perf_counter()
+        try:
+            driver = webdriver.Chrome(options=options, service=service)     # Instantiating driver.
+        except Exception:
+            self._remove_dirs(temp_dirs)
+            raise
+        self.launches += 1
+        logger.info(f"Launched new Chrome driver in {time.perf_counter() - flag1:.2f} seconds.")
+        return PooledDriver(driver, temp_dirs)
+
+    def _origin_changed(self, pooled: PooledDriver) -> bool:
+        try:
+            current_url = pooled.driver.current_url
+        except Exception:
+            return False        # Left to _reset, which finds out the driver is broken.
+        if pooled.requested_url is None or origin_of(current_url) in (None, origin_of(pooled.requested_url)):
+            return False
+        self.origin_changes += 1
+        logger.info(f"Recycling Chrome driver, the page moved from {origin_of(pooled.requested_url)} to "
+                    f"{origin_of(current_url)}.")
+        return True
+
+    @staticmethod
+    def _reset(pooled: PooledDriver) -> bool:
+        """ Clears all state left behind by the previous page. Returns False if the driver is no longer usable."""
+        driver = pooled.driver
+        try:
+            # Close any tabs or pop-up windows the page opened, and go back to the first one.
+            handles = driver.window_handles
+            for handle in handles[1:]:
+                driver.switch_to.window(handle)
+                driver.close()
+            driver.switch_to.window(handles[0])
+
+            # Local storage, IndexedDB, service workers etc. of the page and of every frame in it.
+            origins = {origin_of(driver.current_url)}
+            frames = [driver.execute_cdp_cmd('Page.getFrameTree', {})['frameTree']]
+            while frames:
+                frame = frames.pop()
+                origins.add(origin_of(frame['frame'].get('securityOrigin', '')))
+                frames.extend(frame.get('childFrames', []))
+            for origin in sorted(origin for origin in origins if origin is not None):
+                driver.execute_cdp_cmd('Storage.clearDataForOrigin', {'origin': origin, 'storageTypes': 'all'})
+            pooled.requested_url = None
+            driver.execute_cdp_cmd('Network.clearBrowserCookies', {})
+            driver.get('about:blank')
+            return True
+        except Exception as e:
+            logger.info(f"Could not reset Chrome driver, recycling it: {e}")
+            return False
+
+    def _should_recycle(self, pooled: PooledDriver) -> bool:
+        if pooled.pages_served >= self.max_pages:
+            logger.info(f"Recycling Chrome driver after {pooled.pages_served} pages.")
+            return True
+        rss_mb = pooled.rss_mb()
+        if rss_mb > self.max_rss_mb:
+            logger.info(f"Recycling Chrome driver, memory usage is {rss_mb:.0f} MB.")
+            return True
+        tmp_mb = pooled.tmp_mb()
+        if tmp_mb > self.max_tmp_mb:
+            logger.info(f"Recycling Chrome driver, temporary files use {tmp_mb:.0f} MB.")
+            return True
+        return False
+
+    def _destroy(self, pooled: PooledDriver) -> None:
+        try:
+            pooled.driver.quit()
+        except Exception as e:
+            logger.info(f"Error when quitting Chrome driver: {e}")
+        self._remove_dirs(pooled.temp_dirs)
+
+    @staticmethod
+    def _remove_dirs(paths: list) -> None:
+        for path in paths:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+# Module level, so the driver survives between warm invocations of the Lambda function.
+driver_pool = DriverPool.from_env()
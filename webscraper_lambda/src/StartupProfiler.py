@@ -0,0 +1,135 @@
+"""
+Startup profiling, enabled with STARTUP_PROFILE=1. Reports where the time of a cold start goes: how long every module
+took to import, how long each init step took, and how long after the start of the process the first request was
+served. Import this module before anything else, so it sees the other imports.
+
+Kept free of imports from the rest of the code base, so the same file can be used by the API and the WebScraper.
+"""
+import os
+import sys
+import time
+import logging
+
+from contextlib import contextmanager
+from importlib.abc import MetaPathFinder
+
+PROFILE = os.environ.get('STARTUP_PROFILE', '').lower() in ('1', 'true', 'yes')
+# Imports listed in the report, slowest first by their own time.
+PROFILE_TOP_IMPORTS = int(os.environ.get('STARTUP_PROFILE_TOP', 25))
+
+_started = time.perf_counter()
+
+
+class ImportTimer(MetaPathFinder):
+    """
+    Times every module executed while installed. Finds modules with the finders after it on sys.meta_path, and wraps
+    their loaders, so both the cumulative time of an import and its own time (without its imports) are known.
+    """
+
+    def __init__(self):
+        self.imports = {}           # Module name -> [cumulative seconds, own seconds].
+        self.roots = []             # Modules imported by our own code, rather than by another import.
+        self._stack = []            # Time spent in nested imports, per import in progress.
+
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is None:
+                continue
+            if spec.loader is not None and hasattr(spec.loader, 'exec_module'):
+                spec.loader = _TimedLoader(spec.loader, self)
+            return spec
+        return None
+
+    def timed_exec(self, loader, module) -> None:
+        self._stack.append(0.0)
+        flag1 = time.perf_counter()
+        try:
+            loader.exec_module(module)
+        finally:
+            seconds = time.perf_counter() - flag1
+            nested = self._stack.pop()
+            if self._stack:
+                self._stack[-1] += seconds
+            else:
+                self.roots.append(module.__name__)
+            self.imports[module.__name__] = [seconds, seconds - nested]
+            # Hand the module its real loader, for anything that checks its type.
+            module.__loader__ = loader
+            if getattr(module, '__spec__', None) is not None:
+                module.__spec__.loader = loader
+
+
+class _TimedLoader:
+    def __init__(self, loader, timer: ImportTimer):
+        self._loader = loader
+        self._timer = timer
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec) if hasattr(self._loader, 'create_module') else None
+
+    def exec_module(self, module) -> None:
+        self._timer.timed_exec(self._loader, module)
+
+
+_timer = ImportTimer()
+_steps = {}
+_ready_at = None
+_ready_imports = set()
+_first_request_at = None
+
+if PROFILE:
+    sys.meta_path.insert(0, _timer)
+
+
+@contextmanager
+def step(name: str):
+    """ Times an init step, e.g. creating a client. Does nothing unless profiling."""
+    if not PROFILE:
+        yield
+        return
+    flag1 = time.perf_counter()
+    try:
+        yield
+    finally:
+        _steps[name] = time.perf_counter() - flag1
+
+
+def report() -> dict:
+    imports = sorted(_timer.imports.items(), key=lambda item: item[1][1], reverse=True)
+    return {
+        "import_seconds": round(sum(_timer.imports[name][0] for name in _timer.roots), 4),
+        "imports": {name: {"cumulative": round(cumulative, 4), "self": round(own, 4)}
+                    for name, (cumulative, own) in imports[:PROFILE_TOP_IMPORTS]},
+        "steps": {name: round(seconds, 4) for name, seconds in _steps.items()},
+        "ready_seconds": round(_ready_at - _started, 4) if _ready_at else None,
+        "first_request_seconds": round(_first_request_at - _started, 4) if _first_request_at else None,
+    }
+
+
+def ready(logger: logging.Logger) -> None:
+    """ Marks the end of the init phase, and logs the report so far."""
+    global _ready_at, _ready_imports
+    if not PROFILE or _ready_at is not None:
+        return
+    _ready_at = time.perf_counter()
+    _ready_imports = set(_timer.roots)
+    logger.info(f"Startup profile: {report()}")
+
+
+def first_request(logger: logging.Logger) -> None:
+    """ Marks the first request as served, and logs how long after the start of the process that was, along with the
+    modules that were left to be imported lazily by the request."""
+    global _first_request_at
+    if not PROFILE or _first_request_at is not None:
+        return
+    _first_request_at = time.perf_counter()
+    sys.meta_path.remove(_timer)
+    lazy = {name: round(_timer.imports[name][0], 4) for name in _timer.roots if name not in _ready_imports}
+    logger.info(f"First request served {_first_request_at - _started:.3f} seconds after start, ready after "
+                f"{(_ready_at or _first_request_at) - _started:.3f} seconds. Imported by the request: {lazy}")
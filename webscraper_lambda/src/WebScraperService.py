@@ -1,21 +1,57 @@
-import re
+import os
 import logging
 import time
 
-from bs4 import BeautifulSoup
-from selenium import webdriver
-from selenium.webdriver import Remote, ChromeOptions
-from selenium.webdriver.chromium.remote_connection import ChromiumRemoteConnection
-from tempfile import mkdtemp
-
+from typing import Union
 from starlette.exceptions import HTTPException
 
-from CookieClicker import Cookie
+from ContentExtractor import extract_content, decode_html
+from ContentFilter import ContentFilter
+from DriverPool import driver_pool
+from tracing import SpanRecorder, NO_TRACE
 
 # Setting up logging.
 logger = logging.getLogger()
 logger.setLevel("INFO")
 
+# Only the start of the page content is logged, and only at DEBUG.
+LOG_MAX_CHARS = int(os.environ.get('LOG_MAX_CHARS', 2000))
+
+# Read the keywords once per container, rather than once per scrape, and precompile the boilerplate filter.
+CONTENT_FILTER = ContentFilter.from_file('utils/keywords.txt')
+
+# Upper limit on the characters of paragraph text extracted from a single page.
+EXTRACT_MAX_CHARS = int(os.environ.get('EXTRACT_MAX_CHARS', 50000))
+
+# Messages that show up, when a website rejects our request but still responds with a statuscode of 200.
+REQUEST_REJECT = ['request rejected', 'just a moment...', 'access denied', 'et øjeblik']
+
+
+def parse_page(html: Union[str, bytes], charset: str = None) -> tuple[str, str, dict]:
+    """
+    Extracts the title and the text of all paragraphs from an HTML document, in a single pass. Whitespace is
+    normalized, duplicate and boilerplate paragraphs (cookie notices, privacy policies, menus, footers etc.) are left
+    out, and the text is capped at EXTRACT_MAX_CHARS characters.
+
+    :param html: The page source, either as a string or as raw bytes.
+    :param charset: Charset declared by the server. Only used for raw bytes, when absent the page's own is used.
+    :return: Title and text of the page, with one paragraph per line, and the characters removed by reason.
+    """
+    if isinstance(html, bytes):
+        html = decode_html(html, charset)
+
+    extractor = extract_content(html, CONTENT_FILTER, EXTRACT_MAX_CHARS)
+    if extractor.truncated:
+        logger.info(f"Page text was capped at {EXTRACT_MAX_CHARS} characters.")
+    logger.info(f"Filtered out {sum(extractor.removed_chars.values())} characters: {extractor.removed_chars}")
+    return extractor.title, extractor.page_text(), extractor.removed_chars
+
+
+def is_rejected(title: str, page_text: str) -> bool:
+    """ Checks whether the scraped page is actually an error message from the website, blocking our request."""
+    text = title.lower() + ' ' + page_text.lower()
+    return any(error_message in text for error_message in REQUEST_REJECT)
+
 
 # TODO: Cost monitoring is not functioning, ask Bright Data to elaborate on how to monitor costs.
 #  Docs: https://docs.brightdata.com/general/usage-monitoring/bandwidth#how-to-get-bandwidth-and-total-cost-for-a-zone
@@ -29,35 +65,37 @@ def monitor_bandwith_and_costs() -> None:
 class WebScraper:
     """
     Class for handling web driver and scraping text from a given URL.
+    Local drivers are borrowed from the DriverPool, and handed back once the page has been scraped.
+    Driver start, page load, cookie click and parsing are recorded as spans, when the request is traced.
     """
-    def __init__(self, proxy: bool, monitor: bool, url: str):
+    def __init__(self, proxy: bool, monitor: bool, url: str, recorder: SpanRecorder = NO_TRACE):
 
         self.use_proxy = proxy
         self.monitor_bandwith_an_costs = monitor
         self.url = url
+        self.pooled = None                                                  # Set when the driver is from the pool.
+        self.warm = False                                                   # True if the driver was reused.
+        self.rss_mb = 0.0                                                   # Browser memory after the scrape.
+        self.recorder = recorder
 
-        options = webdriver.ChromeOptions()
-        service = webdriver.ChromeService('/opt/chromedriver')
-
-        options.binary_location = '/opt/chrome/chrome'                      # Define path for chrome binaries.
-        options.add_argument('--disable-javascript')                        # Disabling Javascript.
-        options.add_argument('--disable-extensions')                        # Disabling extenisons.
-        options.add_argument('--single-process')                            # Make chrome run on single a process.
-        options.add_argument('--disable-dev-shm-usage')                     # Disabling shm partition.
-        options.add_argument('--disable-dev-tools')                         # Disabling development tools.
-        options.add_argument('--no-zygote')                                 # Disabling Zygote, so no zombie processes.
-        options.add_argument('--no-sandbox')                                # Disabling sandbox.
-        options.add_argument('--disable-gpu')                               # Disabling GPU.
-        options.add_argument('--log-level=3')                               # Define log-level.
-        options.add_argument(f'user-data-dir={mkdtemp()}')                  # Define user-data to tmp folder.
-        options.add_argument(f'--data-path={mkdtemp()}')                    # Define data-path to tmp folder.
-        options.add_argument(f'--disk-cache-dir={mkdtemp()}')               # Define disk cache to tmp folder.
-        options.page_load_strategy = 'normal'                               # Define loading strategy.
-        options.add_argument('--headless=new')                              # Enabling headless mode.
+        with recorder.span('driver_start', proxy=self.use_proxy) as span:
+            self._start_driver()
+            span['warm'] = self.warm
 
+        from CookieClicker import Cookie                                    # Only needed for browsers.
+        self.cookie = Cookie(self.driver, url)                              # Instantiating CookieClicker. Delicious!
+
+        self.content_filter = CONTENT_FILTER
+        self.removed_chars = {}                                             # Boilerplate filtered out, by reason.
+
+    def _start_driver(self) -> None:
         if self.use_proxy:
             logger.info("Proxy is enabled! Browsing with Bright Data's proxies.")
+            from selenium import webdriver
+            from selenium.webdriver import Remote, ChromeOptions
+            from selenium.webdriver.chromium.remote_connection import ChromiumRemoteConnection
 
+            options = webdriver.ChromeOptions()
             auth = 'brd-customer-hl_9d0fdce4-zone-scraping_browser1:ro3wfgi2a2fg'
             sbr_webdriver = f'https://{auth}@brd.superproxy.io:9515'
             sbr_connection = ChromiumRemoteConnection(sbr_webdriver, 'goog', 'chrome')
@@ -67,12 +105,17 @@ class WebScraper:
             self.driver = Remote(sbr_connection, options=ChromeOptions())
         else:
             logger.info("Proxy is disabled. Proceeding without proxies.")
-            self.driver = webdriver.Chrome(options=options, service=service)  # Instantiating driver.
-
-        self.cookie = Cookie(self.driver)                                   # Instantiating CookieClicker. Delicious!
-
-        with open('utils/keywords.txt', 'r') as file:
-            self.keywords = file.read().splitlines()
+            self.pooled, self.warm = driver_pool.acquire()                  # Borrow a warm driver, if any.
+            self.driver = self.pooled.driver
+
+    def close(self, healthy: bool = True) -> None:
+        """ Hands a pooled driver back to the pool, or quits the remote proxy driver."""
+        if self.pooled is not None:
+            self.rss_mb = self.pooled.rss_mb()
+            driver_pool.release(self.pooled, healthy)
+            self.pooled = None
+        else:
+            self.driver.quit()
 
     def extract_text(self) -> str:
         """
@@ -80,66 +123,61 @@ class WebScraper:
         :return: Title and text of the page.
         """
 
-        self.driver.get(self.url)
+        try:
+            return self._extract_text()
+        except Exception:
+            if self.pooled is not None:
+                self.close(healthy=False)   # Never hand a driver in an unknown state back to the pool.
+            raise
+
+    def _extract_text(self) -> str:
+        if self.pooled is not None:
+            self.pooled.requested_url = self.url                            # Tells the pool where the page went.
+        with self.recorder.span('page_load'):
+            self.driver.get(self.url)
 
         flag1 = time.perf_counter()
 
         logger.info("Established connection to " + self.url)
 
-        # Wait for the page to load.
-        self.driver.implicitly_wait(5)
-
-        # Click on cookie pop-up, if any is present. Returns False if no cookie pop-ups is found. True otherwise.
-        self.cookie.click_accept_cookies()
+        # The page has loaded once get() returns. Click on cookie pop-up, if any is present. Returns False if no cookie
+        # pop-ups is found. True otherwise.
+        with self.recorder.span('cookie_click') as span:
+            span['clicked'] = bool(self.cookie.click_accept_cookies())
+            span.update(self.cookie.stats())
 
         logger.info("Cookies done, brewing soup.")
-        soup = BeautifulSoup(self.driver.page_source, "html.parser")  # mmmmm... good soup.
-
-        # Regex pattern. Iterate over keywords and escape any matches.
-        keywords_pattern = re.compile('|'.join(map(re.escape, self.keywords)), re.IGNORECASE)
-
-        # Load all 'p' tags into 'items' variable.
-        items = soup.find_all('p')
-        title = soup.title.get_text()
-
-        # Variable that will contain the text reveleant text from our page.
-        page_text = ""
-
-        # TODO: Filter out any cases of too many whitespaces or formatting keys, such as \t or \n.
-        #  Appears when scraping e.g https://podimo.com/dk and https://www.telenor.dk
-        # Filter out any cookie related text and save it to page_text
-        for item in items:
-            item_text = item.get_text()
-            if not keywords_pattern.search(item_text):  # Check if the paragraph does not contain any of the keywords.
-                page_text += f" {item_text}"            # Append text to saved text.
-
-        request_reject = ['request rejected', 'just a moment...', 'access denied', 'et øjeblik']
-
-        logger.info(f"Page content is: {title + page_text}")
+        with self.recorder.span('parse', path='browser'):
+            title, page_text, self.removed_chars = parse_page(self.driver.page_source)
 
         logger.info("Checking for any access issues.")
 
         """Sometimes, the website will reject our request, but still send a statuscode of 200. So we end up scraping
         a page with an error message. We check for these messages and retry with a proxy if any are found."""
-        if any(error_message in title.lower() + ' ' + page_text.lower() for error_message in request_reject):
+        if is_rejected(title, page_text):
             if not self.use_proxy:
                 logger.info("Scraping was rejected. Retrying with proxy.")
                 self.use_proxy = True
-                self.driver.quit()
-                return WebScraper(proxy=True, url=self.url, monitor=False).extract_text()
+                self.close()
+                retry = WebScraper(proxy=True, url=self.url, monitor=False, recorder=self.recorder)
+                page = retry.extract_text()
+                # Report the page we return, not the rejected one.
+                self.removed_chars, self.cookie = retry.removed_chars, retry.cookie
+                return page
             elif self.use_proxy:
                 logger.info("blyat")
+                self.close()
                 raise HTTPException(403, f"Access to {self.url} is blocked.")
         logger.info("Access granted. Scraping complete.")
 
-        self.driver.quit()
+        self.close()
 
         flag2 = time.perf_counter()
         if self.monitor_bandwith_an_costs:
             monitor_bandwith_and_costs()
 
-        logger.info(f"Page content is: {title + page_text}")
-        logger.info(self.url + f" was scraped in {flag2 - flag1:.2f} seconds.")      # Log performance.
-        logger.debug(title + "\n" + page_text + "\n")
+        logger.info(self.url + f" was scraped in {flag2 - flag1:.2f} seconds, "      # Log performance.
+                    f"{len(title + page_text)} characters of text.")
+        logger.debug(f"Page content is: {(title + page_text)[:LOG_MAX_CHARS]}")
 
         return title + page_text
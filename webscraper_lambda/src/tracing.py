@@ -0,0 +1,48 @@
+import time
+import secrets
+
+from contextlib import contextmanager
+from typing import Optional
+
+
+class SpanRecorder:
+    """
+    Records the spans of one invocation, so they can be returned to the caller in the response. The caller sends
+    its trace context along with the request, and the spans recorded here become children of the caller's span.
+    When the caller's request isn't traced (no context), nothing is recorded.
+    """
+
+    def __init__(self, context: Optional[dict] = None):
+        context = context or {}
+        self.enabled = bool(context.get('sampled'))
+        self.trace_id = context.get('trace_id')
+        self.parent_id = context.get('parent_id')
+        self.spans = []
+        self._stack = []
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        if not self.enabled:
+            yield attributes                # Attributes can still be set, they're just not recorded.
+            return
+
+        span_id = secrets.token_hex(8)
+        parent_id = self._stack[-1] if self._stack else self.parent_id
+        self._stack.append(span_id)
+        status, start, flag1 = 'ok', time.time(), time.perf_counter()
+        try:
+            yield attributes
+        except Exception as e:
+            status = 'error'
+            attributes.setdefault('error', str(e) or type(e).__name__)
+            raise
+        finally:
+            self._stack.pop()
+            end = start + (time.perf_counter() - flag1)
+            self.spans.append({"name": name, "trace_id": self.trace_id, "span_id": span_id, "parent_id": parent_id,
+                               "start": round(start, 6), "end": round(end, 6), "seconds": round(end - start, 6),
+                               "status": status, "attributes": attributes})
+
+
+# Used when a scraper is created without a recorder.
+NO_TRACE = SpanRecorder()
@@ -1,3 +1,7 @@
+import StartupProfiler   # First, so it can time the imports below when STARTUP_PROFILE is set.
+
+import os
+import re
 import logging
 import time
 import json
@@ -9,11 +13,23 @@ from typing import Optional, Any
 from starlette.exceptions import HTTPException
 from typing_extensions import Self
 
-from WebScraperService import WebScraper
+from WebScraperService import WebScraper, parse_page, is_rejected
+from DriverPool import driver_pool
+from tracing import SpanRecorder
 
 logger = logging.getLogger()
 logger.setLevel("INFO")
 
+# Static pages with less text than this are assumed to be rendered client side, and are loaded in Chrome instead.
+STATIC_MIN_CHARS = int(os.environ.get('STATIC_MIN_CHARS', 200))
+
+# True until the first invocation of this container has been handled.
+cold_start = True
+
+# What to prepare in the Lambda init phase, before the first invocation. By default nothing: Selenium is imported, and
+# Chrome launched, by the first scrape that needs a browser. 'imports' imports Selenium, 'driver' also launches Chrome.
+WARM_ON_INIT = os.environ.get('WARM_ON_INIT', '').lower()
+
 """
 It should be said, that the current implementation, completely ignores the robots.txt for any given website.
 Instead, if our initial ping request is blocked, we just use a Bright Data proxy and scrape it anyway.
@@ -30,11 +46,12 @@ This means, that if our ping to <website>/robots.txt doesn't yield any meaningfu
 """
 
 
-# The possible values that our request can contain. URL is obligatory, proxy and monitor are both optional.
+# The possible values that our request can contain. URL is obligatory, proxy, monitor and trace are all optional.
 class Body(BaseModel):
     url: HttpUrl = None
     proxy: Optional[bool] = False
     monitor: Optional[bool] = False
+    trace: Optional[dict] = None    # Trace context of the caller. When present, spans are returned in the response.
 
 
 class Event(Body):
@@ -71,6 +88,8 @@ class Event(Body):
 
 
 def handler(event: dict, context) -> dict:
+    global cold_start
+
     try:
         request = Event.model_validate(event)
     except ValidationError as e:
@@ -81,36 +100,113 @@ def handler(event: dict, context) -> dict:
     body = request.body
     logger.info(f"Request good, body is: {body}")
     url, proxy, monitor = str(body.url), bool(body.proxy), bool(body.monitor)
-
-    if proxy is False:
-        proxy = ping_site(url)
-
-    site_text = WebScraper(proxy, monitor, url).extract_text()
+    recorder = SpanRecorder(body.trace)
+
+    with recorder.span('webscraper.handler', url=url, cold_start=cold_start):
+        cold_start = False
+
+        # Try the fast path first: extract the text straight from the HTML we got when pinging the site.
+        site_text, extraction_path, removed_chars = None, 'browser', {}
+        scraper = None
+        if proxy is False:
+            with recorder.span('ping') as span:
+                proxy, ping = ping_site(url)
+                span['status_code'] = ping.status_code
+            if not proxy:
+                with recorder.span('parse', path='static') as span:
+                    site_text, removed_chars = extract_static(ping)
+                    span['usable'] = site_text is not None
+                if site_text is not None:
+                    extraction_path = 'static'
+
+        # Fall back to Selenium, when the static HTML wasn't good enough.
+        if site_text is None:
+            scraper = WebScraper(proxy, monitor, url, recorder)
+            site_text = scraper.extract_text()
+            removed_chars = scraper.removed_chars
 
     flag2 = time.perf_counter()
     # Calculate performance and return finished campaign and/or message templates.
-    logger.info(f"Entire process was executed in {flag2 - flag1:.2f} seconds.")
+    if scraper is None:
+        logger.info(f"Entire process was executed in {flag2 - flag1:.2f} seconds. Static extraction, no browser.")
+    else:
+        logger.info(f"Entire process was executed in {flag2 - flag1:.2f} seconds. Warm driver: {scraper.warm}, "
+                    f"browser memory: {scraper.rss_mb:.0f} MB, pool: {driver_pool.stats()}, "
+                    f"cookies: {scraper.cookie.stats()}")
 
+    StartupProfiler.first_request(logger)
     return {
         'statusCode': 200,
         "ExecutedVersion": "$LATEST",
         'body': json.dumps({
             'site_text': site_text,
             'proxy_enabled': proxy,
+            'extraction_path': extraction_path,
+            'filtered_chars': sum(removed_chars.values()),
+            'filtered_chars_by_reason': removed_chars,
+            'scrape_seconds': round(flag2 - flag1, 3),
+            'driver_warm': scraper.warm if scraper else False,
+            'driver_rss_mb': round(scraper.rss_mb, 1) if scraper else 0.0,
+            'cookie': scraper.cookie.stats() if scraper else None,
+            'spans': recorder.spans,
         }, ensure_ascii=False,
             indent=2)
     }
 
 
-def ping_site(url) -> bool:
-    """Function for pinging a website to check if it's blocked/exists or not."""
+def ping_site(url) -> tuple[bool, requests.Response]:
+    """Function for pinging a website to check if it's blocked/exists or not.
+    Returns whether a proxy is needed, along with the response, so its HTML can be reused."""
     ping = requests.get(url, timeout=5)
     logger.info(f"Response from request: {ping}")
     if ping.status_code != 200:
         logger.info(f"Request was blocked. Retrying with proxy.")
-        return True
+        return True, ping
     elif ping.status_code in [200, 201, 202]:
         logger.info(f"Request successful. Proceeding without proxy.")
-        return False
+        return False, ping
     else:
         raise HTTPException(status_code=500, detail=f"Error when pinging website: {ping}")
+
+
+def extract_static(ping: requests.Response) -> tuple[Optional[str], dict]:
+    """
+    Fast path, that extracts the title and paragraphs straight from the HTML of the ping response, without starting
+    a browser. Returns None when the result is not usable, i.e. when the response isn't HTML, the text is too short
+    (likely rendered client side) or the page is a rejection message. The caller should then fall back to Selenium.
+    Also returns the characters of boilerplate that were filtered out, by reason.
+    """
+    content_type = ping.headers.get('Content-Type', '')
+    if 'html' not in content_type.lower():
+        logger.info(f"Static extraction skipped, content type is '{content_type}'.")
+        return None, {}
+
+    charset = re.search(r'charset=([\w-]+)', content_type, re.IGNORECASE)
+    title, page_text, removed_chars = parse_page(ping.content, charset.group(1) if charset else None)
+
+    if is_rejected(title, page_text):
+        logger.info("Static page is a rejection message. Falling back to browser.")
+        return None, {}
+    if len(page_text.strip()) < STATIC_MIN_CHARS:
+        logger.info(f"Static page only has {len(page_text.strip())} characters of text. Falling back to browser.")
+        return None, {}
+
+    logger.info("Static extraction succeeded. Skipping browser.")
+    return title + page_text, removed_chars
+
+
+def warm_up() -> None:
+    """ Runs in the init phase, see WARM_ON_INIT."""
+    if WARM_ON_INIT in ('imports', 'driver'):
+        with StartupProfiler.step('import_selenium'):
+            from selenium import webdriver  # noqa: F401
+            import CookieClicker            # noqa: F401. Reads the XPaths, and the selectors learned per domain.
+            CookieClicker.selector_cache.load()
+    if WARM_ON_INIT == 'driver':
+        with StartupProfiler.step('launch_driver'):
+            pooled, _ = driver_pool.acquire()
+            driver_pool.release(pooled)
+
+
+warm_up()
+StartupProfiler.ready(logger)